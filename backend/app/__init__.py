@@ -41,10 +41,9 @@ def create_app(config_name=None):
     app = Flask(__name__)
     
     # Configuração
-    if config_name == 'production':
-        app.config.from_object(config['production'])
-    else:
-        app.config.from_object(config['development'])
+    app.config.from_object(config.get(config_name, config['development']))
+    
+    app.config['APP_CONFIG_NAME'] = config_name
     
     # Sobrescrever configurações com variáveis de ambiente
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', app.config.get('SQLALCHEMY_DATABASE_URI'))
@@ -71,6 +70,26 @@ def create_app(config_name=None):
     bcrypt.init_app(app)
     limiter.init_app(app)
     
+    # Cache de credenciais verificadas (evita bcrypt a cada requisição)
+    from app.auth.middleware import init_auth_cache
+    init_auth_cache(app)
+    
+    # Gravação em lote do último acesso dos usuários
+    from app.auth.last_access import init_last_access
+    init_last_access(app)
+    
+    # Executor de tarefas assíncronas (pool por worker, contexto de aplicação por tarefa)
+    from app.utils.async_tasks import init_async_tasks
+    init_async_tasks(app)
+    
+    # Agendador de tarefas periódicas (limpeza da fila, backup, aquecimento de cache)
+    from app.utils.scheduler import init_scheduler
+    init_scheduler(app)
+    
+    # Métricas internas por worker (GET /api/metrics)
+    from app.utils.metrics import register_metrics_endpoint
+    register_metrics_endpoint(app)
+    
     # Registrar blueprints
     from app.auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/api/auth')
@@ -90,6 +109,12 @@ def create_app(config_name=None):
     from app.relatorios import relatorios as relatorios_blueprint
     app.register_blueprint(relatorios_blueprint, url_prefix='/api/relatorios')
     
+    from app.dashboard import dashboard as dashboard_blueprint
+    app.register_blueprint(dashboard_blueprint, url_prefix='/api/dashboard')
+    
+    from app.autorizacoes_cancelamento import autorizacoes as autorizacoes_blueprint
+    app.register_blueprint(autorizacoes_blueprint, url_prefix='/api/autorizacoes-cancelamento')
+    
     # Handler para erros HTTP
     @app.errorhandler(HTTPException)
     def handle_http_exception(e):
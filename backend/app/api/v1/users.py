@@ -1,7 +1,8 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, g
 from app import db
 from app.models import User
-from app.auth.middleware import auth_required
+from app.auth.middleware import auth_required, clear_user_cache
+from app.auth.tokens import revoke_user_tokens
 from flask_pydantic import validate
 from pydantic import BaseModel, Field, validator, EmailStr
 from typing import Optional
@@ -60,16 +61,24 @@ def api_response(data=None, message=None, status_code=200, errors=None):
 def db_operation(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
+        g.apos_commit = []
         try:
             result = func(*args, **kwargs)
             db.session.commit()
-            return result
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Erro na operação de banco: {str(e)}")
             raise
+        # Ações que só podem ocorrer com os dados já confirmados (ex.: descartar caches)
+        for callback, callback_args in g.pop('apos_commit'):
+            callback(*callback_args)
+        return result
     return wrapper
 
+def apos_commit(callback, *args):
+    """Agenda uma chamada para depois do commit feito por db_operation"""
+    g.apos_commit.append((callback, args))
+
 # Rotas da API
 @api_v1.route('/users', methods=['GET'])
 @auth_required()
@@ -304,6 +313,12 @@ def update_user(id: int, body: UserUpdate):
     # Atualizar campos
     update_data = body.dict(exclude_unset=True)
     
+    # Troca de senha, desativação ou mudança de perfil invalidam tokens já emitidos
+    credenciais_alteradas = 'password' in update_data or any(
+        field in update_data and update_data[field] != getattr(user, field)
+        for field in ('ativo', 'admin')
+    )
+    
     # Tratar senha separadamente
     if 'password' in update_data:
         user.password = update_data.pop('password')
@@ -312,8 +327,15 @@ def update_user(id: int, body: UserUpdate):
     for field, value in update_data.items():
         setattr(user, field, value)
     
+    if credenciais_alteradas:
+        revoke_user_tokens(user)
+    
     # O commit é feito pelo decorador db_operation
     
+    # Descartar credenciais em cache (senha, status ou permissões podem ter mudado) após o
+    # commit: uma recarga concorrente não pode ler os dados antigos
+    apos_commit(clear_user_cache, user.id)
+    
     return api_response(
         data=user.to_dict(),
         message="Usuário atualizado com sucesso"
@@ -353,6 +375,9 @@ def delete_user(id):
     
     # O commit é feito pelo decorador db_operation
     
+    # Sem o usuário, os tokens já emitidos deixam de ser aceitos assim que o snapshot sai do cache
+    apos_commit(clear_user_cache, id)
+    
     return api_response(message="Usuário removido com sucesso")
 
 # Função para registrar o blueprint na aplicação
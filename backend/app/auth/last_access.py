@@ -0,0 +1,152 @@
+"""
+Gravação em lote (write-behind) do último acesso dos usuários
+
+O login apenas registra o horário em memória. Uma thread por worker grava os
+horários pendentes periodicamente com um único UPDATE, e novamente quando o
+worker é encerrado. Logins repetidos do mesmo usuário entre duas gravações são
+coalescidos em uma única linha atualizada.
+"""
+import atexit
+import logging
+import os
+import threading
+from sqlalchemy import case
+from app import db
+from app.models import User
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Limite de usuários por UPDATE (mantém a cláusula CASE/IN em tamanho razoável)
+FLUSH_BATCH_SIZE = 500
+
+
+class LastAccessBuffer:
+    """Buffer de horários de último acesso pendentes de gravação"""
+
+    def __init__(self, interval=30, max_pending=10000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}  # user_id -> datetime
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._app = None
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Associa o buffer à aplicação; a thread é iniciada sob demanda em cada worker"""
+        self._app = app
+        self.interval = app.config.get('LAST_ACCESS_FLUSH_INTERVAL', self.interval)
+        self.max_pending = app.config.get('LAST_ACCESS_MAX_PENDING', self.max_pending)
+        atexit.register(self._flush_at_exit)
+
+    def record(self, user_id, when):
+        """Registra o último acesso de um usuário para gravação posterior"""
+        metrics.increment('ultimo_acesso.registrados')
+        with self._lock:
+            if user_id in self._pending:
+                metrics.increment('ultimo_acesso.coalescidos')
+                if when <= self._pending[user_id]:
+                    return
+            self._pending[user_id] = when
+            pending = len(self._pending)
+
+        if self._app is None or self.interval <= 0:
+            # Sem flusher configurado (ex.: scripts e testes): gravar imediatamente
+            self.flush()
+            return
+
+        self._ensure_started()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Grava todos os horários pendentes
+
+        Deve ser chamado dentro de um contexto de aplicação.
+
+        Returns:
+            int: Quantidade de usuários atualizados
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+
+        items = list(pending.items())
+        try:
+            with db.engine.begin() as connection:
+                for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                    batch = dict(items[start:start + FLUSH_BATCH_SIZE])
+                    connection.execute(
+                        User.__table__.update()
+                        .where(User.__table__.c.id.in_(list(batch)))
+                        .values(ultimo_acesso=case(batch, value=User.__table__.c.id))
+                    )
+        except Exception as e:
+            # Devolver ao buffer sem sobrescrever acessos mais recentes
+            with self._lock:
+                for user_id, when in pending.items():
+                    if user_id not in self._pending or self._pending[user_id] < when:
+                        self._pending[user_id] = when
+            logger.error(f"Erro ao gravar último acesso de {len(pending)} usuário(s): {str(e)}")
+            raise
+
+        metrics.increment('ultimo_acesso.flushes')
+        metrics.increment('ultimo_acesso.gravados', len(items))
+        return len(items)
+
+    def _ensure_started(self):
+        # A thread não sobrevive ao fork dos workers; iniciar uma por processo
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='last-access-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                # Erro já registrado; nova tentativa no próximo intervalo
+                pass
+
+    def _flush_at_exit(self):
+        if self._app is None or not self._pending:
+            return
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception:
+            pass
+
+
+last_access_buffer = LastAccessBuffer()
+
+
+def init_last_access(app):
+    """
+    Configura a gravação em lote do último acesso
+
+    Args:
+        app: Aplicação Flask
+    """
+    last_access_buffer.init_app(app)
+
+
+def record_last_access(user_id, when):
+    """Atalho para last_access_buffer.record"""
+    last_access_buffer.record(user_id, when)
@@ -1,38 +1,190 @@
 from functools import wraps
-from flask import request, jsonify, g
+from collections import OrderedDict
+from flask import request, jsonify, g, current_app
 import base64
+import hashlib
+import hmac
+import threading
+import time
+from app import db
 from app.models import User
+from .tokens import decode_access_token, decode_stream_token, InvalidToken
+from .user_cache import user_cache
 
-def auth_required(admin_required=False):
+
+class CredentialCache:
+    """
+    Cache limitado (LRU + TTL) de credenciais Basic Auth já verificadas
+
+    Evita executar o bcrypt a cada requisição. As entradas são indexadas por um
+    HMAC do header Authorization (nunca pelo texto da senha) e guardam apenas o
+    ID do usuário e o hash de senha vigente no momento da verificação.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # chave -> (user_id, password_hash, expira_em)
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, ttl=None):
+        """Atualiza os limites do cache e descarta as entradas existentes"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        """Retorna (user_id, password_hash) para a chave ou None se ausente/expirada"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            user_id, password_hash, expira_em = entry
+            if expira_em <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id, password_hash
+
+    def set(self, key, user_id, password_hash):
+        """Registra uma credencial verificada com sucesso"""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (user_id, password_hash, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Remove todas as entradas de um usuário"""
+        with self._lock:
+            keys = [k for k, entry in self._entries.items() if entry[0] == user_id]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    def clear(self):
+        """Remove todas as entradas"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Cache de credenciais por processo (cada worker do gunicorn mantém o seu)
+credential_cache = CredentialCache()
+
+
+def init_auth_cache(app):
+    """
+    Configura os caches de credenciais e de usuários a partir da configuração
+
+    Args:
+        app: Aplicação Flask
     """
-    Decorator para autenticação Basic Auth
+    credential_cache.configure(
+        max_size=app.config.get('AUTH_CACHE_MAX_SIZE', 1024),
+        ttl=app.config.get('AUTH_CACHE_TTL', 300)
+    )
+    user_cache.configure(
+        max_size=app.config.get('USER_CACHE_MAX_SIZE', 4096),
+        ttl=app.config.get('USER_CACHE_TTL', 60)
+    )
+
+
+def _credential_key(auth_header):
+    """Gera a chave do cache como HMAC-SHA256 do header, usando a SECRET_KEY"""
+    secret = (current_app.config.get('SECRET_KEY') or '').encode('utf-8')
+    return hmac.new(secret, auth_header.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _authenticate_basic(auth_header, credentials):
+    """
+    Autentica credenciais Basic Auth, consultando o cache antes do bcrypt
+
+    Returns:
+        User autenticado ou None se as credenciais forem inválidas
+    """
+    key = _credential_key(auth_header)
+    cached = credential_cache.get(key)
+
+    if cached:
+        user_id, password_hash = cached
+        user = db.session.get(User, user_id)
+        # Se a senha mudou (inclusive em outro worker), o hash não confere mais
+        if user and user.password_hash == password_hash:
+            return user
+        credential_cache.invalidate_user(user_id)
+
+    # Decodificar credenciais
+    decoded = base64.b64decode(credentials).decode('utf-8')
+    username, password = decoded.split(':', 1)
+
+    # Buscar usuário
+    user = User.query.filter_by(username=username).first()
+
+    if not user or not user.verify_password(password):
+        return None
+
+    credential_cache.set(key, user.id, user.password_hash)
+    return user
+
+
+def auth_required(admin_required=False, allow_stream_token=False):
+    """
+    Decorator para autenticação por token de acesso (Bearer) ou Basic Auth
+    
+    Tokens emitidos no login são validados apenas pelas claims, sem consulta ao
+    banco. Basic Auth continua aceito como alternativa.
     
     Parâmetros:
     - admin_required: Se True, apenas usuários administradores podem acessar
+    - allow_stream_token: Se True, aceita um token de stream (``create_stream_token``)
+      no parâmetro ``stream_token`` da URL quando não há header Authorization
+      (ex.: EventSource, que não permite definir headers)
     """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             auth_header = request.headers.get('Authorization')
+            stream_token = request.args.get('stream_token') if allow_stream_token and not auth_header else None
             
-            if not auth_header:
+            if not auth_header and not stream_token:
                 return jsonify({'message': 'Autenticação necessária'}), 401
             
             try:
-                # Formato esperado: "Basic <credenciais_base64>"
-                auth_type, credentials = auth_header.split(' ', 1)
-                
-                if auth_type.lower() != 'basic':
-                    return jsonify({'message': 'Tipo de autenticação inválido. Use Basic Auth'}), 401
+                # Formatos esperados: "Bearer <token>" ou "Basic <credenciais_base64>"
+                auth_type, credentials = auth_header.split(' ', 1) if auth_header else (None, None)
                 
-                # Decodificar credenciais
-                decoded = base64.b64decode(credentials).decode('utf-8')
-                username, password = decoded.split(':', 1)
+                if stream_token:
+                    try:
+                        user = decode_stream_token(stream_token)
+                    except InvalidToken as e:
+                        return jsonify({'message': str(e)}), 401
+                elif auth_type.lower() == 'bearer':
+                    try:
+                        user = decode_access_token(credentials.strip())
+                    except InvalidToken as e:
+                        return jsonify({'message': str(e)}), 401
+                elif auth_type.lower() == 'basic':
+                    user = _authenticate_basic(auth_header, credentials)
+                else:
+                    return jsonify({'message': 'Tipo de autenticação inválido. Use Bearer ou Basic Auth'}), 401
                 
-                # Buscar usuário
-                user = User.query.filter_by(username=username).first()
-                
-                if not user or not user.verify_password(password):
+                if not user:
                     return jsonify({'message': 'Credenciais inválidas'}), 401
                 
                 if not user.ativo:
@@ -56,9 +208,12 @@ def clear_user_cache(user_id):
     """
     Limpa o cache relacionado a um usuário específico
     
+    Deve ser chamada sempre que os dados, a senha, o status ativo ou as
+    permissões de administrador de um usuário forem alterados, ou quando ele
+    for removido.
+    
     Parâmetros:
     - user_id: ID do usuário
     """
-    # Implementação de limpeza de cache (placeholder)
-    # Em uma implementação real, isso limparia o cache do Redis ou similar
-    pass
+    credential_cache.invalidate_user(user_id)
+    user_cache.invalidate(user_id)
@@ -3,12 +3,12 @@ import os
 import base64
 from flask import request, jsonify, current_app, g # Adicionado g
 from werkzeug.security import generate_password_hash # Não usado diretamente aqui, mas pode ser útil para User model
-# Temporariamente comentado
-# from flask_jwt_extended import create_access_token, get_jwt_identity
 from app import db
 from app.models import User
 from . import auth
-from .middleware import auth_required # Removida a importação de get_current_user
+from .middleware import auth_required, clear_user_cache
+from .last_access import record_last_access
+from .tokens import create_access_token, get_token_ttl, revoke_token, revoke_user_tokens
 
 @auth.route("/login", methods=["POST", "OPTIONS"])
 def login():
@@ -68,19 +68,20 @@ def login():
         if not user.ativo:
             return jsonify({"message": "Usuário desativado. Contate o administrador."}), 403
         
-        # Atualizar último acesso
-        user.ultimo_acesso = datetime.utcnow()
-        db.session.commit()
+        # Atualizar último acesso (gravação em lote, fora da requisição)
+        ultimo_acesso = datetime.utcnow()
+        record_last_access(user.id, ultimo_acesso)
         current_app.logger.info(f"Usuário {email} autenticado com sucesso via POST para /login.")
         
-        # Gerar token JWT (temporariamente comentado)
-        # access_token = create_access_token(identity=user.id)
-        access_token = "dummy-token-for-development"
+        # Gerar token de acesso assinado (dispensa Basic Auth nas próximas requisições)
+        access_token = create_access_token(user)
         
         response = jsonify({
             "message": "Login bem-sucedido", 
-            "user": user.to_dict(),
-            "access_token": access_token
+            "user": dict(user.to_dict(), ultimo_acesso=ultimo_acesso.isoformat()),
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": get_token_ttl()
         })
         
         # Garantir cabeçalhos CORS na resposta de sucesso
@@ -106,18 +107,19 @@ def login():
             if not user.ativo:
                 return jsonify({"message": "Usuário desativado. Contate o administrador."}), 403
             
-            user.ultimo_acesso = datetime.utcnow()
-            db.session.commit()
+            ultimo_acesso = datetime.utcnow()
+            record_last_access(user.id, ultimo_acesso)
             current_app.logger.info(f"Usuário {username} autenticado com sucesso via header Authorization em /login.")
             
-            # Gerar token JWT (temporariamente comentado)
-            # access_token = create_access_token(identity=user.id)
-            access_token = "dummy-token-for-development"
+            # Gerar token de acesso assinado (dispensa Basic Auth nas próximas requisições)
+            access_token = create_access_token(user)
             
             response = jsonify({
                 "message": "Login bem-sucedido", 
-                "user": user.to_dict(),
-                "access_token": access_token
+                "user": dict(user.to_dict(), ultimo_acesso=ultimo_acesso.isoformat()),
+                "access_token": access_token,
+                "token_type": "Bearer",
+                "expires_in": get_token_ttl()
             })
             
             # Garantir cabeçalhos CORS na resposta de sucesso
@@ -137,7 +139,7 @@ def login():
 @auth_required()
 def get_user_info():
     """
-    Retorna informações do usuário autenticado (via Basic Auth)
+    Retorna informações do usuário autenticado
     ---
     tags:
       - Autenticação
@@ -159,6 +161,11 @@ def get_user_info():
         # Isso não deveria acontecer se @auth_required funcionou corretamente
         return jsonify({"message": "Usuário não encontrado no contexto da requisição, mesmo após @auth_required."}), 404 
     
+    # Com token de acesso, g.user contém apenas as claims; carregar o registro completo
+    user = User.query.get(user.id)
+    if not user:
+        return jsonify({"message": "Usuário não encontrado"}), 404
+    
     return jsonify(user.to_dict()), 200
 
 @auth.route("/users", methods=["GET"])
@@ -313,8 +320,11 @@ def update_user(id):
             return jsonify({"message": "Email já cadastrado"}), 409
         user_to_update.email = data["email"]
     
+    credenciais_alteradas = False
+    
     if "password" in data and data["password"]:
         user_to_update.password = data["password"] # O model User deve hashear a senha
+        credenciais_alteradas = True
     
     if "nome_completo" in data:
         user_to_update.nome_completo = data["nome_completo"]
@@ -323,16 +333,19 @@ def update_user(id):
         user_to_update.cargo = data["cargo"]
     
     if current_user.admin:
-        if "admin" in data:
+        if "admin" in data and data["admin"] != user_to_update.admin:
             user_to_update.admin = data["admin"]
-        if "ativo" in data:
+            credenciais_alteradas = True
+        if "ativo" in data and data["ativo"] != user_to_update.ativo:
             user_to_update.ativo = data["ativo"]
+            credenciais_alteradas = True
+    
+    if credenciais_alteradas:
+        revoke_user_tokens(user_to_update)
     
     db.session.commit()
     
-    # A função clear_user_cache foi mantida no middleware, mas sua lógica é um placeholder.
-    # Se não houver cache real, esta chamada pode ser removida.
-    from .middleware import clear_user_cache 
+    # Descartar credenciais em cache (senha, status ou permissões podem ter mudado)
     clear_user_cache(user_to_update.id)
     
     return jsonify(user_to_update.to_dict()), 200
@@ -371,6 +384,7 @@ def delete_user(id):
     
     db.session.delete(user_to_delete)
     db.session.commit()
+    clear_user_cache(id)
     
     return jsonify({"message": "Usuário removido com sucesso"}), 200
 
@@ -380,10 +394,16 @@ def delete_user(id):
 @auth.route("/logout", methods=["POST", "OPTIONS"])
 def logout(): # Não precisa de @auth_required, pois o cliente apenas "esquece" as credenciais
     """
-    Endpoint para realizar logout (para Basic Auth, é mais um placeholder)
+    Endpoint para realizar logout (revoga o token de acesso, se enviado)
     ---
     tags:
       - Autenticação
+    parameters:
+      - in: header
+        name: Authorization
+        type: string
+        required: false
+        description: Token de acesso a revogar (ex: Bearer <token>)
     responses:
       200:
         description: Logout realizado com sucesso (cliente deve limpar credenciais)
@@ -400,8 +420,12 @@ def logout(): # Não precisa de @auth_required, pois o cliente apenas "esquece"
             response.headers.add('Access-Control-Max-Age', '3600')
         return response
         
-    # Com Basic Auth, o logout é responsabilidade do cliente (limpar o header Authorization ou as credenciais armazenadas)
-    response = jsonify({"message": "Logout realizado com sucesso. O cliente deve limpar as credenciais Basic Auth."})
+    # Tokens de acesso são revogados; com Basic Auth, o cliente deve limpar as credenciais armazenadas
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        revoke_token(auth_header.split(None, 1)[1].strip())
+    
+    response = jsonify({"message": "Logout realizado com sucesso. O cliente deve descartar o token e as credenciais armazenadas."})
     
     # Garantir cabeçalhos CORS na resposta de sucesso
     origin = request.headers.get('Origin')
@@ -0,0 +1,262 @@
+"""
+Tokens de acesso assinados para autenticação sem verificação de senha
+
+Os tokens são emitidos no login, assinados com JWT_SECRET_KEY e expiram após
+JWT_ACCESS_TOKEN_EXPIRES. As claims identificam o usuário e a versão dos seus
+tokens (``User.token_version``); o perfil e o status ativo vêm do snapshot do
+usuário (UserCache), de forma que o middleware não executa bcrypt e, na maior
+parte das requisições, não consulta o banco.
+
+Revogação, compartilhada entre os workers pelo banco:
+
+- desativação, troca de senha ou de perfil incrementam ``token_version`` e
+  invalidam todos os tokens anteriores do usuário; os demais workers percebem
+  a mudança quando o snapshot em cache expira (USER_CACHE_TTL);
+- o logout grava o jti na tabela ``tokens_revogados``, que cada worker
+  sincroniza a cada TOKEN_REVOCATION_SYNC_INTERVAL segundos.
+
+Tokens de stream (``create_stream_token``) são aceitos apenas no parâmetro
+``stream_token`` do stream de tarefas (EventSource não envia headers). São
+assinados com outro salt, valem TASK_STREAM_TOKEN_TTL segundos e herdam o jti
+do token de acesso que os emitiu, de forma que o logout também os revoga. O
+token de acesso nunca vai na URL (e, portanto, nos logs de proxy e de acesso).
+"""
+import datetime
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy import delete, select
+from app import db
+from app.models import TokenRevogado
+from .user_cache import user_cache
+
+TOKEN_SALT = 'access-token'
+STREAM_TOKEN_SALT = 'stream-token'
+
+
+class TokenIdentity(namedtuple('TokenIdentity', ['id', 'username', 'nome_completo', 'admin', 'ativo', 'jti'])):
+    """Usuário autenticado reconstruído a partir das claims do token e do snapshot do usuário"""
+    __slots__ = ()
+
+
+class InvalidToken(Exception):
+    """Token malformado, com assinatura inválida, expirado ou revogado"""
+
+
+class RevocationList:
+    """
+    Cópia local dos jti revogados no logout (tabela ``tokens_revogados``)
+
+    Cada worker carrega incrementalmente as revogações gravadas por qualquer
+    worker (``id`` maior que o último lido), no máximo uma vez a cada
+    ``intervalo`` segundos. As entradas são descartadas quando os tokens que
+    elas afetam já teriam expirado, mantendo a lista pequena.
+    """
+
+    def __init__(self):
+        self._jtis = {}  # jti -> expira_em (epoch)
+        self._ultimo_id = 0
+        self._sincronizado_em = None
+        self._lock = threading.Lock()
+
+    def revoke_token(self, jti, expires_at):
+        with self._lock:
+            self._prune()
+            self._jtis[jti] = expires_at
+
+    def is_revoked(self, jti):
+        with self._lock:
+            return jti in self._jtis
+
+    def sincronizar(self, intervalo):
+        """Carrega as revogações gravadas desde a última sincronização"""
+        agora = time.monotonic()
+        with self._lock:
+            if self._sincronizado_em is not None and agora - self._sincronizado_em < intervalo:
+                return
+            self._sincronizado_em = agora
+            ultimo_id = self._ultimo_id
+
+        linhas = db.session.execute(
+            select(TokenRevogado.id, TokenRevogado.jti, TokenRevogado.expira_em)
+            .where(TokenRevogado.id > ultimo_id, TokenRevogado.expira_em > datetime.datetime.utcnow())
+            .order_by(TokenRevogado.id)
+        ).all()
+        if not linhas:
+            return
+        with self._lock:
+            self._prune()
+            for id_, jti, expira_em in linhas:
+                self._jtis[jti] = expira_em.replace(tzinfo=datetime.timezone.utc).timestamp()
+            self._ultimo_id = max(self._ultimo_id, linhas[-1][0])
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._ultimo_id = 0
+            self._sincronizado_em = None
+
+    def _prune(self):
+        now = time.time()
+        for jti in [k for k, exp in self._jtis.items() if exp <= now]:
+            del self._jtis[jti]
+
+
+revocation_list = RevocationList()
+
+
+def _serializer(salt=TOKEN_SALT):
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt=salt)
+
+
+def get_token_ttl():
+    """Validade do token em segundos (aceita inteiro ou timedelta na configuração)"""
+    expires = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES', 86400)
+    if isinstance(expires, timedelta):
+        return int(expires.total_seconds())
+    return int(expires)
+
+
+def get_stream_token_ttl():
+    """Validade do token de stream em segundos"""
+    return int(current_app.config.get('TASK_STREAM_TOKEN_TTL', 120))
+
+
+def create_access_token(user):
+    """
+    Emite um token de acesso assinado para o usuário
+
+    Args:
+        user: Instância de User autenticada
+
+    Returns:
+        str: Token a ser enviado no header "Authorization: Bearer <token>"
+    """
+    claims = {
+        'sub': user.id,
+        'usr': user.username,
+        'nom': user.nome_completo,
+        'ver': user.token_version or 0,
+        'iat': time.time(),
+        'jti': uuid.uuid4().hex
+    }
+    return _serializer().dumps(claims)
+
+
+def create_stream_token(identity):
+    """
+    Emite um token de curta duração, aceito apenas pelo stream de tarefas
+
+    Args:
+        identity: Usuário autenticado (TokenIdentity ou User)
+
+    Returns:
+        str: Token a ser enviado no parâmetro ``stream_token``
+    """
+    snapshot = user_cache.get(identity.id)
+    claims = {
+        'sub': identity.id,
+        'ver': snapshot.token_version if snapshot else 0,
+        'iat': time.time(),
+        # Mesmo jti do token de acesso: revogado junto com ele no logout
+        'jti': getattr(identity, 'jti', None) or uuid.uuid4().hex
+    }
+    return _serializer(STREAM_TOKEN_SALT).dumps(claims)
+
+
+def decode_stream_token(token):
+    """
+    Valida um token de stream (mesmas verificações de ``decode_access_token``)
+
+    Raises:
+        InvalidToken: se o token for inválido, expirado ou revogado
+
+    Returns:
+        TokenIdentity
+    """
+    return _decode(token, STREAM_TOKEN_SALT, get_stream_token_ttl())
+
+
+def decode_access_token(token):
+    """
+    Valida um token e reconstrói a identidade a partir das claims e do snapshot do usuário
+
+    Raises:
+        InvalidToken: se o token for inválido, expirado ou revogado, ou se o
+        usuário não existir mais
+
+    Returns:
+        TokenIdentity
+    """
+    return _decode(token, TOKEN_SALT, get_token_ttl())
+
+
+def _decode(token, salt, max_age):
+    try:
+        claims = _serializer(salt).loads(token, max_age=max_age)
+    except SignatureExpired:
+        raise InvalidToken('Token expirado')
+    except BadSignature:
+        raise InvalidToken('Token inválido')
+
+    try:
+        user_id = claims['sub']
+        jti = claims['jti']
+        versao = claims.get('ver', 0)
+    except (KeyError, TypeError):
+        raise InvalidToken('Token inválido')
+
+    revocation_list.sincronizar(current_app.config.get('TOKEN_REVOCATION_SYNC_INTERVAL', 5))
+    if revocation_list.is_revoked(jti):
+        raise InvalidToken('Token revogado')
+
+    # Perfil e status atuais; tokens emitidos antes do último incremento de versão não valem mais
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        raise InvalidToken('Token inválido')
+    if snapshot.token_version != versao:
+        raise InvalidToken('Token revogado')
+
+    return TokenIdentity(
+        id=snapshot.id,
+        username=snapshot.username,
+        nome_completo=snapshot.nome_completo,
+        admin=snapshot.admin,
+        ativo=snapshot.ativo,
+        jti=jti
+    )
+
+
+def revoke_token(token):
+    """
+    Revoga um token específico (logout). Tokens inválidos são ignorados.
+
+    Grava o jti na tabela compartilhada (confirmando a transação) e descarta
+    as revogações de tokens que já expiraram.
+    """
+    try:
+        identity = decode_access_token(token)
+    except InvalidToken:
+        return False
+    ttl = get_token_ttl()
+    agora = datetime.datetime.utcnow()
+    db.session.execute(delete(TokenRevogado).where(TokenRevogado.expira_em <= agora))
+    db.session.add(TokenRevogado(jti=identity.jti, expira_em=agora + timedelta(seconds=ttl)))
+    db.session.commit()
+    revocation_list.revoke_token(identity.jti, time.time() + ttl)
+    return True
+
+
+def revoke_user_tokens(user):
+    """
+    Revoga todos os tokens já emitidos para o usuário
+
+    Incrementa ``user.token_version`` na transação corrente: o chamador faz o
+    commit e, depois dele, chama ``clear_user_cache`` para que o snapshot
+    seja recarregado com a nova versão.
+    """
+    user.token_version = (user.token_version or 0) + 1
@@ -0,0 +1,164 @@
+"""
+Cache de snapshots imutáveis de usuários por worker
+
+Os handlers que precisam apenas de dados básicos do usuário (ID, username,
+nome, perfil e status) consultam este cache em vez de repetir
+``User.query.get``. Cada usuário tem um contador de versão: qualquer alteração
+relevante incrementa a versão e invalida os snapshots carregados antes dela.
+Um TTL curto limita o tempo em que alterações feitas por outros workers
+demoram a ser percebidas.
+"""
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from app import db
+from app.models import User
+
+
+class UserSnapshot(namedtuple('UserSnapshot', ['id', 'username', 'nome_completo', 'admin', 'ativo',
+                                               'token_version'])):
+    """Cópia imutável dos dados básicos de um usuário"""
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            id=user.id,
+            username=user.username,
+            nome_completo=user.nome_completo,
+            admin=bool(user.admin),
+            ativo=bool(user.ativo),
+            token_version=user.token_version or 0
+        )
+
+
+class UserCache:
+    """Cache LRU de UserSnapshot com invalidação por versão e TTL"""
+
+    def __init__(self, max_size=4096, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (snapshot, versao, expira_em)
+        self._versions = {}  # user_id -> versao atual
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, ttl=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+
+    def version(self, user_id):
+        """Versão atual do usuário neste worker"""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def invalidate(self, user_id):
+        """Incrementa a versão do usuário, tornando obsoletos os snapshots existentes"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, user_id):
+        """Retorna o snapshot válido em cache ou None (requer o lock)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        snapshot, versao, expira_em = entry
+        if versao != self._versions.get(user_id, 0) or expira_em <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return snapshot
+
+    def _store(self, snapshot, versao):
+        """Armazena um snapshot carregado na versão informada (requer o lock)"""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        # Uma invalidação ocorrida durante a carga torna o snapshot obsoleto
+        if versao != self._versions.get(snapshot.id, 0):
+            return
+        self._entries[snapshot.id] = (snapshot, versao, time.monotonic() + self.ttl)
+        self._entries.move_to_end(snapshot.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        """
+        Obtém o snapshot de um usuário, carregando-o do banco se necessário
+
+        Returns:
+            UserSnapshot ou None se o usuário não existir
+        """
+        if user_id is None:
+            return None
+
+        with self._lock:
+            snapshot = self._lookup(user_id)
+            versao = self._versions.get(user_id, 0)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+
+        snapshot = UserSnapshot.from_user(user)
+        with self._lock:
+            self._store(snapshot, versao)
+        return snapshot
+
+    def get_many(self, user_ids):
+        """
+        Obtém snapshots de vários usuários com uma única consulta para os ausentes
+
+        Returns:
+            dict: user_id -> UserSnapshot (usuários inexistentes são omitidos)
+        """
+        result = {}
+        missing = {}
+        with self._lock:
+            for user_id in set(user_ids):
+                if user_id is None:
+                    continue
+                snapshot = self._lookup(user_id)
+                if snapshot is not None:
+                    result[user_id] = snapshot
+                else:
+                    missing[user_id] = self._versions.get(user_id, 0)
+
+        self.hits += len(result)
+        self.misses += len(missing)
+        if missing:
+            users = User.query.filter(User.id.in_(list(missing))).all()
+            with self._lock:
+                for user in users:
+                    snapshot = UserSnapshot.from_user(user)
+                    self._store(snapshot, missing[user.id])
+                    result[user.id] = snapshot
+
+        return result
+
+
+# Cache de usuários por processo (cada worker do gunicorn mantém o seu)
+user_cache = UserCache()
+
+
+def get_user_snapshot(user_id):
+    """Atalho para user_cache.get"""
+    return user_cache.get(user_id)
+
+
+def get_user_snapshots(user_ids):
+    """Atalho para user_cache.get_many"""
+    return user_cache.get_many(user_ids)
@@ -0,0 +1,49 @@
+"""
+Gravação em lote das transações de autorização de cancelamento
+
+Os protocolos de um lote de transações são resolvidos para os títulos com uma
+única consulta (``IN``) e as transações são inseridas com um único
+``executemany``, em vez de uma consulta e um INSERT por linha do arquivo.
+"""
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import select, insert
+from app import db
+from app.models import Titulo, TransacaoAutorizacaoCancelamento
+
+
+def resolver_protocolos(protocolos: Iterable[str]) -> Dict[str, int]:
+    """
+    Resolve protocolos para os IDs dos títulos, com uma consulta
+
+    Returns:
+        Dict[str, int]: ID do título por protocolo (protocolos sem título ficam de fora)
+    """
+    protocolos = set(protocolos) - {'', None}
+    if not protocolos:
+        return {}
+    return dict(db.session.execute(
+        select(Titulo.protocolo, Titulo.id).where(Titulo.protocolo.in_(list(protocolos)))
+    ).all())
+
+
+def gravar_transacoes(autorizacao_id: int, transacoes: List[Dict[str, Any]]) -> int:
+    """
+    Grava um lote de transações (sem confirmar a transação do banco)
+
+    Args:
+        autorizacao_id: Autorização de cancelamento das transações
+        transacoes: Campos de cada registro de transação (leiaute TRANSACAO)
+
+    Returns:
+        int: Quantidade de transações sem título correspondente ao protocolo
+    """
+    if not transacoes:
+        return 0
+    titulos = resolver_protocolos(campos['numero_protocolo'] for campos in transacoes)
+    # render_nulls: transações sem título no mesmo INSERT (sem separar o lote por colunas nulas)
+    db.session.execute(insert(TransacaoAutorizacaoCancelamento).execution_options(render_nulls=True), [
+        dict(campos, autorizacao_id=autorizacao_id, titulo_id=titulos.get(campos['numero_protocolo']),
+             status='Pendente')
+        for campos in transacoes
+    ])
+    return sum(1 for campos in transacoes if campos['numero_protocolo'] not in titulos)
@@ -0,0 +1,124 @@
+"""
+Leiaute IEPTB-SP do arquivo de autorização de cancelamento
+
+Registros de largura fixa (127 posições), identificados pelo primeiro
+caractere: 0 (header), 1 (transação) e 9 (trailer). A leitura é feita pelo
+``LeitorLarguraFixa`` (decodificação em bloco, por colunas); as funções deste
+módulo são usadas tanto pelo processamento quanto pela validação prévia.
+"""
+from typing import Iterator, Optional
+from app.utils.arquivos_compactados import ArquivoEntrada
+from app.utils.largura_fixa import Campo, Leiaute, LeitorLarguraFixa, Registros
+from .gravacao_lote import resolver_protocolos
+
+TAMANHO_REGISTRO = 127
+
+HEADER = Leiaute('header', TAMANHO_REGISTRO, [
+    Campo('codigo_apresentante', 1, 4),
+    Campo('nome_apresentante', 4, 49),
+    Campo('data_movimento', 49, 57, 'data', 'data do movimento inválida'),
+    Campo('quantidade_solicitacoes', 57, 62, 'inteiro', 'quantidade de solicitações inválida'),
+    Campo('sequencia_registro', 122, 127),
+])
+
+TRANSACAO = Leiaute('transacao', TAMANHO_REGISTRO, [
+    Campo('numero_protocolo', 1, 11),
+    Campo('data_protocolizacao', 11, 19, 'data', 'data de protocolização inválida'),
+    Campo('numero_titulo', 19, 30),
+    Campo('nome_devedor', 30, 75),
+    # 12 dígitos inteiros + 2 decimais sem separador
+    Campo('valor_titulo', 75, 89, 'valor', 'valor do título inválido'),
+    Campo('solicitacao_cancelamento', 89, 90),
+    Campo('agencia_conta', 90, 102),
+    Campo('carteira_nosso_numero', 102, 114),
+    Campo('numero_controle', 116, 122),
+    Campo('sequencia_registro', 122, 127),
+])
+
+# O trailer repete a identificação e a quantidade de solicitações do header
+TRAILER = Leiaute('trailer', TAMANHO_REGISTRO, [
+    Campo('codigo_apresentante', 1, 4),
+    Campo('nome_apresentante', 4, 49),
+    Campo('data_movimento', 49, 57, 'data', 'data do movimento inválida'),
+    Campo('quantidade_solicitacoes', 57, 62, 'inteiro', 'quantidade de solicitações inválida'),
+    Campo('sequencia_registro', 122, 127),
+])
+
+LEIAUTES = {'0': HEADER, '1': TRANSACAO, '9': TRAILER}
+
+
+def ler_registros(file_path: str, limite: Optional[int] = None) -> Iterator[Registros]:
+    """
+    Lê o arquivo em blocos, descompactando em fluxo se necessário (um único .txt por arquivo)
+
+    Yields:
+        Registros: Registros decodificados de um tipo, de um bloco do arquivo
+    """
+    leitor = LeitorLarguraFixa(LEIAUTES)
+    with ArquivoEntrada(file_path, ('.txt',), limite) as entrada:
+        for indice, (_, stream) in enumerate(entrada.arquivos()):
+            if indice:
+                raise ValueError('O arquivo compactado deve conter um único arquivo .txt')
+            yield from leitor.ler(stream)
+
+
+def validar_arquivo(file_path: str, relatorio, limite: Optional[int] = None) -> dict:
+    """
+    Validação prévia (``validate_only``) de um arquivo de autorização, sem gravar no banco
+
+    Erros: tipo de registro desconhecido, registro fora do tamanho do leiaute,
+    campos inválidos, header/trailer ausentes ou repetidos, protocolo ausente e
+    quantidade de transações diferente da informada no header. Avisos: protocolo
+    sem título cadastrado (a transação seria gravada sem vínculo ao título).
+
+    Returns:
+        dict: Linhas lidas e transações válidas
+    """
+    header = None
+    trailer = False
+    linhas_transacao = 0
+    transacoes = 0
+
+    for registros in ler_registros(file_path, limite):
+        relatorio.registros += len(registros)
+        if registros.leiaute is None:
+            for linha in registros.linhas.tolist():
+                relatorio.registrar(linha, f'tipo de registro inválido: {registros.tipo}')
+            continue
+        referencias = registros.colunas.get('numero_protocolo')
+        for indice, mensagem in registros.erros:
+            relatorio.registrar(int(registros.linhas[indice]), mensagem,
+                                referencia=referencias[indice] if referencias else None)
+
+        if registros.leiaute is HEADER:
+            for linha, campos in registros:
+                if header is not None:
+                    relatorio.registrar(linha, 'header repetido')
+                header = campos
+        elif registros.leiaute is TRAILER:
+            trailer = True
+        else:
+            linhas_transacao += len(registros)
+            protocolos = []
+            for linha, campos in registros:
+                if not campos['numero_protocolo']:
+                    relatorio.registrar(linha, 'protocolo não informado', referencia=campos['numero_titulo'])
+                    continue
+                protocolos.append((linha, campos['numero_protocolo']))
+            transacoes += len(protocolos)
+            # Uma consulta por bloco para os protocolos sem título cadastrado
+            cadastrados = resolver_protocolos(protocolo for _, protocolo in protocolos)
+            for linha, protocolo in protocolos:
+                if protocolo not in cadastrados:
+                    relatorio.registrar(linha, 'título não encontrado para o protocolo',
+                                        referencia=protocolo, nivel='aviso')
+
+    if header is None:
+        relatorio.registrar(None, 'Header do arquivo não encontrado')
+    elif (header['quantidade_solicitacoes'] or 0) != linhas_transacao:
+        relatorio.registrar(None, f"quantidade de transações diferente da informada no header: "
+                            f"{linhas_transacao} de {header['quantidade_solicitacoes'] or 0}")
+    if not trailer:
+        relatorio.registrar(None, 'Trailer do arquivo não encontrado')
+
+    return {'linhas': relatorio.registros, 'transacoes': transacoes}
@@ -0,0 +1,85 @@
+"""
+Processamento em lote das transações de autorização de cancelamento
+
+Equivale a chamar ``POST /transacoes/<id>/processar`` para cada transação
+pendente, mas com poucos comandos baseados em conjunto (``UPDATE ... FROM``),
+independentemente da quantidade de transações, todos na mesma transação do
+banco:
+
+1. vincula ao título, pelo protocolo, as transações ainda sem título;
+2. marca como processadas as transações cujo título está protestado,
+   obtendo os títulos delas com ``RETURNING``;
+3. cancela esses títulos;
+4. marca como erro as transações cujo título não foi encontrado.
+
+Transações de títulos ainda não protestados continuam pendentes, como no
+processamento individual, e podem ser processadas depois do protesto.
+"""
+import datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func, select, update
+from app import db
+from app.models import Titulo, TransacaoAutorizacaoCancelamento as Transacao
+
+
+def processar_transacoes(autorizacao_id: Optional[int] = None,
+                         transacao_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Processa as transações pendentes de uma autorização ou de um conjunto de IDs
+
+    Transações que não estão pendentes são ignoradas. Não confirma a transação
+    do banco (o chamador faz o commit).
+
+    Returns:
+        Dict[str, int]: Quantidade de transações por status resultante
+        ('Processado', 'Erro', 'Pendente') e por motivo de não processamento
+    """
+    selecao = [Transacao.status == 'Pendente']
+    if autorizacao_id is not None:
+        selecao.append(Transacao.autorizacao_id == autorizacao_id)
+    if transacao_ids is not None:
+        selecao.append(Transacao.id.in_(list(transacao_ids)))
+    agora = datetime.datetime.utcnow()
+
+    # 1. Título localizado pelo protocolo (uma vez; as próximas execuções já o encontram vinculado)
+    db.session.execute(
+        update(Transacao)
+        .where(*selecao, Transacao.titulo_id.is_(None), Titulo.protocolo == Transacao.numero_protocolo)
+        .values(titulo_id=Titulo.id)
+        .execution_options(synchronize_session=False)
+    )
+
+    # 2. Transações de títulos protestados; RETURNING identifica exatamente as atualizadas
+    titulo_ids = db.session.execute(
+        update(Transacao)
+        .where(*selecao, Titulo.id == Transacao.titulo_id, Titulo.status == 'Protestado')
+        .values(status='Processado', data_processamento=agora)
+        .returning(Transacao.titulo_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    # 3. Cancelamento dos títulos das transações processadas no passo 2
+    if titulo_ids:
+        db.session.execute(
+            update(Titulo)
+            .where(Titulo.id.in_(set(titulo_ids)), Titulo.status == 'Protestado')
+            .values(status='Cancelado')
+            .execution_options(synchronize_session=False)
+        )
+
+    # 4. Sem título cadastrado: erro; título não protestado: continua pendente
+    sem_titulo = db.session.execute(
+        update(Transacao)
+        .where(*selecao, Transacao.titulo_id.is_(None))
+        .values(status='Erro', data_processamento=agora)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    nao_protestado = db.session.execute(select(func.count(Transacao.id)).where(*selecao)).scalar()
+
+    return {
+        'Processado': len(titulo_ids),
+        'Erro': sem_titulo,
+        'Pendente': nao_protestado,
+        'titulo_nao_encontrado': sem_titulo,
+        'titulo_nao_protestado': nao_protestado
+    }
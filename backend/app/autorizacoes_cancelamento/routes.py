@@ -1,18 +1,24 @@
-import os
 import datetime
-from flask import request, jsonify, current_app, g
+from flask import request, jsonify, current_app, g, Response
 from app.auth.middleware import auth_required
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import User, Titulo, AutorizacaoCancelamento, TransacaoAutorizacaoCancelamento
+from app.utils.uploads import salvar_upload, descartar_upload, buscar_reenvio
+from app.auth.user_cache import get_user_snapshot
+from app.utils.arquivos_compactados import extensao_permitida, ERROS_COMPACTACAO
+from app.utils.largura_fixa import EscritorLarguraFixa
+from app.utils.validacao_previa import RelatorioValidacao, validate_only_solicitado, resposta_ocorrencias
 from . import autorizacoes
+from .gravacao_lote import gravar_transacoes
+from .processamento_lote import processar_transacoes
+from .leiaute import HEADER, TRANSACAO, TRAILER, LEIAUTES, ler_registros, validar_arquivo
 from flasgger import swag_from
 
 
 def allowed_file(filename):
-    """Verifica se o arquivo tem uma extensão permitida"""
-    return "." in filename and \
-           filename.rsplit(".", 1)[1].lower() in ["txt"]
+    """Verifica se o arquivo tem uma extensão permitida (.txt, .txt.gz ou .zip)"""
+    return extensao_permitida(filename, (".txt",))
 
 
 @autorizacoes.route("/upload", methods=["POST"])
@@ -27,17 +33,37 @@ def allowed_file(filename):
             "in": "formData",
             "type": "file",
             "required": True,
-            "description": "Arquivo de autorização de cancelamento"
+            "description": "Arquivo de autorização de cancelamento (.txt, .txt.gz ou .zip com um .txt)"
+        },
+        {
+            "name": "validate_only",
+            "in": "formData",
+            "type": "boolean",
+            "required": False,
+            "description": "Apenas valida o arquivo, sem gravar nem processar (retorna o resumo das ocorrências)"
         }
     ],
     "responses": {
         200: {
-            "description": "Upload realizado com sucesso",
+            "description": "Arquivo idêntico já enviado (retorna a autorização existente) ou resumo da validação prévia",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "message": {"type": "string"},
+                    "autorizacao_id": {"type": "integer"},
+                    "duplicado": {"type": "boolean"}
+                }
+            }
+        },
+        202: {
+            "description": "Upload realizado; o processamento segue em segundo plano (acompanhe pela tarefa)",
             "schema": {
                 "type": "object",
                 "properties": {
                     "message": {"type": "string"},
-                    "autorizacao_id": {"type": "integer"}
+                    "autorizacao_id": {"type": "integer"},
+                    "status": {"type": "string"},
+                    "task_id": {"type": "string"}
                 }
             }
         },
@@ -66,134 +92,179 @@ def upload_file():
     
     # Verificar se o arquivo tem uma extensão permitida
     if not allowed_file(file.filename):
-        return jsonify({"error": "Formato de arquivo não permitido. Use .txt"}), 400
+        return jsonify({"error": "Formato de arquivo não permitido. Use .txt (ou compactado em .txt.gz/.zip)"}), 400
     
-    # Salvar o arquivo
+    # Salvar o arquivo com nome único, calculando o hash do conteúdo
     filename = secure_filename(file.filename)
-    file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    file.save(file_path)
+    file_path, hash_arquivo = salvar_upload(file, current_app.config["UPLOAD_FOLDER"], filename)
+    
+    # Validação prévia: nada é gravado no banco e o arquivo é descartado
+    if validate_only_solicitado():
+        try:
+            with RelatorioValidacao("Autorização de Cancelamento", filename,
+                                    g.user.id if g.user else None) as relatorio:
+                validar_arquivo(file_path, relatorio, current_app.config.get("UPLOAD_MAX_DESCOMPACTADO"))
+        except ERROS_COMPACTACAO as e:
+            return jsonify({"error": f"Arquivo compactado inválido: {str(e)}", "valido": False}), 400
+        except ValueError as e:
+            return jsonify({"error": str(e), "valido": False}), 400
+        finally:
+            db.session.rollback()
+            descartar_upload(file_path)
+        return jsonify(dict(relatorio.resumo(), message="Validação concluída. Nenhum dado foi gravado.")), 200
+    
+    # Reenvio de um arquivo idêntico: retorna a autorização já registrada
+    existente = buscar_reenvio(AutorizacaoCancelamento, hash_arquivo, g.user.id if g.user else None)
+    if existente:
+        descartar_upload(file_path)
+        return jsonify({
+            "message": "Arquivo já enviado anteriormente",
+            "autorizacao_id": existente.id,
+            "status": existente.status,
+            "duplicado": True
+        }), 200
     
     # Obter o usuário atual
     current_user = g.user
     current_user_id = current_user.id if current_user else None
-    user = User.query.get(current_user_id)
     
     # Criar registro de autorização de cancelamento
     autorizacao = AutorizacaoCancelamento(
         arquivo_nome=filename,
         status="Pendente",
-        usuario_id=current_user_id
+        usuario_id=current_user_id,
+        hash_arquivo=hash_arquivo
     )
     
     db.session.add(autorizacao)
     db.session.commit()
     
-    # Iniciar processamento do arquivo em background (em uma implementação real, isso seria feito com Celery ou similar)
-    # Por enquanto, vamos processar diretamente
+    # Iniciar processamento assíncrono usando o sistema de filas
     try:
-        process_file(file_path, autorizacao.id)
+        from app.utils.async_tasks import enqueue_task
+        
+        # Enfileira a tarefa de processamento
+        task_id = enqueue_task(
+            processar_autorizacao,
+            f"Processamento da autorização de cancelamento {autorizacao.id}",
+            autorizacao.id,
+            file_path,
+            task_usuario_id=current_user_id
+        )
+        
+        # Atualiza a autorização com o ID da tarefa
+        autorizacao.task_id = task_id
+        db.session.commit()
+        
         return jsonify({
-            "message": "Arquivo enviado com sucesso e processado",
-            "autorizacao_id": autorizacao.id
-        }), 200
+            "message": "Arquivo enviado com sucesso. O processamento foi iniciado em segundo plano.",
+            "autorizacao_id": autorizacao.id,
+            "status": autorizacao.status,
+            "task_id": task_id
+        }), 202
     except Exception as e:
+        db.session.rollback()
+        autorizacao.status = "Erro"
+        db.session.commit()
         return jsonify({"error": f"Erro ao processar arquivo: {str(e)}"}), 500
 
 
-def process_file(file_path, autorizacao_id):
-    """Processa o arquivo de autorização de cancelamento"""
+def processar_autorizacao(autorizacao_id, file_path):
+    """
+    Processa o arquivo de autorização de cancelamento, gravando as transações em lotes
+
+    Cada lote (AUTORIZACAO_CHUNK_SIZE transações) é confirmado junto com a
+    última linha gravada (``linhas_processadas``) e o progresso da tarefa é
+    reportado pela quantidade de transações lidas em relação à informada no
+    header. Após uma falha, as transações já confirmadas são mantidas: uma nova
+    execução (retentativa ou reenfileiramento da tarefa) retoma a partir da
+    linha seguinte. Erros de leiaute (``ValueError``) não são retentados: o
+    arquivo corrigido é enviado de novo, como uma nova autorização.
+    """
+    from app.utils.async_tasks import update_task_progress, get_current_task_id
+    
     autorizacao = AutorizacaoCancelamento.query.get(autorizacao_id)
     
+    if not autorizacao:
+        raise Exception("Autorização de cancelamento não encontrada")
+    
+    # Autorização já processada (ex.: tarefa reenfileirada): nada a refazer
+    if autorizacao.status == "Processado":
+        return {"autorizacao_id": autorizacao.id, "linhas_processadas": autorizacao.linhas_processadas,
+                "reprocessada": False}
+    
+    task_id = get_current_task_id()
+    chunk_size = max(1, current_app.config.get("AUTORIZACAO_CHUNK_SIZE", 5000))
+    retomada = autorizacao.linhas_processadas or 0
+    
     try:
-        with open(file_path, "r", encoding="latin-1") as file:
-            lines = file.readlines()
+        autorizacao.status = "Processando"
+        db.session.commit()
+        
+        header = None
+        trailer = False
+        quantidade_transacoes = 0
+        lote = []
+        ultima_linha = retomada
         
-        # Processar o header do arquivo (registro tipo 0)
-        header_line = None
-        trailer_line = None
-        transaction_lines = []
+        def gravar_lote():
+            """Grava o lote pendente e confirma, avançando o ponto de retomada"""
+            gravar_transacoes(autorizacao.id, lote)
+            autorizacao.linhas_processadas = ultima_linha
+            db.session.commit()
+            lote.clear()
+            if header and header["quantidade_solicitacoes"]:
+                progresso = quantidade_transacoes * 100 // header["quantidade_solicitacoes"]
+                update_task_progress(task_id, min(99, progresso))
         
-        for line in lines:
-            line = line.strip()
-            if not line:  # Ignorar linhas vazias
-                continue
-                
-            record_type = line[0:1]
+        # Ler os registros em blocos, descompactando se necessário (um único .txt por arquivo)
+        for registros in ler_registros(file_path, current_app.config.get("UPLOAD_MAX_DESCOMPACTADO")):
+            # Primeiro registro inválido do bloco: as transações anteriores a ele são gravadas
+            erro = min(registros.erros) if registros.erros else None
+            linha_erro = int(registros.linhas[erro[0]]) if erro else None
+            
+            if registros.leiaute is HEADER:  # Registro tipo 0
+                # Cada bloco é agrupado por tipo em ordem (0, 1, 9): o header do
+                # primeiro bloco é lido antes de qualquer transação, inclusive na retomada
+                header = registros.primeiro()
+            elif registros.leiaute is TRAILER:  # Registro tipo 9
+                trailer = True
+            elif registros.leiaute is TRANSACAO:  # Registro tipo 1
+                # Protocolos resolvidos e transações inseridas em lote (uma consulta e um INSERT por lote)
+                for linha, campos in registros:
+                    if erro and linha > linha_erro:
+                        break
+                    quantidade_transacoes += 1
+                    # Linhas já gravadas por uma execução anterior
+                    if linha <= retomada:
+                        continue
+                    lote.append(campos)
+                    ultima_linha = linha
+                    if len(lote) >= chunk_size:
+                        gravar_lote()
+                if erro:
+                    gravar_lote()
             
-            if record_type == "0":  # Header
-                header_line = line
-            elif record_type == "1":  # Transação
-                transaction_lines.append(line)
-            elif record_type == "9":  # Trailer
-                trailer_line = line
+            if erro:
+                raise ValueError(f"Linha {linha_erro}: {erro[1]}")
         
-        if not header_line:
+        gravar_lote()
+        
+        if not header:
             raise ValueError("Header do arquivo não encontrado")
             
-        if not trailer_line:
+        if not trailer:
             raise ValueError("Trailer do arquivo não encontrado")
         
-        # Processar o header
-        codigo_apresentante = header_line[1:4].strip()
-        nome_apresentante = header_line[4:49].strip()
-        data_movimento_str = header_line[49:57].strip()
-        quantidade_solicitacoes = int(header_line[57:62].strip() or "0")
-        sequencia_registro = header_line[122:127].strip()
-        
-        # Converter data do movimento
-        data_movimento = datetime.datetime.strptime(data_movimento_str, "%d%m%Y").date() if data_movimento_str else None
-        
-        # Atualizar o registro de autorização
-        autorizacao.codigo_apresentante = codigo_apresentante
-        autorizacao.nome_apresentante = nome_apresentante
-        autorizacao.data_movimento = data_movimento
-        autorizacao.quantidade_solicitacoes = quantidade_solicitacoes
-        autorizacao.sequencia_registro = sequencia_registro
-        
-        # Processar as transações
-        for line in transaction_lines:
-            numero_protocolo = line[1:11].strip()
-            data_protocolizacao_str = line[11:19].strip()
-            numero_titulo = line[19:30].strip()
-            nome_devedor = line[30:75].strip()
-            valor_titulo_str = line[75:89].strip()
-            solicitacao_cancelamento = line[89:90].strip()
-            agencia_conta = line[90:102].strip()
-            carteira_nosso_numero = line[102:114].strip()
-            numero_controle = line[116:122].strip()
-            sequencia_registro_transacao = line[122:127].strip()
-            
-            # Converter data de protocolização
-            data_protocolizacao = datetime.datetime.strptime(data_protocolizacao_str, "%d%m%Y").date() if data_protocolizacao_str else None
-            
-            # Converter valor do título (formato: 12 dígitos inteiros + 2 decimais sem separador)
-            valor_titulo = float(valor_titulo_str) / 100 if valor_titulo_str else 0
-            
-            # Buscar título pelo protocolo
-            titulo = Titulo.query.filter_by(protocolo=numero_protocolo).first()
-            titulo_id = titulo.id if titulo else None
-            
-            # Criar transação
-            transacao = TransacaoAutorizacaoCancelamento(
-                autorizacao_id=autorizacao.id,
-                titulo_id=titulo_id,
-                numero_protocolo=numero_protocolo,
-                data_protocolizacao=data_protocolizacao,
-                numero_titulo=numero_titulo,
-                nome_devedor=nome_devedor,
-                valor_titulo=valor_titulo,
-                solicitacao_cancelamento=solicitacao_cancelamento,
-                agencia_conta=agencia_conta,
-                carteira_nosso_numero=carteira_nosso_numero,
-                numero_controle=numero_controle,
-                sequencia_registro=sequencia_registro_transacao,
-                status="Pendente"
-            )
-            
-            db.session.add(transacao)
+        # Atualizar o registro de autorização com os dados do header
+        autorizacao.codigo_apresentante = header["codigo_apresentante"]
+        autorizacao.nome_apresentante = header["nome_apresentante"]
+        autorizacao.data_movimento = header["data_movimento"]
+        autorizacao.quantidade_solicitacoes = header["quantidade_solicitacoes"] or 0
+        autorizacao.sequencia_registro = header["sequencia_registro"]
         
         # Verificar se a quantidade de transações corresponde ao informado no header
-        if len(transaction_lines) != quantidade_solicitacoes:
+        if quantidade_transacoes != autorizacao.quantidade_solicitacoes:
             autorizacao.status = "Erro"
         else:
             autorizacao.status = "Processado"
@@ -201,12 +272,46 @@ def process_file(file_path, autorizacao_id):
         autorizacao.data_processamento = datetime.datetime.utcnow()
         db.session.commit()
         
+        return {"autorizacao_id": autorizacao.id, "transacoes": quantidade_transacoes,
+                "retomada_linha": retomada or None, "status": autorizacao.status}
+        
+    except ERROS_COMPACTACAO as e:
+        db.session.rollback()
+        autorizacao.status = "Erro"
+        db.session.commit()
+        raise ValueError(f"Arquivo compactado inválido: {str(e)}") from e
     except Exception as e:
+        # Só o lote não confirmado é desfeito; linhas_processadas indica onde retomar
+        db.session.rollback()
         autorizacao.status = "Erro"
         db.session.commit()
         raise e
 
 
+@autorizacoes.route("/validacoes/<validacao_id>", methods=["GET"])
+@auth_required()
+@swag_from({
+    "tags": ["Autorizações de Cancelamento"],
+    "summary": "Obtém as ocorrências de uma validação prévia, paginadas",
+    "description": "Ocorrências por linha da validação prévia (validate_only) de um arquivo de autorização",
+    "parameters": [
+        {"name": "validacao_id", "in": "path", "type": "string", "required": True},
+        {"name": "page", "in": "query", "type": "integer", "default": 1},
+        {"name": "per_page", "in": "query", "type": "integer", "default": 100},
+        {"name": "nivel", "in": "query", "type": "string", "enum": ["erro", "aviso"]},
+        {"name": "formato", "in": "query", "type": "string", "enum": ["json", "csv"],
+         "description": "csv devolve todas as ocorrências para download"}
+    ],
+    "responses": {
+        200: {"description": "Resumo e página de ocorrências (ou arquivo CSV)"},
+        404: {"description": "Relatório não encontrado ou expirado"}
+    }
+})
+def get_validacao(validacao_id):
+    """Endpoint para consultar as ocorrências de uma validação prévia"""
+    return resposta_ocorrencias(validacao_id, get_user_snapshot(g.user.id if g.user else None))
+
+
 @autorizacoes.route("/", methods=["GET"])
 @auth_required()
 @swag_from({
@@ -379,15 +484,14 @@ def processar_transacao(id):
     if not transacao:
         return jsonify({"error": "Transação não encontrada"}), 404
     
-    # Verificar se o título existe
-    if not transacao.titulo_id:
+    # Título vinculado na importação ou, se não havia, localizado agora pelo protocolo (uma consulta)
+    if transacao.titulo_id:
+        titulo = Titulo.query.get(transacao.titulo_id)
+    else:
         titulo = Titulo.query.filter_by(protocolo=transacao.numero_protocolo).first()
-        if titulo:
-            transacao.titulo_id = titulo.id
-        else:
+        if not titulo:
             return jsonify({"error": "Título não encontrado com o protocolo informado"}), 404
-    
-    titulo = Titulo.query.get(transacao.titulo_id)
+        transacao.titulo_id = titulo.id
     
     # Verificar se o título está protestado
     if titulo.status != "Protestado":
@@ -408,6 +512,72 @@ def processar_transacao(id):
     })
 
 
+@autorizacoes.route("/transacoes/processar-lote", methods=["POST"])
+@auth_required()
+@swag_from({
+    "tags": ["Autorizações de Cancelamento"],
+    "summary": "Processa em lote as transações pendentes",
+    "description": "Processa todas as transações pendentes de uma autorização de cancelamento, ou um conjunto de "
+                   "transações, com comandos em conjunto (UPDATE ... FROM) em uma única transação do banco",
+    "parameters": [
+        {
+            "name": "body",
+            "in": "body",
+            "required": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "autorizacao_id": {"type": "integer", "description": "Processa todas as transações pendentes"},
+                    "transacao_ids": {"type": "array", "items": {"type": "integer"},
+                                      "description": "Processa as transações pendentes informadas"}
+                }
+            }
+        }
+    ],
+    "responses": {
+        200: {
+            "description": "Quantidade de transações por status resultante e por motivo de não processamento",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "message": {"type": "string"},
+                    "resultado": {"type": "object"}
+                }
+            }
+        },
+        400: {"description": "Nenhum critério informado ou IDs inválidos"},
+        404: {"description": "Autorização de cancelamento não encontrada"}
+    }
+})
+def processar_transacoes_lote():
+    """Endpoint para processar em lote as transações de autorização de cancelamento"""
+    data = request.get_json(silent=True) or {}
+    autorizacao_id = data.get("autorizacao_id")
+    transacao_ids = data.get("transacao_ids")
+    
+    # Exigir um critério explícito para não processar todas as pendências por engano
+    if autorizacao_id is None and not transacao_ids:
+        return jsonify({"error": "Informe autorizacao_id ou transacao_ids"}), 400
+    if transacao_ids is not None and (not isinstance(transacao_ids, list) or
+                                      not all(isinstance(i, int) for i in transacao_ids)):
+        return jsonify({"error": "transacao_ids deve ser uma lista de IDs"}), 400
+    if autorizacao_id is not None and not AutorizacaoCancelamento.query.get(autorizacao_id):
+        return jsonify({"error": "Autorização de cancelamento não encontrada"}), 404
+    
+    try:
+        resultado = processar_transacoes(autorizacao_id, transacao_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return jsonify({
+        "message": f"{resultado['Processado']} transações processadas, {resultado['Erro']} com erro, "
+                   f"{resultado['Pendente']} pendentes (título não protestado)",
+        "resultado": resultado
+    })
+
+
 @autorizacoes.route("/gerar-arquivo-exemplo", methods=["GET"])
 @auth_required()
 @swag_from({
@@ -427,35 +597,28 @@ def gerar_arquivo_exemplo():
     """Endpoint para gerar um arquivo de exemplo de autorização de cancelamento"""
     # Dados de exemplo
     codigo_apresentante = "001"
-    nome_apresentante = "BANCO EXEMPLO S.A."
-    data_movimento = datetime.datetime.now().strftime("%d%m%Y")
-    quantidade_solicitacoes = 2
-    
-    # Criar conteúdo do arquivo
-    content = []
-    
-    # Header
-    header = f"0{codigo_apresentante}{nome_apresentante.ljust(45)}{data_movimento}{str(quantidade_solicitacoes).zfill(5)}{' ' * 60}00001"
-    content.append(header)
+    data_movimento = datetime.date.today()
+    transacoes = [
+        {"numero_protocolo": "PROT12345", "data_protocolizacao": data_movimento, "numero_titulo": "12345678901",
+         "nome_devedor": "DEVEDOR EXEMPLO 1", "valor_titulo": 100.5, "solicitacao_cancelamento": "A",
+         "carteira_nosso_numero": "67890"},
+        {"numero_protocolo": "PROT67890", "data_protocolizacao": data_movimento, "numero_titulo": "98765432109",
+         "nome_devedor": "DEVEDOR EXEMPLO 2", "valor_titulo": 200.75, "solicitacao_cancelamento": "A",
+         "carteira_nosso_numero": "12345"},
+    ]
     
-    # Transações
-    transacao1 = f"1PROT12345{data_movimento}12345678901DEVEDOR EXEMPLO 1{{'0' * 14}}A{{' ' * 12}}67890{{' ' * 8}}00002"
-    content.append(transacao1)
-    transacao2 = f"1PROT67890{data_movimento}98765432109DEVEDOR EXEMPLO 2{{'0' * 14}}A{{' ' * 12}}12345{{' ' * 8}}00003"
-    content.append(transacao2)
-    
-    # Trailer
-    trailer = f"9{codigo_apresentante}{nome_apresentante.ljust(45)}{data_movimento}{str(quantidade_solicitacoes).zfill(5)}{' ' * 60}00004"
-    content.append(trailer)
-    
-    # Criar arquivo temporário
-    filename = f"AC{codigo_apresentante}_{data_movimento}.txt"
-    file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    
-    with open(file_path, "w", encoding="latin-1") as f:
-        f.write("\n".join(content))
+    # Registros gerados pelo mesmo leiaute usado na leitura do arquivo
+    escritor = EscritorLarguraFixa(LEIAUTES)
+    identificacao = {"codigo_apresentante": codigo_apresentante, "nome_apresentante": "BANCO EXEMPLO S.A.",
+                     "data_movimento": data_movimento, "quantidade_solicitacoes": len(transacoes)}
+    conteudo = b"".join(escritor.escrever([
+        ("0", [dict(identificacao, sequencia_registro="00001")]),
+        ("1", transacoes, {"sequencia_registro": [f"{i:05d}" for i in range(2, len(transacoes) + 2)]}),
+        ("9", [dict(identificacao, sequencia_registro=f"{len(transacoes) + 2:05d}")]),
+    ]))
     
     # Retornar o arquivo para download
-    return current_app.send_file(file_path, as_attachment=True, download_name=filename)
-
-
+    filename = f"AC{codigo_apresentante}_{data_movimento:%d%m%Y}.txt"
+    return Response(conteudo, mimetype="application/octet-stream", headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
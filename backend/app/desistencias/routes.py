@@ -1,9 +1,11 @@
 from datetime import datetime
 from flask import request, jsonify, current_app, g
 from app.auth.middleware import auth_required
+from app.auth.user_cache import get_user_snapshot
 from sqlalchemy import or_, and_
 from app import db
 from app.models import Desistencia, Titulo, User, Devedor, Erro
+from app.utils.partes import normalizar_documento, resolver_parte
 from . import desistencias
 
 @desistencias.route('/', methods=['GET'])
@@ -143,6 +145,9 @@ def create_desistencia():
               type: string
             observacoes:
               type: string
+            documentoDevedor:
+              type: string
+              description: CPF/CNPJ do devedor (usado para localizar ou cadastrar o devedor)
     responses:
       201:
         description: Desistência criada
@@ -153,7 +158,7 @@ def create_desistencia():
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
@@ -168,18 +173,23 @@ def create_desistencia():
     
     if not titulo:
         # Se não encontrar, criar um novo título
-        devedor = Devedor.query.filter_by(nome=data['devedor']).first()
-        
-        if not devedor:
-            devedor = Devedor(nome=data['devedor'])
-            db.session.add(devedor)
-            db.session.flush()
+        if normalizar_documento(data.get('documentoDevedor')):
+            # Devedor identificado pelo CPF/CNPJ normalizado (sem duplicar cadastros)
+            devedor_id = resolver_parte(Devedor, nome=data['devedor'], documento=data['documentoDevedor'])
+        else:
+            devedor = Devedor.query.filter_by(nome=data['devedor']).first()
+            
+            if not devedor:
+                devedor = Devedor(nome=data['devedor'])
+                db.session.add(devedor)
+                db.session.flush()
+            devedor_id = devedor.id
         
         titulo = Titulo(
             numero=data['numeroTitulo'],
             protocolo=data['protocolo'],
             valor=data['valor'],
-            devedor_id=devedor.id,
+            devedor_id=devedor_id,
             status='Protestado'
         )
         db.session.add(titulo)
@@ -266,7 +276,7 @@ def update_desistencia(id):
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
@@ -363,7 +373,7 @@ def processar_desistencia(id):
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
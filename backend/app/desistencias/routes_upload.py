@@ -1,11 +1,12 @@
 import os
-import uuid
 from datetime import datetime
 from flask import request, jsonify, current_app, g
 from app.auth.middleware import auth_required
+from app.auth.user_cache import get_user_snapshot
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import Desistencia, Titulo, User, Devedor, Erro
+from app.utils.uploads import salvar_upload, descartar_upload, buscar_reenvio
 from . import desistencias
 
 # Função auxiliar para verificar se o arquivo é permitido
@@ -42,6 +43,8 @@ def upload_desistencia_file():
         required: false
         description: Descrição da desistência
     responses:
+      200:
+        description: Arquivo idêntico já enviado; retorna a desistência existente
       201:
         description: Desistência criada
       400:
@@ -54,7 +57,7 @@ def upload_desistencia_file():
         
         current_user = g.user
         user_id = current_user.id if current_user else None
-        current_user = User.query.get(user_id)
+        current_user = get_user_snapshot(user_id)
         
         if not current_user:
             current_app.logger.error(f"Usuário não encontrado: {user_id}")
@@ -84,26 +87,33 @@ def upload_desistencia_file():
         if not uf:
             return jsonify({'message': 'UF é obrigatória'}), 400
         
-        # Gerar nome único para o arquivo
+        # Salvar arquivo com nome único, calculando o hash do conteúdo
         filename = secure_filename(file.filename)
-        unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{filename}"
-        
-        # Criar diretório de upload se não existir
         upload_folder = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'desistencias')
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        file_path = os.path.join(upload_folder, unique_filename)
-        current_app.logger.info(f"Salvando arquivo em: {file_path}")
+        file_path, hash_arquivo = salvar_upload(file, upload_folder, filename)
+        current_app.logger.info(f"Arquivo salvo em: {file_path}")
         
-        # Salvar arquivo
-        file.save(file_path)
+        # Reenvio de um arquivo idêntico: retorna a desistência já criada
+        existente = buscar_reenvio(Desistencia, hash_arquivo, current_user.id, status_falha='Rejeitada')
+        if existente:
+            descartar_upload(file_path)
+            current_app.logger.info(f"Arquivo já enviado: desistência {existente.id}")
+            return jsonify({
+                'message': 'Arquivo já enviado anteriormente. Retornando a desistência existente.',
+                'id': str(existente.id),
+                'dataSolicitacao': existente.data_solicitacao.isoformat() if existente.data_solicitacao else None,
+                'motivo': existente.motivo,
+                'status': existente.status,
+                'duplicado': True
+            }), 200
         
         # Criar registro de desistência no banco
         desistencia = Desistencia(
             motivo=descricao or f"Desistência enviada via upload de arquivo - {filename}",
             status='Pendente',
             usuario_id=current_user.id,
-            data_solicitacao=datetime.utcnow()
+            data_solicitacao=datetime.utcnow(),
+            hash_arquivo=hash_arquivo
         )
         
         db.session.add(desistencia)
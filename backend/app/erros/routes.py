@@ -1,6 +1,7 @@
 from datetime import datetime
 from flask import request, jsonify, g
 from app.auth.middleware import auth_required
+from app.auth.user_cache import get_user_snapshot
 from sqlalchemy import or_, and_
 from app import db
 from app.models import Erro, Remessa, Titulo, User
@@ -225,7 +226,7 @@ def resolver_erro(id):
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({"message": "Usuário não encontrado"}), 404
@@ -1,5 +1,8 @@
 from datetime import datetime
+import json
+from sqlalchemy.orm import validates
 from app import db, bcrypt
+from app.utils.partes import normalizar_documento
 
 class User(db.Model):
     """Modelo para usuários do sistema"""
@@ -15,6 +18,8 @@ class User(db.Model):
     admin = db.Column(db.Boolean, default=False)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     ultimo_acesso = db.Column(db.DateTime, nullable=True)
+    # Incrementada ao revogar os tokens emitidos (troca de senha, desativação, mudança de perfil)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def __init__(self, username, email, password, nome_completo, cargo=None, admin=False):
         self.username = username
@@ -109,6 +114,7 @@ class Remessa(db.Model):
     quantidade_titulos = db.Column(db.Integer, default=0)
     task_id = db.Column(db.String(50), nullable=True)  # ID da tarefa assíncrona
     descricao = db.Column(db.Text, nullable=True)  # Descrição da remessa
+    hash_arquivo = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 do arquivo enviado
     
     # Relacionamentos
     usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -132,7 +138,8 @@ class Remessa(db.Model):
             'data_processamento': self.data_processamento.isoformat() if self.data_processamento else None,
             'titulos_count': self.titulos.count(),
             'erros_count': self.erros.count(),
-            'descricao': self.descricao
+            'descricao': self.descricao,
+            'hash_arquivo': self.hash_arquivo
         }
 
 class Credor(db.Model):
@@ -142,6 +149,7 @@ class Credor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100))
     documento = db.Column(db.String(20), index=True)  # CNPJ/CPF
+    documento_normalizado = db.Column(db.String(20), unique=True, index=True, nullable=True)  # Apenas dígitos
     endereco = db.Column(db.String(255))
     cidade = db.Column(db.String(100))
     uf = db.Column(db.String(2))
@@ -150,6 +158,11 @@ class Credor(db.Model):
     # Relacionamentos
     titulos = db.relationship('Titulo', backref='credor', lazy='dynamic')
     
+    @validates('documento')
+    def _atualizar_documento_normalizado(self, key, documento):
+        self.documento_normalizado = normalizar_documento(documento)
+        return documento
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -168,6 +181,7 @@ class Devedor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100))
     documento = db.Column(db.String(20), index=True)  # CNPJ/CPF
+    documento_normalizado = db.Column(db.String(20), unique=True, index=True, nullable=True)  # Apenas dígitos
     endereco = db.Column(db.String(255))
     cidade = db.Column(db.String(100))
     uf = db.Column(db.String(2))
@@ -176,6 +190,11 @@ class Devedor(db.Model):
     # Relacionamentos
     titulos = db.relationship('Titulo', backref='devedor', lazy='dynamic')
     
+    @validates('documento')
+    def _atualizar_documento_normalizado(self, key, documento):
+        self.documento_normalizado = normalizar_documento(documento)
+        return documento
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -198,6 +217,8 @@ class Desistencia(db.Model):
     status = db.Column(db.String(20), index=True)  # Aprovada, Pendente, Rejeitada
     data_solicitacao = db.Column(db.DateTime, default=datetime.utcnow)
     data_processamento = db.Column(db.DateTime, nullable=True)
+    hash_arquivo = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 do arquivo enviado
+    remessa_id = db.Column(db.Integer, db.ForeignKey('remessas.id'), nullable=True, index=True)  # Arquivo de desistências de origem
     
     # Metadados
     usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -218,7 +239,8 @@ class Desistencia(db.Model):
             'data_solicitacao': self.data_solicitacao.isoformat() if self.data_solicitacao else None,
             'data_processamento': self.data_processamento.isoformat() if self.data_processamento else None,
             'usuario_id': self.usuario_id,
-            'usuario_processamento_id': self.usuario_processamento_id
+            'usuario_processamento_id': self.usuario_processamento_id,
+            'remessa_id': self.remessa_id
         }
 
 class Erro(db.Model):
@@ -266,7 +288,10 @@ class AutorizacaoCancelamento(db.Model):
     quantidade_solicitacoes = db.Column(db.Integer, default=0)
     sequencia_registro = db.Column(db.String(5), nullable=True)
     data_processamento = db.Column(db.DateTime, nullable=True)
-    status = db.Column(db.String(20), index=True)  # Processado, Erro, Pendente
+    status = db.Column(db.String(20), index=True)  # Processado, Erro, Pendente, Processando
+    hash_arquivo = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 do arquivo enviado
+    task_id = db.Column(db.String(50), nullable=True)  # ID da tarefa assíncrona
+    linhas_processadas = db.Column(db.Integer, default=0)  # Última linha com transações gravadas (retomada)
     
     # Metadados
     usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -289,6 +314,9 @@ class AutorizacaoCancelamento(db.Model):
             'status': self.status,
             'usuario_id': self.usuario_id,
             'data_upload': self.data_upload.isoformat() if self.data_upload else None,
+            'hash_arquivo': self.hash_arquivo,
+            'task_id': self.task_id,
+            'linhas_processadas': self.linhas_processadas,
             'transacoes_count': self.transacoes.count()
         }
 
@@ -332,4 +360,122 @@ class TransacaoAutorizacaoCancelamento(db.Model):
             'sequencia_registro': self.sequencia_registro,
             'status': self.status,
             'data_processamento': self.data_processamento.isoformat() if self.data_processamento else None
-        }
\ No newline at end of file
+        }
+
+class Task(db.Model):
+    """Modelo para tarefas assíncronas persistentes (fila compartilhada entre workers)"""
+    __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('idx_tasks_status_criacao', 'status', 'data_criacao'),
+        db.Index('idx_tasks_tenant_status', 'tenant', 'status'),
+        db.Index('idx_tasks_tenant_inicio', 'tenant', 'data_inicio'),
+        # Só as tarefas pendentes: agregação por tenant do escalonamento sem ler o histórico
+        db.Index('idx_tasks_pendentes_tenant', 'tenant', 'prioridade', 'data_criacao',
+                 postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+    )
+    
+    id = db.Column(db.String(50), primary_key=True)
+    descricao = db.Column(db.String(255))
+    tipo = db.Column(db.String(100), index=True)  # Nome da função da tarefa
+    funcao = db.Column(db.String(255), nullable=False)  # Caminho "modulo:funcao"
+    argumentos = db.Column(db.Text)  # JSON com args e kwargs
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    prioridade = db.Column(db.Integer, nullable=False, default=0)  # Maior valor é executado antes
+    usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    uf = db.Column(db.String(2), nullable=True)
+    tenant = db.Column(db.String(50), nullable=True)  # "usuario_id:uf", unidade de justiça do escalonamento
+    grupo = db.Column(db.String(50), nullable=True, index=True)  # Grupo de tarefas enfileiradas juntas (ex.: upload em lote)
+    progresso = db.Column(db.Integer, default=0)
+    resultado = db.Column(db.Text, nullable=True)  # JSON
+    erro = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # Worker que reservou a tarefa
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_inicio = db.Column(db.DateTime, nullable=True)
+    data_fim = db.Column(db.DateTime, nullable=True)
+    heartbeat = db.Column(db.DateTime, nullable=True)  # Último sinal de vida do worker
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=1)
+    proxima_execucao = db.Column(db.DateTime, nullable=True)  # Retentativa agendada (backoff)
+    erro_detalhe = db.Column(db.Text, nullable=True)  # Traceback da última falha
+    versao = db.Column(db.Integer, nullable=False, default=1)  # Incrementada a cada alteração de estado
+    
+    def to_dict(self):
+        return {
+            'task_id': self.id,
+            'description': self.descricao,
+            'task_type': self.tipo,
+            'status': self.status,
+            'priority': self.prioridade,
+            'usuario_id': self.usuario_id,
+            'uf': self.uf,
+            'group_id': self.grupo,
+            'progress': self.progresso or 0,
+            'created_at': self.data_criacao.isoformat() if self.data_criacao else None,
+            'start_time': self.data_inicio.isoformat() if self.data_inicio else None,
+            'end_time': self.data_fim.isoformat() if self.data_fim else None,
+            'result': json.loads(self.resultado) if self.resultado else None,
+            'error': self.erro,
+            'attempts': self.tentativas or 0,
+            'max_attempts': self.max_tentativas,
+            'next_run_at': self.proxima_execucao.isoformat() if self.proxima_execucao else None,
+            'duration': (self.data_fim - self.data_inicio).total_seconds()
+                        if self.data_inicio and self.data_fim else None
+        }
+
+
+class Agendamento(db.Model):
+    """Modelo para o estado dos agendamentos periódicos (compartilhado entre workers)"""
+    __tablename__ = 'agendamentos'
+    
+    nome = db.Column(db.String(100), primary_key=True)
+    proxima_execucao = db.Column(db.DateTime, nullable=False)
+    ultima_execucao = db.Column(db.DateTime, nullable=True)
+    ultima_task_id = db.Column(db.String(50), nullable=True)  # Tarefa enfileirada na última execução
+
+
+class TokenRevogado(db.Model):
+    """Modelo para tokens de acesso revogados no logout (compartilhado entre workers)"""
+    __tablename__ = 'tokens_revogados'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Ordem de revogação (sincronização incremental)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)  # Quando o token expiraria
+
+
+class UploadFragmentado(db.Model):
+    """Modelo para uploads de arquivo em partes (retomáveis), antes de gerar a remessa"""
+    __tablename__ = 'uploads_fragmentados'
+    
+    id = db.Column(db.String(32), primary_key=True)  # UUID (hex)
+    nome_arquivo = db.Column(db.String(100))
+    uf = db.Column(db.String(2))
+    tipo = db.Column(db.String(20))  # Remessa, Desistência
+    descricao = db.Column(db.Text, nullable=True)
+    tamanho = db.Column(db.BigInteger, nullable=False)  # Tamanho total declarado, em bytes
+    bytes_recebidos = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes contíguos gravados desde o início
+    hash_esperado = db.Column(db.String(64), nullable=True)  # SHA-256 informado pelo cliente
+    status = db.Column(db.String(20), index=True)  # Em andamento, Concluído, Cancelado, Expirado
+    
+    # Relacionamentos
+    usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    remessa_id = db.Column(db.Integer, db.ForeignKey('remessas.id'), nullable=True)
+    remessa = db.relationship('Remessa')
+    
+    # Metadados
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'nome_arquivo': self.nome_arquivo,
+            'uf': self.uf,
+            'tipo': self.tipo,
+            'tamanho': self.tamanho,
+            'bytes_recebidos': self.bytes_recebidos,
+            'status': self.status,
+            'remessa_id': self.remessa_id,
+            'usuario_id': self.usuario_id,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
+            'data_atualizacao': self.data_atualizacao.isoformat() if self.data_atualizacao else None
+        }
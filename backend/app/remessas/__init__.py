@@ -2,4 +2,4 @@ from flask import Blueprint
 
 remessas = Blueprint('remessas', __name__)
 
-from . import routes
\ No newline at end of file
+from . import routes, routes_upload, task_routes
\ No newline at end of file
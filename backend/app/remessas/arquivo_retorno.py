@@ -0,0 +1,121 @@
+"""
+Geração dos arquivos de confirmação e de retorno de uma remessa
+
+Registros de largura fixa (200 posições): header (0), um registro por título
+(1) e trailer (9). A confirmação traz todos os títulos da remessa, com o
+protocolo e a situação na data da geração; o retorno traz só os títulos com
+situação final (STATUS_RETORNO) e a data da ocorrência.
+
+Os títulos são lidos com um cursor no servidor (``yield_per``) e cada lote é
+formatado e codificado de uma vez pelo ``EscritorLarguraFixa``: o arquivo é
+gerado em partes, sem ser montado em memória nem gravado em disco.
+"""
+from datetime import date
+from typing import Iterator
+from sqlalchemy import func, select
+from app import db
+from app.models import Devedor, Remessa, Titulo
+from app.utils.largura_fixa import Campo, EscritorLarguraFixa, Leiaute
+
+TAMANHO_REGISTRO = 200
+
+# Tipos de arquivo (parâmetro da rota) e o Remessa.tipo correspondente
+TIPOS_ARQUIVO = {'confirmacao': 'Confirmação', 'retorno': 'Retorno'}
+
+# Situações finais informadas no arquivo de retorno
+STATUS_RETORNO = ('Protestado', 'Pago', 'Cancelado')
+
+HEADER = Leiaute('header', TAMANHO_REGISTRO, [
+    Campo('tipo_arquivo', 1, 12),
+    Campo('uf', 12, 14),
+    Campo('data_movimento', 14, 22, 'data'),
+    Campo('remessa_id', 22, 32, 'inteiro'),
+    Campo('quantidade_registros', 32, 40, 'inteiro'),
+    Campo('sequencia_registro', 194, 200, 'inteiro'),
+])
+
+TRANSACAO = Leiaute('transacao', TAMANHO_REGISTRO, [
+    Campo('protocolo', 1, 21),
+    Campo('numero', 21, 41),
+    Campo('nosso_numero', 41, 56),
+    Campo('especie', 56, 66),
+    Campo('data_emissao', 66, 74, 'data'),
+    Campo('data_vencimento', 74, 82, 'data'),
+    Campo('valor', 82, 96, 'valor'),
+    Campo('documento_devedor', 96, 110),
+    Campo('nome_devedor', 110, 155),
+    Campo('status', 155, 175),
+    Campo('data_ocorrencia', 175, 183, 'data'),
+    Campo('sequencia_registro', 194, 200, 'inteiro'),
+])
+
+TRAILER = Leiaute('trailer', TAMANHO_REGISTRO, [
+    Campo('quantidade_registros', 1, 9, 'inteiro'),
+    Campo('soma_valores', 9, 27, 'valor'),
+    Campo('sequencia_registro', 194, 200, 'inteiro'),
+])
+
+LEIAUTES = {'0': HEADER, '1': TRANSACAO, '9': TRAILER}
+
+
+def _filtro(remessa: Remessa, tipo: str) -> list:
+    filtro = [Titulo.remessa_id == remessa.id]
+    if tipo == 'retorno':
+        filtro.append(Titulo.status.in_(STATUS_RETORNO))
+    return filtro
+
+
+def gerar_arquivo(remessa: Remessa, tipo: str, lote: int = 5000) -> Iterator[bytes]:
+    """
+    Gera o arquivo de confirmação ou de retorno da remessa, em partes
+
+    Args:
+        remessa: Remessa dos títulos
+        tipo: 'confirmacao' ou 'retorno' (TIPOS_ARQUIVO)
+        lote: Títulos lidos do cursor e formatados por vez
+
+    Yields:
+        bytes: Partes do arquivo, codificadas em latin-1
+    """
+    filtro = _filtro(remessa, tipo)
+    quantidade, soma = db.session.execute(
+        select(func.count(Titulo.id), func.coalesce(func.sum(Titulo.valor), 0)).where(*filtro)
+    ).one()
+
+    consulta = (
+        select(Titulo.protocolo, Titulo.numero, Titulo.nosso_numero, Titulo.especie,
+               Titulo.data_emissao, Titulo.data_vencimento, Titulo.valor, Titulo.status,
+               Devedor.documento.label('documento_devedor'), Devedor.nome.label('nome_devedor'),
+               Titulo.data_protesto,
+               (Titulo.data_atualizacao if tipo == 'retorno' else Titulo.data_cadastro).label('data_ocorrencia'))
+        .outerjoin(Devedor, Devedor.id == Titulo.devedor_id)
+        .where(*filtro)
+        .order_by(Titulo.id)
+        .execution_options(yield_per=lote)
+    )
+
+    def blocos():
+        yield '0', [{
+            'tipo_arquivo': TIPOS_ARQUIVO[tipo].upper(),
+            'uf': remessa.uf,
+            'data_movimento': date.today(),
+            'remessa_id': remessa.id,
+            'quantidade_registros': quantidade,
+            'sequencia_registro': 1,
+        }]
+        sequencia = 2
+        for linhas in db.session.execute(consulta).mappings().partitions():
+            colunas = {'sequencia_registro': range(sequencia, sequencia + len(linhas))}
+            if tipo == 'retorno':
+                # Data do protesto ou, para pagos e cancelados, da última atualização do título
+                colunas['data_ocorrencia'] = [linha['data_protesto'] or linha['data_ocorrencia'] for linha in linhas]
+            yield '1', linhas, colunas
+            sequencia += len(linhas)
+        yield '9', [{'quantidade_registros': quantidade, 'soma_valores': soma, 'sequencia_registro': sequencia}]
+
+    return EscritorLarguraFixa(LEIAUTES).escrever(blocos())
+
+
+def nome_arquivo(remessa: Remessa, tipo: str) -> str:
+    """Nome do arquivo para download (ex.: RETORNO_SP_000123_20261016.txt)"""
+    return f"{tipo.upper()}_{remessa.uf or 'XX'}_{remessa.id:06d}_{date.today():%Y%m%d}.txt"
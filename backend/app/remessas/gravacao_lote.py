@@ -0,0 +1,156 @@
+"""
+Gravação em lote de títulos, credores e devedores durante a ingestão
+
+No PostgreSQL com psycopg2 (``cursor.copy_expert``) cada lote é copiado com
+``COPY`` para uma tabela temporária de staging (``ON COMMIT DELETE ROWS``) e
+gravado com comandos set-based: credores e devedores novos (``ON CONFLICT`` no
+documento normalizado), a reserva dos IDs dos títulos na sequência, associados
+à posição de cada registro, e os títulos com os IDs das partes resolvidos pelo
+índice único. Nos demais bancos e drivers (ex.: SQLite em execução local) as
+partes são resolvidas por ``resolver_partes`` e os títulos gravados com
+executemany.
+
+Tudo é executado na transação da sessão; quem chama decide quando confirmar
+(ex.: a cada REMESSA_CHUNK_SIZE títulos).
+"""
+import io
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import insert, text
+from app import db
+from app.models import Titulo, Credor, Devedor
+from app.utils.partes import normalizar_documento, resolver_partes
+from .validacao import CAMPOS_PARTE
+
+# Registro aceito para gravação: (colunas do título, credor ou None, devedor)
+Registro = Tuple[Dict[str, Any], Optional[Dict[str, Any]], Dict[str, Any]]
+
+CAMPOS_TITULO = ('numero', 'protocolo', 'valor', 'data_emissao', 'data_vencimento',
+                 'especie', 'aceite', 'nosso_numero', 'status')
+
+COLUNAS_STAGING = (
+    ('posicao', 'integer'),
+    ('titulo_id', 'integer'),
+    ('numero', 'varchar(50)'),
+    ('protocolo', 'varchar(50)'),
+    ('valor', 'numeric(10, 2)'),
+    ('data_emissao', 'date'),
+    ('data_vencimento', 'date'),
+    ('especie', 'varchar(50)'),
+    ('aceite', 'boolean'),
+    ('nosso_numero', 'varchar(50)'),
+    ('status', 'varchar(20)'),
+) + tuple(
+    (f'{parte}_{campo}', 'varchar(255)')
+    for parte in ('credor', 'devedor') for campo in CAMPOS_PARTE + ('documento_normalizado',)
+)
+
+STAGING_TABLE = 'staging_titulos'
+
+
+def _valor_copy(valor) -> str:
+    """Campo no formato texto do COPY: NULL como \\N e barra, tabulação e quebras escapadas"""
+    if valor is None:
+        return '\\N'
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class TituloBulkWriter:
+    """Grava lotes de títulos de uma remessa, resolvendo credores e devedores"""
+
+    def __init__(self, remessa_id: int, use_copy: bool = None):
+        self.remessa_id = remessa_id
+        if use_copy is None:
+            use_copy = db.engine.dialect.name == 'postgresql'
+        self.use_copy = use_copy
+
+    def write(self, registros: List[Registro]) -> List[int]:
+        """
+        Grava um lote de títulos (sem confirmar a transação)
+
+        Returns:
+            List[int]: IDs dos títulos inseridos, na ordem dos registros
+        """
+        if not registros:
+            return []
+        if self.use_copy:
+            return self._write_copy(registros)
+        return self._write_executemany(registros)
+
+    def _write_executemany(self, registros: List[Registro]) -> List[int]:
+        credores = resolver_partes(Credor, [credor for _, credor, _ in registros if credor])
+        devedores = resolver_partes(Devedor, [devedor for _, _, devedor in registros])
+
+        return list(db.session.execute(insert(Titulo).returning(Titulo.id, sort_by_parameter_order=True), [
+            dict(titulo,
+                 remessa_id=self.remessa_id,
+                 credor_id=credores.get(normalizar_documento(credor['documento'])) if credor else None,
+                 devedor_id=devedores[normalizar_documento(devedor['documento'])])
+            for titulo, credor, devedor in registros
+        ]).scalars())
+
+    def _write_copy(self, registros: List[Registro]) -> List[int]:
+        connection = db.session.connection()
+        cursor = connection.connection.cursor()
+        try:
+            if not hasattr(cursor, 'copy_expert'):
+                # Driver sem COPY no estilo psycopg2: executemany para este e os próximos lotes
+                self.use_copy = False
+                return self._write_executemany(registros)
+
+            connection.execute(text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                f"({', '.join(f'{nome} {tipo}' for nome, tipo in COLUNAS_STAGING)}) ON COMMIT DELETE ROWS"
+            ))
+            # Lote anterior ainda não confirmado (ex.: chamadas consecutivas na mesma transação)
+            connection.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+
+            # Formato texto: NULL (\N) distinto de texto vazio
+            colunas = [nome for nome, _ in COLUNAS_STAGING if nome != 'titulo_id']
+            buffer = io.StringIO()
+            for posicao, (titulo, credor, devedor) in enumerate(registros):
+                linha = [posicao] + [titulo.get(campo) for campo in CAMPOS_TITULO]
+                for parte in (credor, devedor):
+                    linha += [(parte or {}).get(campo) for campo in CAMPOS_PARTE]
+                    linha.append(normalizar_documento((parte or {}).get('documento')))
+                buffer.write('\t'.join(_valor_copy(valor) for valor in linha))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(colunas)}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
+
+        for tabela, parte in (('credores', 'credor'), ('devedores', 'devedor')):
+            connection.execute(text(f"""
+                INSERT INTO {tabela} (nome, documento, documento_normalizado, endereco, cidade, uf, cep)
+                SELECT DISTINCT ON (s.{parte}_documento_normalizado)
+                       s.{parte}_nome, s.{parte}_documento, s.{parte}_documento_normalizado,
+                       s.{parte}_endereco, s.{parte}_cidade, s.{parte}_uf, s.{parte}_cep
+                FROM {STAGING_TABLE} s
+                WHERE s.{parte}_documento_normalizado IS NOT NULL
+                ORDER BY s.{parte}_documento_normalizado, s.posicao
+                ON CONFLICT (documento_normalizado) DO NOTHING
+            """))
+
+        # IDs reservados na sequência e associados explicitamente à posição de cada registro
+        ids = [None] * len(registros)
+        for posicao, titulo_id in connection.execute(text(f"""
+            UPDATE {STAGING_TABLE}
+            SET titulo_id = nextval(pg_get_serial_sequence('titulos', 'id'))
+            RETURNING posicao, titulo_id
+        """)):
+            ids[posicao] = titulo_id
+
+        connection.execute(text(f"""
+            INSERT INTO titulos (id, numero, protocolo, valor, data_emissao, data_vencimento, especie,
+                                 aceite, nosso_numero, status, remessa_id, credor_id, devedor_id,
+                                 data_cadastro, data_atualizacao)
+            SELECT s.titulo_id, s.numero, s.protocolo, s.valor, s.data_emissao, s.data_vencimento, s.especie,
+                   s.aceite, s.nosso_numero, s.status, :remessa_id,
+                   (SELECT c.id FROM credores c WHERE c.documento_normalizado = s.credor_documento_normalizado),
+                   (SELECT d.id FROM devedores d WHERE d.documento_normalizado = s.devedor_documento_normalizado),
+                   :agora, :agora
+            FROM {STAGING_TABLE} s
+        """), {'remessa_id': self.remessa_id, 'agora': datetime.utcnow()})
+        return ids
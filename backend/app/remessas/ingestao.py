@@ -0,0 +1,311 @@
+"""
+Motor de ingestão de arquivos XML de remessa
+
+O arquivo é lido de forma incremental (``iterparse``): cada elemento
+``<titulo>`` é convertido em registro assim que termina de ser lido e
+descartado em seguida, de modo que o uso de memória não depende do tamanho do
+arquivo. Os registros são gravados em lotes (REMESSA_CHUNK_SIZE) pelo
+``TituloBulkWriter`` (COPY + INSERT ... SELECT no PostgreSQL), com uma consulta
+por lote para detectar protocolos já cadastrados.
+
+A validação dos campos (``validacao.validar_lote``) é CPU-bound e, para
+arquivos com mais de um lote, é distribuída em um pool de processos
+(VALIDACAO_WORKERS) enquanto o processo principal lê o XML e grava os lotes
+já validados, na ordem do arquivo.
+
+Layout esperado (tags sem distinção de maiúsculas; namespaces são ignorados)::
+
+    <remessa>
+      <titulo>
+        <numero>123</numero>
+        <protocolo>2024000001</protocolo>
+        <valor>1500.00</valor>                      (ou 1.500,00)
+        <data_emissao>2024-01-10</data_emissao>     (ou 10/01/2024)
+        <data_vencimento>2024-02-10</data_vencimento>
+        <especie>DMI</especie>
+        <aceite>S</aceite>
+        <nosso_numero>000123</nosso_numero>
+        <credor>
+          <nome/><documento/><endereco/><cidade/><uf/><cep/>
+        </credor>
+        <devedor>
+          <nome/><documento/><endereco/><cidade/><uf/><cep/>
+        </devedor>
+      </titulo>
+      ...
+    </remessa>
+
+Os títulos podem estar agrupados em qualquer elemento (ex.: ``<titulos>``).
+O arquivo pode ser enviado compactado (``.xml.gz`` ou ``.zip`` com um ou mais
+XMLs); a descompactação é feita em fluxo, direto para o parser.
+Títulos inválidos não interrompem o processamento: são registrados como erros
+de validação da remessa.
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select, insert
+from app import db
+from app.models import Titulo, Erro
+from app.utils.arquivos_compactados import ArquivoEntrada
+from .gravacao_lote import TituloBulkWriter
+from .validacao import validar_lote, Resultado
+
+
+def _local_name(tag: str) -> str:
+    """Nome da tag sem namespace, em minúsculas"""
+    return tag.rsplit('}', 1)[-1].lower()
+
+
+def _element_to_dict(elem) -> Dict[str, Any]:
+    """Converte um elemento em dicionário (filhos com filhos viram dicionários aninhados)"""
+    dados = {}
+    for filho in elem:
+        if len(filho):
+            dados[_local_name(filho.tag)] = _element_to_dict(filho)
+        else:
+            dados[_local_name(filho.tag)] = (filho.text or '').strip()
+    return dados
+
+
+def iter_registros(arquivo, tag: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê os registros (elementos ``<tag>``) de um XML de forma incremental
+
+    Cada registro é removido da árvore logo após ser convertido, mantendo
+    constante o uso de memória.
+
+    Args:
+        arquivo: Caminho ou arquivo aberto em modo binário
+        tag: Nome do elemento de cada registro, em minúsculas (ex.: 'titulo')
+
+    Yields:
+        Dict[str, Any]: Dados de um registro
+    """
+    pilha = []
+    for evento, elem in ET.iterparse(arquivo, events=('start', 'end')):
+        if evento == 'start':
+            pilha.append(elem)
+            continue
+        pilha.pop()
+        if _local_name(elem.tag) == tag:
+            yield _element_to_dict(elem)
+            elem.clear()
+            if pilha:
+                pilha[-1].remove(elem)
+
+
+def iter_titulos(arquivo) -> Iterator[Dict[str, Any]]:
+    """Lê os títulos de um XML de remessa de forma incremental"""
+    return iter_registros(arquivo, 'titulo')
+
+
+_pool = None
+_pool_workers = 0
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_validation_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool de validação compartilhado pelo processo (criado sob demanda)"""
+    global _pool, _pool_workers, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers or _pool_pid != os.getpid():
+            if _pool is not None and _pool_pid == os.getpid():
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_validation_pool():
+    """Descarta o pool (ex.: após um worker ser encerrado abruptamente)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+atexit.register(_discard_validation_pool)
+
+
+class RemessaIngestor:
+    """Importa os títulos de um arquivo XML para uma remessa, em lotes"""
+
+    def __init__(self, remessa_id: int, chunk_size: int = 1000,
+                 progress_callback: Callable[[int], None] = None, workers: int = 0,
+                 limite_descompactado: Optional[int] = None):
+        self.remessa_id = remessa_id
+        self.chunk_size = max(1, chunk_size)
+        self.progress_callback = progress_callback
+        self.workers = max(0, workers or 0)
+        self.limite_descompactado = limite_descompactado
+        self.writer = TituloBulkWriter(remessa_id)
+        self.lidos = 0
+        self.inseridos = 0
+        self.erros = 0
+        self.avisos = 0
+
+    def run(self, file_path: str) -> Dict[str, int]:
+        """
+        Processa o arquivo, gravando e confirmando cada lote
+
+        Returns:
+            Dict[str, int]: Títulos lidos, inseridos, rejeitados e avisos
+        """
+        with ArquivoEntrada(file_path, ('.xml',), self.limite_descompactado) as entrada:
+            for resultados in self._validar(self._lotes(entrada)):
+                self._gravar_lote(resultados)
+                # Progresso pela posição de leitura do arquivo (compactado, se for o caso)
+                self._report(entrada.progresso())
+
+        return {'lidos': self.lidos, 'titulos': self.inseridos, 'erros': self.erros,
+                'avisos': self.avisos}
+
+    def _report(self, progresso: int):
+        if self.progress_callback:
+            self.progress_callback(progresso)
+
+    def _lotes(self, entrada: ArquivoEntrada) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        lote = []
+        for _, stream in entrada.arquivos():
+            for dados in iter_titulos(stream):
+                self.lidos += 1
+                lote.append((self.lidos, dados))
+                if len(lote) >= self.chunk_size:
+                    yield lote
+                    lote = []
+        if lote:
+            yield lote
+
+    def _validar(self, lotes: Iterable[List[Tuple[int, Dict[str, Any]]]]) -> Iterator[List[Resultado]]:
+        """Valida os lotes, em paralelo quando houver mais de um, preservando a ordem"""
+        lotes = iter(lotes)
+        primeiros = list(itertools.islice(lotes, 2))
+        if self.workers < 1 or len(primeiros) < 2:
+            # Arquivo de um único lote: o custo de iniciar processos não compensa
+            for lote in itertools.chain(primeiros, lotes):
+                yield validar_lote(lote)
+            return
+
+        pool = _get_validation_pool(self.workers)
+        # Limite de lotes em validação: mantém a memória constante e os workers ocupados
+        pendentes = deque()
+        try:
+            for lote in itertools.chain(primeiros, lotes):
+                pendentes.append(pool.submit(validar_lote, lote))
+                if len(pendentes) >= self.workers * 2:
+                    yield pendentes.popleft().result()
+            while pendentes:
+                yield pendentes.popleft().result()
+        except BrokenProcessPool:
+            _discard_validation_pool()
+            raise
+        finally:
+            # Lotes ainda não validados quando a ingestão é interrompida
+            for futuro in pendentes:
+                futuro.cancel()
+
+    def validar_arquivo(self, file_path: str, relatorio) -> Dict[str, int]:
+        """
+        Validação prévia (``validate_only``): executa a leitura e as validações
+        da ingestão, sem gravar no banco, registrando as ocorrências no relatório
+
+        Args:
+            file_path: Arquivo enviado
+            relatorio: RelatorioValidacao que recebe as ocorrências
+
+        Returns:
+            Dict[str, int]: Títulos lidos, que seriam aceitos e rejeitados
+        """
+        aceitos = 0
+        vistos = set()
+        with ArquivoEntrada(file_path, ('.xml',), self.limite_descompactado) as entrada:
+            for resultados in self._validar(self._lotes(entrada)):
+                protocolos = {registro[0]['protocolo'] for _, _, registro, _ in resultados
+                              if registro is not None and registro[0]['protocolo']}
+                existentes = set()
+                if protocolos:
+                    existentes = set(db.session.execute(
+                        select(Titulo.protocolo).where(Titulo.protocolo.in_(list(protocolos)))
+                    ).scalars())
+
+                for posicao, numero, registro, mensagens in resultados:
+                    if registro is None:
+                        relatorio.registrar(posicao, mensagens[0], referencia=numero)
+                        continue
+                    protocolo = registro[0]['protocolo']
+                    if protocolo and protocolo in existentes:
+                        relatorio.registrar(posicao, f'protocolo já cadastrado: {protocolo}', referencia=numero)
+                        continue
+                    if protocolo and protocolo in vistos:
+                        relatorio.registrar(posicao, f'protocolo repetido no arquivo: {protocolo}',
+                                            referencia=numero)
+                        continue
+                    if protocolo:
+                        vistos.add(protocolo)
+                    for mensagem in mensagens:
+                        relatorio.registrar(posicao, mensagem, referencia=numero, nivel='aviso')
+                    aceitos += 1
+
+        relatorio.registros = self.lidos
+        return {'lidos': self.lidos, 'titulos': aceitos, 'erros': self.lidos - aceitos}
+
+    def _gravar_lote(self, resultados: List[Resultado]):
+        agora = datetime.utcnow()
+        erros = []
+        validos = []
+        for posicao, numero, registro, mensagens in resultados:
+            if registro is None:
+                erros.append(f"Título {posicao} ({numero or 'sem número'}): {mensagens[0]}")
+            else:
+                validos.append((posicao, registro, mensagens))
+
+        # Protocolos já cadastrados ou repetidos no próprio arquivo
+        protocolos = {registro[0]['protocolo'] for _, registro, _ in validos if registro[0]['protocolo']}
+        existentes = set()
+        if protocolos:
+            existentes = set(db.session.execute(
+                select(Titulo.protocolo).where(Titulo.protocolo.in_(list(protocolos)))
+            ).scalars())
+
+        aceitos = []
+        avisos = []
+        for posicao, registro, mensagens in validos:
+            titulo = registro[0]
+            protocolo = titulo['protocolo']
+            if protocolo and protocolo in existentes:
+                erros.append(f"Título {posicao} ({titulo['numero']}): protocolo {protocolo} já cadastrado")
+                continue
+            if protocolo:
+                existentes.add(protocolo)
+            avisos.extend((len(aceitos), f"Título {posicao} ({titulo['numero']}): {mensagem}")
+                          for mensagem in mensagens)
+            aceitos.append(registro)
+
+        ids = self.writer.write(aceitos)
+        # Rejeitados ficam vinculados só à remessa; avisos, ao título gravado
+        linhas = [(None, mensagem) for mensagem in erros]
+        linhas += [(ids[indice], mensagem) for indice, mensagem in avisos]
+        if linhas:
+            db.session.execute(insert(Erro), [
+                {'remessa_id': self.remessa_id, 'titulo_id': titulo_id, 'tipo': 'Validação',
+                 'mensagem': mensagem, 'data_ocorrencia': agora}
+                for titulo_id, mensagem in linhas
+            ])
+        db.session.commit()
+
+        self.inseridos += len(ids)
+        self.erros += len(erros)
+        self.avisos += len(avisos)
@@ -0,0 +1,176 @@
+"""
+Ingestão de arquivos XML de desistência
+
+Assim como a remessa de títulos, o arquivo é lido de forma incremental
+(``iter_registros``) e processado em lotes (REMESSA_CHUNK_SIZE): para cada
+lote, os títulos são localizados pelo protocolo com uma única consulta, as
+desistências são inseridas em bloco e os registros sem título correspondente
+são gravados, também em bloco, como erros de validação da remessa.
+
+Layout esperado (tags sem distinção de maiúsculas; namespaces são ignorados)::
+
+    <desistencias>
+      <desistencia>
+        <protocolo>2024000001</protocolo>
+        <numero>123</numero>                        (opcional, só para identificação)
+        <motivo>Pagamento efetuado</motivo>         (opcional)
+        <observacoes>...</observacoes>              (opcional)
+      </desistencia>
+      ...
+    </desistencias>
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, insert
+from app import db
+from app.models import Titulo, Desistencia, Erro
+from app.utils.arquivos_compactados import ArquivoEntrada
+from .ingestao import iter_registros
+
+MOTIVO_PADRAO = 'Desistência enviada via arquivo de remessa'
+
+# Desistências que impedem uma nova solicitação para o mesmo título
+STATUS_ATIVOS = ('Pendente', 'Aprovada')
+
+
+class DesistenciaIngestor:
+    """Importa as desistências de um arquivo XML para uma remessa, em lotes"""
+
+    def __init__(self, remessa_id: int, usuario_id: Optional[int], chunk_size: int = 1000,
+                 progress_callback: Callable[[int], None] = None,
+                 limite_descompactado: Optional[int] = None):
+        self.remessa_id = remessa_id
+        self.usuario_id = usuario_id
+        self.chunk_size = max(1, chunk_size)
+        self.progress_callback = progress_callback
+        self.limite_descompactado = limite_descompactado
+        self.lidos = 0
+        self.inseridas = 0
+        self.erros = 0
+
+    def run(self, file_path: str) -> Dict[str, int]:
+        """
+        Processa o arquivo, gravando e confirmando cada lote
+
+        Returns:
+            Dict[str, int]: Registros lidos, desistências inseridas e rejeitadas
+        """
+        with ArquivoEntrada(file_path, ('.xml',), self.limite_descompactado) as entrada:
+            for lote in self._lotes(entrada):
+                self._gravar_lote(lote)
+                self._report(entrada.progresso())
+
+        return {'lidos': self.lidos, 'desistencias': self.inseridas, 'erros': self.erros}
+
+    def _report(self, progresso: int):
+        if self.progress_callback:
+            self.progress_callback(progresso)
+
+    def validar_arquivo(self, file_path: str, relatorio) -> Dict[str, int]:
+        """
+        Validação prévia (``validate_only``): localiza os títulos de cada
+        registro, sem gravar no banco, registrando as ocorrências no relatório
+
+        Returns:
+            Dict[str, int]: Registros lidos, desistências que seriam aceitas e rejeitadas
+        """
+        aceitas = 0
+        # Sem gravação, títulos repetidos em lotes diferentes são detectados aqui
+        solicitados = set()
+        with ArquivoEntrada(file_path, ('.xml',), self.limite_descompactado) as entrada:
+            for lote in self._lotes(entrada):
+                validas, erros = self._classificar(lote)
+                for posicao, referencia, _, mensagem in erros:
+                    relatorio.registrar(posicao, mensagem, referencia=referencia)
+                for posicao, dados, titulo_id in validas:
+                    if titulo_id in solicitados:
+                        relatorio.registrar(posicao, 'título já possui desistência',
+                                            referencia=dados.get('protocolo'))
+                        continue
+                    solicitados.add(titulo_id)
+                    aceitas += 1
+
+        relatorio.registros = self.lidos
+        return {'lidos': self.lidos, 'desistencias': aceitas, 'erros': self.lidos - aceitas}
+
+    def _lotes(self, entrada: ArquivoEntrada) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+        lote = []
+        for _, stream in entrada.arquivos():
+            for dados in iter_registros(stream, 'desistencia'):
+                self.lidos += 1
+                lote.append((self.lidos, dados))
+                if len(lote) >= self.chunk_size:
+                    yield lote
+                    lote = []
+        if lote:
+            yield lote
+
+    def _classificar(self, lote: List[Tuple[int, Dict[str, Any]]]) -> Tuple[list, list]:
+        """
+        Localiza os títulos do lote pelo protocolo
+
+        Returns:
+            Tuple[list, list]: Desistências aceitas ``(posicao, dados, titulo_id)`` e
+            rejeitadas ``(posicao, referencia, titulo_id, mensagem)``
+        """
+        protocolos = {(dados.get('protocolo') or '').strip() for _, dados in lote} - {''}
+
+        # Títulos do lote (uma consulta) e os que já têm desistência ativa (outra)
+        titulos = {}
+        if protocolos:
+            titulos = dict(db.session.execute(
+                select(Titulo.protocolo, Titulo.id).where(Titulo.protocolo.in_(list(protocolos)))
+            ).all())
+        com_desistencia = set()
+        if titulos:
+            com_desistencia = set(db.session.execute(
+                select(Desistencia.titulo_id).where(
+                    Desistencia.titulo_id.in_(list(titulos.values())),
+                    Desistencia.status.in_(STATUS_ATIVOS)
+                )
+            ).scalars())
+
+        validas = []
+        erros = []
+        for posicao, dados in lote:
+            protocolo = (dados.get('protocolo') or '').strip()
+            referencia = protocolo or dados.get('numero') or None
+            titulo_id = titulos.get(protocolo)
+            if not protocolo:
+                erros.append((posicao, referencia, None, 'protocolo não informado'))
+            elif titulo_id is None:
+                erros.append((posicao, referencia, None, 'título não encontrado'))
+            elif titulo_id in com_desistencia:
+                erros.append((posicao, referencia, titulo_id, 'título já possui desistência'))
+            else:
+                # Também impede duas desistências do mesmo título no arquivo
+                com_desistencia.add(titulo_id)
+                validas.append((posicao, dados, titulo_id))
+        return validas, erros
+
+    def _gravar_lote(self, lote: List[Tuple[int, Dict[str, Any]]]):
+        agora = datetime.utcnow()
+        validas, erros = self._classificar(lote)
+
+        if validas:
+            db.session.execute(insert(Desistencia), [
+                {'titulo_id': titulo_id,
+                 'remessa_id': self.remessa_id,
+                 'motivo': (dados.get('motivo') or MOTIVO_PADRAO)[:255],
+                 'observacoes': dados.get('observacoes') or None,
+                 'status': 'Pendente',
+                 'data_solicitacao': agora,
+                 'usuario_id': self.usuario_id}
+                for _, dados, titulo_id in validas
+            ])
+        if erros:
+            db.session.execute(insert(Erro), [
+                {'remessa_id': self.remessa_id, 'titulo_id': titulo_id, 'tipo': 'Validação',
+                 'mensagem': f"Desistência {posicao} ({referencia or 'sem protocolo'}): {mensagem}",
+                 'data_ocorrencia': agora}
+                for posicao, referencia, titulo_id, mensagem in erros
+            ])
+        db.session.commit()
+
+        self.inseridas += len(validas)
+        self.erros += len(erros)
@@ -1,19 +1,20 @@
-import os
-import uuid
+import xml.etree.ElementTree as ET
 from datetime import datetime
-import xmltodict
 from flask import request, jsonify, current_app, g
 from app.auth.middleware import auth_required
+from app.auth.user_cache import get_user_snapshot, get_user_snapshots
 from werkzeug.utils import secure_filename
 from sqlalchemy import or_, and_
 from app import db
-from app.models import Remessa, Titulo, User, Credor, Devedor, Erro
+from app.models import Remessa, Titulo, User, Credor, Devedor, Erro, Desistencia
+from app.utils.uploads import salvar_upload, descartar_upload, buscar_reenvio
+from app.utils.arquivos_compactados import ArquivoEntrada, extensao_permitida, ERROS_COMPACTACAO
+from app.utils.validacao_previa import RelatorioValidacao, validate_only_solicitado, resposta_ocorrencias
 from . import remessas
 
 # Função auxiliar para verificar se o arquivo é permitido
 def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in {'xml'}
+    return extensao_permitida(filename, ('.xml',))
 
 @remessas.route('/upload', methods=['POST'])
 @auth_required()
@@ -32,7 +33,7 @@ def upload_remessa():
         name: file
         type: file
         required: true
-        description: Arquivo XML de remessa
+        description: Arquivo XML de remessa (ou compactado em .xml.gz/.zip)
       - in: formData
         name: uf
         type: string
@@ -43,7 +44,14 @@ def upload_remessa():
         type: string
         required: true
         description: Tipo de remessa (Remessa ou Desistência)
+      - in: formData
+        name: validate_only
+        type: boolean
+        required: false
+        description: Apenas valida o arquivo, sem gravar nem processar (retorna o resumo das ocorrências)
     responses:
+      200:
+        description: Arquivo idêntico já enviado (retorna a remessa existente) ou resumo da validação prévia
       201:
         description: Arquivo enviado com sucesso
       400:
@@ -53,7 +61,7 @@ def upload_remessa():
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
@@ -70,7 +78,7 @@ def upload_remessa():
     
     # Verificar se o arquivo é do tipo permitido
     if not allowed_file(file.filename):
-        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML é aceito'}), 415
+        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML (ou compactado em .xml.gz/.zip) é aceito'}), 415
     
     # Verificar se UF e tipo foram informados
     uf = request.form.get('uf')
@@ -83,16 +91,25 @@ def upload_remessa():
     if tipo not in ['Remessa', 'Desistência']:
         return jsonify({'message': 'Tipo inválido. Deve ser Remessa ou Desistência'}), 400
     
-    # Gerar nome único para o arquivo
+    # Salvar arquivo com nome único, calculando o hash do conteúdo
     filename = secure_filename(file.filename)
-    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{filename}"
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+    file_path, hash_arquivo = salvar_upload(file, current_app.config['UPLOAD_FOLDER'], filename)
     
-    # Criar diretório de upload se não existir
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Validação prévia: nada é gravado no banco e o arquivo é descartado
+    if validate_only_solicitado():
+        return _validar_previamente(file_path, filename, tipo, current_user.id)
     
-    # Salvar arquivo
-    file.save(file_path)
+    # Reenvio de um arquivo idêntico: retorna a remessa e a tarefa já existentes
+    existente = buscar_reenvio(Remessa, hash_arquivo, current_user.id, tipo=tipo, uf=uf)
+    if existente:
+        descartar_upload(file_path)
+        return jsonify({
+            'message': 'Arquivo já enviado anteriormente. Retornando a remessa existente.',
+            'remessa': existente.to_dict(),
+            'id': existente.id,
+            'task_id': existente.task_id,
+            'duplicado': True
+        }), 200
     
     # Criar registro de remessa no banco
     remessa = Remessa(
@@ -100,7 +117,8 @@ def upload_remessa():
         status='Pendente',
         uf=uf,
         tipo=tipo,
-        usuario_id=current_user.id
+        usuario_id=current_user.id,
+        hash_arquivo=hash_arquivo
     )
     
     # Adicionar descrição se fornecida
@@ -114,12 +132,20 @@ def upload_remessa():
     try:
         from app.utils.async_tasks import enqueue_task
         
+        # Desistências têm ingestão própria (títulos localizados por protocolo)
+        if tipo == 'Desistência':
+            funcao, descricao_tarefa = processar_desistencia, f"Processamento da desistência {remessa.id}"
+        else:
+            funcao, descricao_tarefa = processar_remessa, f"Processamento da remessa {remessa.id}"
+        
         # Enfileira a tarefa de processamento
         task_id = enqueue_task(
-            processar_remessa,
-            f"Processamento da remessa {remessa.id}",
+            funcao,
+            descricao_tarefa,
             remessa.id, 
-            file_path
+            file_path,
+            task_usuario_id=current_user.id,
+            task_uf=uf
         )
         
         # Atualiza a remessa com o ID da tarefa
@@ -150,6 +176,81 @@ def upload_remessa():
             'remessa': remessa.to_dict()
         }), 500
 
+def _validar_previamente(file_path, filename, tipo, usuario_id):
+    """
+    Executa a validação prévia (validate_only) de um arquivo de remessa ou desistência
+
+    Usa a mesma leitura e as mesmas validações do processamento, sem gravar no
+    banco. A resposta traz o resumo; as ocorrências ficam disponíveis, paginadas,
+    em GET /validacoes/<validacao_id>.
+    """
+    from .ingestao import RemessaIngestor
+    from .ingestao_desistencia import DesistenciaIngestor
+    
+    chunk_size = current_app.config.get('REMESSA_CHUNK_SIZE', 1000)
+    limite = current_app.config.get('UPLOAD_MAX_DESCOMPACTADO')
+    try:
+        with RelatorioValidacao(tipo, filename, usuario_id) as relatorio:
+            if tipo == 'Desistência':
+                DesistenciaIngestor(None, usuario_id, chunk_size=chunk_size,
+                                    limite_descompactado=limite).validar_arquivo(file_path, relatorio)
+            else:
+                RemessaIngestor(None, chunk_size=chunk_size,
+                                workers=current_app.config.get('VALIDACAO_WORKERS', 0),
+                                limite_descompactado=limite).validar_arquivo(file_path, relatorio)
+    except ET.ParseError as e:
+        return jsonify({'message': f'XML inválido: {str(e)}', 'valido': False}), 400
+    except ERROS_COMPACTACAO as e:
+        return jsonify({'message': f'Arquivo compactado inválido: {str(e)}', 'valido': False}), 400
+    except ValueError as e:
+        return jsonify({'message': str(e), 'valido': False}), 400
+    finally:
+        db.session.rollback()
+        descartar_upload(file_path)
+    
+    return jsonify(dict(relatorio.resumo(), message='Validação concluída. Nenhum dado foi gravado.')), 200
+
+# Rota para consultar as ocorrências de uma validação prévia
+@remessas.route('/validacoes/<validacao_id>', methods=['GET'])
+@auth_required()
+def get_validacao(validacao_id):
+    """
+    Obtém as ocorrências de uma validação prévia (validate_only), paginadas
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    parameters:
+      - name: validacao_id
+        in: path
+        type: string
+        required: true
+      - name: page
+        in: query
+        type: integer
+        default: 1
+      - name: per_page
+        in: query
+        type: integer
+        default: 100
+      - name: nivel
+        in: query
+        type: string
+        enum: [erro, aviso]
+      - name: formato
+        in: query
+        type: string
+        enum: [json, csv]
+        description: csv devolve todas as ocorrências para download
+    responses:
+      200:
+        description: Resumo e página de ocorrências (ou arquivo CSV)
+      404:
+        description: Relatório não encontrado ou expirado
+    """
+    return resposta_ocorrencias(validacao_id, get_user_snapshot(g.user.id if g.user else None))
+
 # Rota para enviar uma nova desistência
 @remessas.route('/desistencias', methods=['POST'])
 @auth_required()
@@ -168,7 +269,7 @@ def upload_desistencia():
         name: file
         type: file
         required: true
-        description: Arquivo XML de desistência
+        description: Arquivo XML de desistência (ou compactado em .xml.gz/.zip)
       - in: formData
         name: uf
         type: string
@@ -180,6 +281,8 @@ def upload_desistencia():
         required: false
         description: Descrição da desistência
     responses:
+      200:
+        description: Arquivo idêntico já enviado; retorna a remessa existente
       201:
         description: Arquivo enviado com sucesso
       400:
@@ -189,7 +292,7 @@ def upload_desistencia():
     """
     current_user = g.user
     user_id = current_user.id if current_user else None
-    current_user = User.query.get(user_id)
+    current_user = get_user_snapshot(user_id)
     
     if not current_user:
         return jsonify({'message': 'Usuário não encontrado'}), 404
@@ -206,7 +309,7 @@ def upload_desistencia():
     
     # Verificar se o arquivo é do tipo permitido
     if not allowed_file(file.filename):
-        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML é aceito'}), 415
+        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML (ou compactado em .xml.gz/.zip) é aceito'}), 415
     
     # Verificar se UF foi informada
     uf = request.form.get('uf')
@@ -215,16 +318,21 @@ def upload_desistencia():
     if not uf:
         return jsonify({'message': 'UF é obrigatória'}), 400
     
-    # Gerar nome único para o arquivo
+    # Salvar arquivo com nome único, calculando o hash do conteúdo
     filename = secure_filename(file.filename)
-    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{filename}"
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    
-    # Criar diretório de upload se não existir
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    file_path, hash_arquivo = salvar_upload(file, current_app.config['UPLOAD_FOLDER'], filename)
     
-    # Salvar arquivo
-    file.save(file_path)
+    # Reenvio de um arquivo idêntico: retorna a remessa e a tarefa já existentes
+    existente = buscar_reenvio(Remessa, hash_arquivo, current_user.id, tipo='Desistência', uf=uf)
+    if existente:
+        descartar_upload(file_path)
+        return jsonify({
+            'message': 'Arquivo já enviado anteriormente. Retornando a remessa existente.',
+            'remessa': existente.to_dict(),
+            'id': existente.id,
+            'task_id': existente.task_id,
+            'duplicado': True
+        }), 200
     
     # Criar registro de remessa do tipo desistência no banco
     remessa = Remessa(
@@ -232,7 +340,8 @@ def upload_desistencia():
         status='Pendente',
         uf=uf,
         tipo='Desistência',
-        usuario_id=current_user.id
+        usuario_id=current_user.id,
+        hash_arquivo=hash_arquivo
     )
     
     # Adicionar descrição se fornecida
@@ -251,7 +360,9 @@ def upload_desistencia():
             processar_desistencia,
             f"Processamento da desistência {remessa.id}",
             remessa.id, 
-            file_path
+            file_path,
+            task_usuario_id=current_user.id,
+            task_uf=uf
         )
         
         # Atualiza a remessa com o ID da tarefa
@@ -282,33 +393,132 @@ def upload_desistencia():
             'remessa': remessa.to_dict()
         }), 500
 
+# Função para processar remessa
+def processar_remessa(remessa_id, file_path):
+    """
+    Processa um arquivo XML de remessa, gravando os títulos em lotes
+
+    A leitura é incremental (memória constante) e o progresso é reportado à
+    tarefa. Pode ser executada novamente após uma falha: os títulos gravados
+    pela execução interrompida são descartados antes de reprocessar.
+    """
+    from app.utils.async_tasks import update_task_progress, get_current_task_id
+    from .ingestao import RemessaIngestor
+    
+    remessa = Remessa.query.get(remessa_id)
+    
+    if not remessa:
+        raise Exception('Remessa não encontrada')
+    
+    # Remessa já processada (ex.: tarefa reenfileirada): nada a refazer
+    if remessa.status == 'Processado':
+        return {'remessa_id': remessa.id, 'titulos': remessa.quantidade_titulos, 'reprocessada': False}
+    
+    task_id = get_current_task_id()
+    
+    try:
+        # Descartar o resultado parcial de uma tentativa anterior
+        Erro.query.filter_by(remessa_id=remessa.id, tipo='Validação').delete(synchronize_session=False)
+        Titulo.query.filter_by(remessa_id=remessa.id).delete(synchronize_session=False)
+        remessa.status = 'Processando'
+        db.session.commit()
+        
+        ingestor = RemessaIngestor(
+            remessa.id,
+            chunk_size=current_app.config.get('REMESSA_CHUNK_SIZE', 1000),
+            progress_callback=lambda progresso: update_task_progress(task_id, progresso),
+            workers=current_app.config.get('VALIDACAO_WORKERS', 0),
+            limite_descompactado=current_app.config.get('UPLOAD_MAX_DESCOMPACTADO')
+        )
+        try:
+            resumo = ingestor.run(file_path)
+        except ET.ParseError as e:
+            raise ValueError(f'XML inválido: {str(e)}')
+        except ERROS_COMPACTACAO as e:
+            raise ValueError(f'Arquivo compactado inválido: {str(e)}')
+        
+        # Atualizar status da remessa
+        remessa.quantidade_titulos = resumo['titulos']
+        remessa.status = 'Processado' if resumo['titulos'] or not resumo['erros'] else 'Erro'
+        remessa.data_processamento = datetime.utcnow()
+        db.session.commit()
+        
+        return dict(resumo, remessa_id=remessa.id)
+    
+    except Exception as e:
+        db.session.rollback()
+        
+        # Registrar erro
+        erro = Erro(
+            remessa_id=remessa.id,
+            tipo='Processamento',
+            mensagem=str(e),
+            data_ocorrencia=datetime.utcnow()
+        )
+        db.session.add(erro)
+        
+        # Atualizar status da remessa
+        remessa.status = 'Erro'
+        db.session.commit()
+        
+        raise e
+
 # Função para processar desistência
 def processar_desistencia(remessa_id, file_path):
     """
-    Processa um arquivo de desistência
+    Processa um arquivo XML de desistências, gravando-as em lotes
+
+    Os títulos são localizados pelo protocolo; registros sem título
+    correspondente são gravados como erros de validação. Pode ser executada
+    novamente após uma falha: as desistências gravadas pela execução
+    interrompida são descartadas antes de reprocessar.
     """
+    from app.utils.async_tasks import update_task_progress, get_current_task_id
+    from .ingestao_desistencia import DesistenciaIngestor
+    
     remessa = Remessa.query.get(remessa_id)
     
     if not remessa:
         raise Exception('Remessa não encontrada')
     
+    # Remessa já processada (ex.: tarefa reenfileirada): nada a refazer
+    if remessa.status == 'Processado':
+        return {'remessa_id': remessa.id, 'desistencias': remessa.quantidade_titulos, 'reprocessada': False}
+    
+    task_id = get_current_task_id()
+    
     try:
-        # Ler arquivo XML
-        with open(file_path, 'r', encoding='utf-8') as file:
-            xml_content = file.read()
-        
-        # Converter XML para dicionário
-        data = xmltodict.parse(xml_content)
+        # Descartar o resultado parcial de uma tentativa anterior
+        Erro.query.filter_by(remessa_id=remessa.id, tipo='Validação').delete(synchronize_session=False)
+        Desistencia.query.filter_by(remessa_id=remessa.id).delete(synchronize_session=False)
+        remessa.status = 'Processando'
+        db.session.commit()
         
-        # Implementação específica para desistências...
-        # Código para processar o XML de desistência
+        ingestor = DesistenciaIngestor(
+            remessa.id,
+            remessa.usuario_id,
+            chunk_size=current_app.config.get('REMESSA_CHUNK_SIZE', 1000),
+            progress_callback=lambda progresso: update_task_progress(task_id, progresso),
+            limite_descompactado=current_app.config.get('UPLOAD_MAX_DESCOMPACTADO')
+        )
+        try:
+            resumo = ingestor.run(file_path)
+        except ET.ParseError as e:
+            raise ValueError(f'XML inválido: {str(e)}')
+        except ERROS_COMPACTACAO as e:
+            raise ValueError(f'Arquivo compactado inválido: {str(e)}')
         
         # Atualizar status da remessa
-        remessa.status = 'Processado'
+        remessa.quantidade_titulos = resumo['desistencias']
+        remessa.status = 'Processado' if resumo['desistencias'] or not resumo['erros'] else 'Erro'
         remessa.data_processamento = datetime.utcnow()
         db.session.commit()
         
+        return dict(resumo, remessa_id=remessa.id)
+        
     except Exception as e:
+        db.session.rollback()
+        
         # Registrar erro
         erro = Erro(
             remessa_id=remessa.id,
@@ -509,6 +719,58 @@ def get_remessa(id):
     
     return jsonify(response), 200
 
+# Rota para gerar o arquivo de confirmação ou de retorno de uma remessa
+@remessas.route('/<int:id>/arquivo/<tipo>', methods=['GET'])
+@auth_required()
+def baixar_arquivo_retorno(id, tipo):
+    """
+    Gera o arquivo de confirmação ou de retorno de uma remessa (largura fixa, latin-1)
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+        description: ID da remessa
+      - name: tipo
+        in: path
+        type: string
+        enum: [confirmacao, retorno]
+        required: true
+        description: confirmacao (todos os títulos) ou retorno (títulos com situação final)
+    responses:
+      200:
+        description: Arquivo gerado em fluxo, sem ser montado em memória
+        content:
+          application/octet-stream:
+            schema:
+              type: string
+              format: binary
+      400:
+        description: Tipo de arquivo inválido
+      404:
+        description: Remessa não encontrada
+    """
+    from flask import Response, stream_with_context
+    from .arquivo_retorno import TIPOS_ARQUIVO, gerar_arquivo, nome_arquivo
+    
+    if tipo not in TIPOS_ARQUIVO:
+        return jsonify({'message': 'Tipo de arquivo inválido. Deve ser confirmacao ou retorno'}), 400
+    
+    remessa = Remessa.query.get(id)
+    
+    if not remessa:
+        return jsonify({'message': 'Remessa não encontrada'}), 404
+    
+    partes = gerar_arquivo(remessa, tipo, current_app.config.get('RETORNO_CHUNK_SIZE', 5000))
+    return Response(stream_with_context(partes), mimetype='application/octet-stream', headers={
+        'Content-Disposition': f'attachment; filename={nome_arquivo(remessa, tipo)}'
+    })
+
 @remessas.route('/estatisticas', methods=['GET'])
 @auth_required()
 def get_estatisticas():
@@ -651,6 +913,9 @@ def exportar_remessas():
     try:
         remessas = query.all()
         
+        # Carregar os usuários das remessas de uma vez (cache compartilhado)
+        usuarios = get_user_snapshots(remessa.usuario_id for remessa in remessas)
+        
         # Criar buffer para CSV
         si = StringIO()
         cw = csv.writer(si)
@@ -661,7 +926,7 @@ def exportar_remessas():
         
         # Escrever dados
         for remessa in remessas:
-            usuario = User.query.get(remessa.usuario_id)
+            usuario = usuarios.get(remessa.usuario_id)
             usuario_nome = usuario.nome_completo if usuario else 'N/A'
             
             cw.writerow([
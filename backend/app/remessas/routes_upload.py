@@ -0,0 +1,565 @@
+"""
+Upload de remessas em partes (retomável)
+
+Protocolo:
+    1. POST /uploads com nome_arquivo, tamanho, uf, tipo e sha256 (opcional aqui)
+    2. PUT /uploads/<id>?offset=N com os bytes da parte no corpo; o offset deve
+       ser no máximo bytes_recebidos (partes já enviadas podem ser reenviadas).
+       O cabeçalho X-Chunk-SHA256 permite validar cada parte
+    3. GET /uploads/<id> informa bytes_recebidos para retomar após uma queda
+    4. POST /uploads/<id>/finalizar confere o SHA-256 do arquivo completo, cria
+       a remessa e enfileira o processamento
+
+Cada parte é recebida em blocos em um arquivo temporário, sem transação nem
+bloqueio abertos durante a transferência; só então a sessão é bloqueada, o
+offset conferido e a parte copiada para o arquivo parcial. A memória usada não
+depende do tamanho da parte nem do arquivo.
+
+Também define o upload em lote (POST /upload/lote): vários arquivos em uma
+requisição, gravados em uma única transação e processados como um grupo de
+tarefas, cujo progresso agregado é consultado em /tasks/groups/<group_id>.
+"""
+
+import os
+import uuid
+from datetime import datetime
+from flask import request, jsonify, current_app, g
+from werkzeug.utils import secure_filename
+from app.auth.middleware import auth_required
+from app.auth.user_cache import get_user_snapshot
+from app import db
+from app.models import Remessa, Erro, UploadFragmentado
+from app.utils.uploads import (caminho_parcial, caminho_recebimento, gravar_parte, calcular_hash, nome_unico,
+                               salvar_upload, descartar_upload, buscar_reenvio)
+from . import remessas
+from .routes import allowed_file, processar_remessa, processar_desistencia
+
+STATUS_EM_ANDAMENTO = 'Em andamento'
+
+
+def _obter_upload(upload_id, bloquear=False):
+    """Sessão de upload do usuário atual (ou None se não existir ou não pertencer a ele)"""
+    current_user = get_user_snapshot(g.user.id if g.user else None)
+    if not current_user:
+        return None
+    query = UploadFragmentado.query.filter_by(id=upload_id)
+    if bloquear:
+        # Serializa partes simultâneas da mesma sessão (PostgreSQL)
+        query = query.with_for_update()
+    upload = query.first()
+    if upload and upload.usuario_id != current_user.id and not current_user.admin:
+        return None
+    return upload
+
+
+def _validar_hash(valor):
+    valor = (valor or '').strip().lower()
+    if valor and (len(valor) != 64 or any(c not in '0123456789abcdef' for c in valor)):
+        raise ValueError('sha256 deve ter 64 caracteres hexadecimais')
+    return valor or None
+
+
+@remessas.route('/uploads', methods=['POST'])
+@auth_required()
+def iniciar_upload_fragmentado():
+    """
+    Inicia um upload de remessa em partes
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required: [nome_arquivo, tamanho, uf, tipo]
+          properties:
+            nome_arquivo:
+              type: string
+            tamanho:
+              type: integer
+            uf:
+              type: string
+            tipo:
+              type: string
+            descricao:
+              type: string
+            sha256:
+              type: string
+    responses:
+      201:
+        description: Sessão de upload criada
+      400:
+        description: Dados inválidos
+      413:
+        description: Arquivo maior que o permitido
+      415:
+        description: Tipo de arquivo não suportado
+    """
+    current_user = get_user_snapshot(g.user.id if g.user else None)
+    if not current_user:
+        return jsonify({'message': 'Usuário não encontrado'}), 404
+
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('nome_arquivo') or '')
+    uf = data.get('uf')
+    tipo = data.get('tipo')
+
+    if not filename:
+        return jsonify({'message': 'nome_arquivo é obrigatório'}), 400
+    if not allowed_file(filename):
+        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML (ou compactado em .xml.gz/.zip) é aceito'}), 415
+    if not uf or not tipo:
+        return jsonify({'message': 'UF e tipo são obrigatórios'}), 400
+    if tipo not in ['Remessa', 'Desistência']:
+        return jsonify({'message': 'Tipo inválido. Deve ser Remessa ou Desistência'}), 400
+
+    try:
+        tamanho = int(data.get('tamanho'))
+    except (TypeError, ValueError):
+        tamanho = 0
+    if tamanho <= 0:
+        return jsonify({'message': 'tamanho inválido'}), 400
+    try:
+        hash_esperado = _validar_hash(data.get('sha256'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if tamanho > current_app.config.get('UPLOAD_MAX_SIZE', 2 * 1024 ** 3):
+        return jsonify({'message': 'Arquivo maior que o tamanho máximo permitido'}), 413
+
+    upload = UploadFragmentado(
+        id=uuid.uuid4().hex,
+        nome_arquivo=filename,
+        uf=uf,
+        tipo=tipo,
+        descricao=data.get('descricao'),
+        tamanho=tamanho,
+        bytes_recebidos=0,
+        hash_esperado=hash_esperado,
+        status=STATUS_EM_ANDAMENTO,
+        usuario_id=current_user.id
+    )
+
+    # Arquivo parcial criado vazio; as partes são gravadas nas suas posições
+    os.makedirs(os.path.dirname(caminho_parcial(upload.id)), exist_ok=True)
+    open(caminho_parcial(upload.id), 'wb').close()
+
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify(dict(upload.to_dict(),
+                        tamanho_parte=current_app.config.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))), 201
+
+
+@remessas.route('/uploads/<upload_id>', methods=['GET'])
+@auth_required()
+def status_upload_fragmentado(upload_id):
+    """
+    Consulta uma sessão de upload em partes (bytes já recebidos, para retomar)
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    responses:
+      200:
+        description: Estado da sessão
+      404:
+        description: Sessão não encontrada
+    """
+    upload = _obter_upload(upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload não encontrado'}), 404
+    return jsonify(upload.to_dict()), 200
+
+
+@remessas.route('/uploads/<upload_id>', methods=['PUT'])
+@auth_required()
+def enviar_parte_upload(upload_id):
+    """
+    Envia uma parte do arquivo (corpo da requisição) na posição informada
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    consumes:
+      - application/octet-stream
+    parameters:
+      - in: query
+        name: offset
+        type: integer
+        required: true
+        description: Posição da parte no arquivo (no máximo bytes_recebidos)
+      - in: header
+        name: X-Chunk-SHA256
+        type: string
+        required: false
+        description: SHA-256 da parte, conferido após a gravação
+    responses:
+      200:
+        description: Parte gravada
+      400:
+        description: Parte inválida ou checksum divergente
+      404:
+        description: Sessão não encontrada
+      409:
+        description: Offset fora de sequência ou sessão encerrada
+    """
+    upload = _obter_upload(upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload não encontrado'}), 404
+    if upload.status != STATUS_EM_ANDAMENTO:
+        return jsonify({'message': f'Upload {upload.status.lower()}', 'upload': upload.to_dict()}), 409
+
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+    except ValueError:
+        return jsonify({'message': 'offset inválido'}), 400
+    try:
+        hash_parte = _validar_hash(request.headers.get('X-Chunk-SHA256'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # Sem lacunas: a parte começa no máximo onde terminou a última recebida
+    if offset < 0 or offset > upload.bytes_recebidos:
+        return jsonify({'message': 'Offset fora de sequência', 'bytes_recebidos': upload.bytes_recebidos}), 409
+    limite = upload.tamanho - offset
+    # Nenhuma transação aberta enquanto o corpo chega pela rede
+    db.session.commit()
+
+    recebimento = caminho_recebimento(upload_id)
+    try:
+        open(recebimento, 'wb').close()
+        try:
+            gravados, hash_gravado = gravar_parte(request.stream, recebimento, 0, limite)
+        except ValueError as e:
+            return jsonify({'message': str(e), 'bytes_recebidos': upload.bytes_recebidos}), 400
+        if hash_parte and hash_parte != hash_gravado:
+            return jsonify({'message': 'Checksum da parte não confere',
+                            'bytes_recebidos': upload.bytes_recebidos}), 400
+
+        # Parte completa em disco: bloquear a sessão só para conferir o offset e copiar a parte
+        upload = _obter_upload(upload_id, bloquear=True)
+        if not upload:
+            return jsonify({'message': 'Upload não encontrado'}), 404
+        if upload.status != STATUS_EM_ANDAMENTO:
+            db.session.rollback()
+            return jsonify({'message': f'Upload {upload.status.lower()}', 'upload': upload.to_dict()}), 409
+        if offset > upload.bytes_recebidos:
+            db.session.rollback()
+            return jsonify({'message': 'Offset fora de sequência', 'bytes_recebidos': upload.bytes_recebidos}), 409
+
+        with open(recebimento, 'rb') as parte:
+            gravar_parte(parte, caminho_parcial(upload.id), offset, limite)
+        upload.bytes_recebidos = max(upload.bytes_recebidos, offset + gravados)
+        upload.data_atualizacao = datetime.utcnow()
+        db.session.commit()
+    finally:
+        descartar_upload(recebimento)
+
+    return jsonify(upload.to_dict()), 200
+
+
+@remessas.route('/uploads/<upload_id>', methods=['DELETE'])
+@auth_required()
+def cancelar_upload_fragmentado(upload_id):
+    """
+    Cancela uma sessão de upload em partes, removendo o arquivo parcial
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    responses:
+      200:
+        description: Upload cancelado
+      404:
+        description: Sessão não encontrada
+      409:
+        description: Sessão já encerrada
+    """
+    upload = _obter_upload(upload_id, bloquear=True)
+    if not upload:
+        return jsonify({'message': 'Upload não encontrado'}), 404
+    if upload.status != STATUS_EM_ANDAMENTO:
+        return jsonify({'message': f'Upload {upload.status.lower()}', 'upload': upload.to_dict()}), 409
+
+    descartar_upload(caminho_parcial(upload.id))
+    upload.status = 'Cancelado'
+    upload.data_atualizacao = datetime.utcnow()
+    db.session.commit()
+
+    return jsonify({'message': 'Upload cancelado', 'upload': upload.to_dict()}), 200
+
+
+@remessas.route('/uploads/<upload_id>/finalizar', methods=['POST'])
+@auth_required()
+def finalizar_upload_fragmentado(upload_id):
+    """
+    Finaliza o upload: confere o SHA-256, cria a remessa e enfileira o processamento
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            sha256:
+              type: string
+              description: Obrigatório se não informado ao iniciar o upload
+    responses:
+      200:
+        description: Arquivo idêntico já enviado; retorna a remessa existente
+      201:
+        description: Remessa criada e processamento iniciado
+      400:
+        description: Upload incompleto ou checksum divergente
+      404:
+        description: Sessão não encontrada
+      409:
+        description: Sessão já encerrada
+    """
+    upload = _obter_upload(upload_id, bloquear=True)
+    if not upload:
+        return jsonify({'message': 'Upload não encontrado'}), 404
+    if upload.status != STATUS_EM_ANDAMENTO:
+        return jsonify({'message': f'Upload {upload.status.lower()}', 'upload': upload.to_dict()}), 409
+
+    data = request.get_json(silent=True) or {}
+    try:
+        hash_esperado = _validar_hash(data.get('sha256')) or upload.hash_esperado
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if not hash_esperado:
+        return jsonify({'message': 'Informe o sha256 do arquivo'}), 400
+    if upload.bytes_recebidos != upload.tamanho:
+        return jsonify({'message': 'Upload incompleto', 'bytes_recebidos': upload.bytes_recebidos,
+                        'tamanho': upload.tamanho}), 400
+
+    arquivo_parcial = caminho_parcial(upload.id)
+    hash_arquivo = calcular_hash(arquivo_parcial)
+    if hash_arquivo != hash_esperado:
+        return jsonify({'message': 'Checksum do arquivo não confere. Reenvie as partes a partir do offset 0.',
+                        'sha256': hash_arquivo}), 400
+
+    # Reenvio de um arquivo idêntico: retorna a remessa e a tarefa já existentes
+    existente = buscar_reenvio(Remessa, hash_arquivo, upload.usuario_id, tipo=upload.tipo, uf=upload.uf)
+    if existente:
+        descartar_upload(arquivo_parcial)
+        upload.status = 'Concluído'
+        upload.remessa_id = existente.id
+        upload.data_atualizacao = datetime.utcnow()
+        db.session.commit()
+        return jsonify({
+            'message': 'Arquivo já enviado anteriormente. Retornando a remessa existente.',
+            'remessa': existente.to_dict(),
+            'id': existente.id,
+            'task_id': existente.task_id,
+            'duplicado': True
+        }), 200
+
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], nome_unico(upload.nome_arquivo))
+    os.replace(arquivo_parcial, file_path)
+
+    remessa = Remessa(
+        nome_arquivo=upload.nome_arquivo,
+        status='Pendente',
+        uf=upload.uf,
+        tipo=upload.tipo,
+        usuario_id=upload.usuario_id,
+        descricao=upload.descricao,
+        hash_arquivo=hash_arquivo
+    )
+    db.session.add(remessa)
+    db.session.flush()
+    upload.status = 'Concluído'
+    upload.remessa_id = remessa.id
+    upload.data_atualizacao = datetime.utcnow()
+    db.session.commit()
+
+    # Iniciar processamento assíncrono usando o sistema de filas
+    try:
+        from app.utils.async_tasks import enqueue_task
+
+        if upload.tipo == 'Desistência':
+            funcao, descricao = processar_desistencia, f"Processamento da desistência {remessa.id}"
+        else:
+            funcao, descricao = processar_remessa, f"Processamento da remessa {remessa.id}"
+        task_id = enqueue_task(
+            funcao,
+            descricao,
+            remessa.id,
+            file_path,
+            task_usuario_id=upload.usuario_id,
+            task_uf=upload.uf
+        )
+
+        remessa.task_id = task_id
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Arquivo recebido com sucesso. O processamento foi iniciado em segundo plano.',
+            'remessa': remessa.to_dict(),
+            'id': remessa.id,
+            'task_id': task_id
+        }), 201
+    except Exception as e:
+        erro = Erro(
+            remessa_id=remessa.id,
+            tipo='Processamento',
+            mensagem=str(e),
+            data_ocorrencia=datetime.utcnow()
+        )
+        db.session.add(erro)
+        remessa.status = 'Erro'
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Erro ao processar remessa: ' + str(e),
+            'remessa': remessa.to_dict()
+        }), 500
+
+
+@remessas.route('/upload/lote', methods=['POST'])
+@auth_required()
+def upload_remessas_lote():
+    """
+    Faz upload de vários arquivos de remessa em uma única requisição
+    ---
+    tags:
+      - Remessas
+    security:
+      - BasicAuth: []
+    consumes:
+      - multipart/form-data
+    parameters:
+      - in: formData
+        name: files
+        type: array
+        items:
+          type: file
+        collectionFormat: multi
+        required: true
+        description: Arquivos XML de remessa (ou compactados em .xml.gz/.zip)
+      - in: formData
+        name: uf
+        type: string
+        required: true
+        description: UF do cartório
+      - in: formData
+        name: tipo
+        type: string
+        required: true
+        description: Tipo de remessa (Remessa ou Desistência)
+      - in: formData
+        name: descricao
+        type: string
+        required: false
+    responses:
+      200:
+        description: Todos os arquivos já haviam sido enviados
+      201:
+        description: Remessas criadas; processamento enfileirado como um grupo de tarefas
+      400:
+        description: Dados inválidos
+      415:
+        description: Tipo de arquivo não suportado
+    """
+    current_user = get_user_snapshot(g.user.id if g.user else None)
+    if not current_user:
+        return jsonify({'message': 'Usuário não encontrado'}), 404
+
+    files = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename]
+    if not files:
+        return jsonify({'message': 'Nenhum arquivo enviado'}), 400
+    limite = current_app.config.get('UPLOAD_LOTE_MAX_ARQUIVOS', 100)
+    if len(files) > limite:
+        return jsonify({'message': f'Máximo de {limite} arquivos por lote'}), 400
+
+    invalidos = [file.filename for file in files if not allowed_file(file.filename)]
+    if invalidos:
+        return jsonify({'message': 'Tipo de arquivo não permitido. Apenas XML (ou compactado em .xml.gz/.zip) é aceito',
+                        'arquivos': invalidos}), 415
+
+    uf = request.form.get('uf')
+    tipo = request.form.get('tipo')
+    descricao = request.form.get('descricao')
+    if not uf or not tipo:
+        return jsonify({'message': 'UF e tipo são obrigatórios'}), 400
+    if tipo not in ['Remessa', 'Desistência']:
+        return jsonify({'message': 'Tipo inválido. Deve ser Remessa ou Desistência'}), 400
+
+    # Salvar os arquivos, calculando o hash de cada um durante a cópia
+    recebidos = []
+    for file in files:
+        filename = secure_filename(file.filename)
+        file_path, hash_arquivo = salvar_upload(file, current_app.config['UPLOAD_FOLDER'], filename)
+        recebidos.append((filename, file_path, hash_arquivo))
+
+    # Reenvios (inclusive repetidos no próprio lote) apontam para a remessa existente.
+    # Hashes consultados em ordem para que lotes simultâneos obtenham os locks na mesma ordem
+    existentes = {}
+    for hash_arquivo in sorted({hash_arquivo for _, _, hash_arquivo in recebidos}):
+        existente = buscar_reenvio(Remessa, hash_arquivo, current_user.id, tipo=tipo, uf=uf)
+        if existente:
+            existentes[hash_arquivo] = existente
+
+    duplicados = []
+    novos = {}
+    for filename, file_path, hash_arquivo in recebidos:
+        if hash_arquivo in existentes or hash_arquivo in novos:
+            descartar_upload(file_path)
+            duplicados.append((filename, hash_arquivo))
+            continue
+        novos[hash_arquivo] = (file_path, Remessa(
+            nome_arquivo=filename,
+            status='Pendente',
+            uf=uf,
+            tipo=tipo,
+            usuario_id=current_user.id,
+            descricao=descricao,
+            hash_arquivo=hash_arquivo
+        ))
+
+    group_id = None
+    criadas = [remessa for _, remessa in novos.values()]
+    if criadas:
+        from app.utils.async_tasks import enqueue_task_group, wake_executor
+
+        # Remessas e tarefas gravadas na mesma transação (um único commit)
+        db.session.add_all(criadas)
+        db.session.flush()
+        funcao = processar_desistencia if tipo == 'Desistência' else processar_remessa
+        rotulo = 'desistência' if tipo == 'Desistência' else 'remessa'
+        group_id, task_ids = enqueue_task_group(
+            [(funcao, f"Processamento da {rotulo} {remessa.id}", (remessa.id, file_path),
+              {'task_usuario_id': current_user.id, 'task_uf': uf})
+             for file_path, remessa in novos.values()],
+            connection=db.session.connection()
+        )
+        for remessa, task_id in zip(criadas, task_ids):
+            remessa.task_id = task_id
+        db.session.commit()
+        wake_executor()
+
+    por_hash = dict(existentes, **{remessa.hash_arquivo: remessa for remessa in criadas})
+    return jsonify({
+        'message': f'{len(criadas)} arquivo(s) enviado(s); {len(duplicados)} já enviado(s) anteriormente',
+        'group_id': group_id,
+        'remessas': [
+            {'id': remessa.id, 'nome_arquivo': remessa.nome_arquivo, 'status': remessa.status,
+             'task_id': remessa.task_id}
+            for remessa in criadas
+        ],
+        'duplicados': [
+            {'nome_arquivo': filename, 'id': por_hash[hash_arquivo].id, 'task_id': por_hash[hash_arquivo].task_id}
+            for filename, hash_arquivo in duplicados
+        ]
+    }), 201 if criadas else 200
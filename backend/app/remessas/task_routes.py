@@ -1,11 +1,310 @@
-from flask import jsonify, request, current_app
+import json
+import time
+from flask import jsonify, request, current_app, Response, stream_with_context, g
 from app.auth.middleware import auth_required
-from app.utils.async_tasks import get_task_status
-from app.utils.task_utils import list_tasks, get_pending_tasks
+from app.auth.tokens import create_stream_token, get_stream_token_ttl
+from app.utils.async_tasks import get_task_status, get_task_group, TaskStatus
+from app.utils import task_store
+from app.utils.task_utils import list_tasks, get_pending_tasks, get_queue_metrics
+from app.utils.scheduler import scheduler
 from app.models import Remessa, User
 from app import db
 from . import remessas
 
+def _parse_last_event_id(value, task_ids):
+    """Converte o ID do último evento ("v1,v2,...", na ordem de ids) em versões por tarefa"""
+    versions = dict.fromkeys(task_ids, 0)
+    if value:
+        parts = value.split(",")
+        if len(parts) == len(task_ids):
+            for task_id, version in zip(task_ids, parts):
+                try:
+                    versions[task_id] = int(version)
+                except ValueError:
+                    pass
+    return versions
+
+def _sse_event(event, data, event_id=None):
+    """Formata um evento Server-Sent Events"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@remessas.route("/tasks/stream/token", methods=["POST"])
+@auth_required()
+def create_tasks_stream_token():
+    """Emite um token de curta duração para conectar ao stream de tarefas
+    ---
+    tags:
+      - Remessas
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: "Token para o parâmetro stream_token de /tasks/stream (válido só nesse endpoint)"
+    """
+    return jsonify({
+        "stream_token": create_stream_token(g.user),
+        "expires_in": get_stream_token_ttl()
+    })
+
+@remessas.route("/tasks/stream", methods=["GET"])
+@auth_required(allow_stream_token=True)
+def stream_tasks():
+    """Transmite alterações de status e progresso de tarefas (Server-Sent Events)
+    ---
+    tags:
+      - Remessas
+    parameters:
+      - name: ids
+        in: query
+        type: string
+        required: true
+        description: IDs das tarefas separados por vírgula
+      - name: stream_token
+        in: query
+        type: string
+        required: false
+        description: Token de stream obtido em POST /tasks/stream/token (para clientes EventSource, que não enviam headers)
+      - name: Last-Event-ID
+        in: header
+        type: string
+        required: false
+        description: ID do último evento recebido, para retomar a partir dele
+    security:
+      - JWT: []
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: "Stream de eventos 'task' (um por alteração), 'not_found' e 'end'"
+      400:
+        description: Parâmetro ids ausente ou com tarefas demais
+    """
+    task_ids = list(dict.fromkeys(t for t in request.args.get("ids", "").split(",") if t))
+    if not task_ids:
+        return jsonify({"message": "Informe os IDs das tarefas no parâmetro ids"}), 400
+    if len(task_ids) > current_app.config.get("TASK_STREAM_MAX_IDS", 50):
+        return jsonify({"message": "Quantidade de tarefas acima do limite por conexão"}), 400
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    versions = _parse_last_event_id(last_event_id, task_ids)
+    poll_interval = current_app.config.get("TASK_STREAM_POLL_INTERVAL", 1)
+    heartbeat = current_app.config.get("TASK_STREAM_HEARTBEAT", 15)
+    max_duration = current_app.config.get("TASK_STREAM_MAX_DURATION", 300)
+
+    # Devolver ao pool a conexão usada na autenticação: o stream fica aberto por até max_duration
+    db.session.close()
+
+    def generate():
+        inicio = ultimo_envio = time.monotonic()
+        finished = set()
+        # Intervalo de reconexão sugerido ao EventSource
+        yield "retry: 3000\n\n"
+
+        primeira_consulta = True
+        while True:
+            snapshot = {task["task_id"]: task for task in task_store.get_tasks_snapshot(task_ids)}
+
+            if primeira_consulta:
+                for task_id in task_ids:
+                    if task_id not in snapshot:
+                        finished.add(task_id)
+                        yield _sse_event("not_found", {"task_id": task_id})
+                primeira_consulta = False
+
+            for task_id, task in snapshot.items():
+                versao = task.pop("versao")
+                if task["status"] in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                    finished.add(task_id)
+                if versao > versions[task_id]:
+                    versions[task_id] = versao
+                    event_id = ",".join(str(versions[t]) for t in task_ids)
+                    yield _sse_event("task", task, event_id)
+                    ultimo_envio = time.monotonic()
+
+            if len(finished) == len(task_ids):
+                yield _sse_event("end", {"task_ids": task_ids})
+                return
+
+            agora = time.monotonic()
+            if agora - inicio >= max_duration:
+                # O cliente reconecta e retoma a partir do Last-Event-ID
+                return
+            if agora - ultimo_envio >= heartbeat:
+                yield ": heartbeat\n\n"
+                ultimo_envio = agora
+
+            # Acorda imediatamente com alterações feitas neste processo;
+            # alterações de outros workers são percebidas pela consulta periódica
+            task_store.wait_for_change(poll_interval)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@remessas.route("/tasks/metrics", methods=["GET"])
+@auth_required(admin_required=True)
+def get_tasks_metrics():
+    """Métricas da fila de tarefas por classe (tempo de espera, pendentes)
+    ---
+    tags:
+      - Remessas
+    parameters:
+      - name: window
+        in: query
+        type: integer
+        required: false
+        description: Janela em segundos para o tempo de espera (padrão 3600)
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Métricas por classe de tarefa
+    """
+    try:
+        window = int(request.args.get("window", 3600))
+    except ValueError:
+        return jsonify({"message": "Janela inválida"}), 400
+
+    return jsonify(get_queue_metrics(window)), 200
+
+@remessas.route("/tasks/dead-letter", methods=["GET"])
+@auth_required(admin_required=True)
+def list_dead_letter_tasks():
+    """Lista tarefas com falha definitiva (dead-letter), com a causa da falha
+    ---
+    tags:
+      - Remessas
+    parameters:
+      - name: task_type
+        in: query
+        type: string
+        required: false
+        description: Filtro por tipo de tarefa
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Limite de tarefas (padrão 100)
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Lista de tarefas com falha
+    """
+    try:
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        return jsonify({"message": "Limite inválido"}), 400
+
+    tasks = task_store.list_dead_letter(request.args.get("task_type"), limit)
+
+    return jsonify({
+        "tasks": [dict(task.to_dict(), error_detail=task.erro_detalhe) for task in tasks],
+        "count": len(tasks)
+    }), 200
+
+@remessas.route("/tasks/dead-letter/requeue", methods=["POST"])
+@auth_required(admin_required=True)
+def requeue_dead_letter_tasks():
+    """Reenfileira em lote tarefas com falha definitiva, reaproveitando os arquivos já enviados
+    ---
+    tags:
+      - Remessas
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            task_ids:
+              type: array
+              items:
+                type: string
+            task_type:
+              type: string
+            all:
+              type: boolean
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Tarefas reenfileiradas
+      400:
+        description: Nenhum critério informado
+    """
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get("task_ids")
+    task_type = data.get("task_type")
+
+    # Exigir um critério explícito para não reenfileirar tudo por engano
+    if not task_ids and not task_type and not data.get("all"):
+        return jsonify({"message": "Informe task_ids, task_type ou all=true"}), 400
+
+    requeued = task_store.requeue_dead_letter(task_ids or None, task_type)
+
+    # Remessas vinculadas voltam a aguardar processamento
+    if requeued:
+        Remessa.query.filter(Remessa.task_id.in_(requeued)).update(
+            {Remessa.status: "Pendente"}, synchronize_session=False)
+        db.session.commit()
+
+    return jsonify({
+        "requeued": requeued,
+        "count": len(requeued)
+    }), 200
+
+@remessas.route("/tasks/schedules", methods=["GET"])
+@auth_required(admin_required=True)
+def list_scheduled_jobs():
+    """Lista os agendamentos periódicos com a próxima execução e o resultado da última
+    ---
+    tags:
+      - Remessas
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Agendamentos; a última execução inclui status, resultado e duração da tarefa
+    """
+    return jsonify({
+        "jobs": scheduler.list_jobs(),
+        "enabled": scheduler.enabled,
+        "leader": scheduler.is_leader
+    }), 200
+
+@remessas.route("/tasks/groups/<group_id>", methods=["GET"])
+@auth_required()
+def get_task_group_status(group_id):
+    """Obtém o progresso agregado de um grupo de tarefas (ex.: upload em lote)
+    ---
+    tags:
+      - Remessas
+    parameters:
+      - name: group_id
+        in: path
+        type: string
+        required: true
+        description: ID do grupo
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Status, contagem por status e progresso do grupo, com as tarefas
+      404:
+        description: Grupo não encontrado
+    """
+    group = get_task_group(group_id)
+    if not group:
+        return jsonify({"message": "Grupo não encontrado"}), 404
+
+    return jsonify({"group": group}), 200
+
 @remessas.route("/tasks/<task_id>", methods=["GET"])
 @auth_required()
 def get_task(task_id):
@@ -0,0 +1,152 @@
+"""
+Validação dos títulos lidos na ingestão de remessas
+
+As funções deste módulo não acessam o banco nem o contexto da aplicação, de
+modo que ``validar_lote`` pode ser executada em processos separados (pool de
+validação da ingestão). O resultado de cada título é compacto:
+``(posicao, numero, registro, mensagens)``, onde ``registro`` é
+``(titulo, credor, devedor)`` ou None quando o título é rejeitado. Para títulos
+aceitos, ``mensagens`` contém avisos (gravados como erros vinculados ao título).
+"""
+import re
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple
+from app.utils.partes import normalizar_documento
+
+CAMPOS_PARTE = ('nome', 'documento', 'endereco', 'cidade', 'uf', 'cep')
+
+_PROTOCOLO = re.compile(r'^[0-9A-Za-z./-]{1,50}$')
+
+# Resultado da validação de um título: (posicao, numero, registro ou None, mensagens)
+Resultado = Tuple[int, Optional[str], Optional[tuple], List[str]]
+
+
+def _digitos_verificadores_ok(digitos: str, pesos: List[int]) -> bool:
+    """Confere os dois dígitos verificadores (módulo 11) de CPF ou CNPJ"""
+    for tamanho in (len(pesos) - 1, len(pesos)):
+        soma = sum(int(d) * p for d, p in zip(digitos[:tamanho], pesos[-tamanho:]))
+        resto = soma % 11
+        if int(digitos[tamanho]) != (0 if resto < 2 else 11 - resto):
+            return False
+    return True
+
+
+def documento_valido(documento: Optional[str]) -> bool:
+    """Valida CPF (11 dígitos) ou CNPJ (14 dígitos), incluindo os dígitos verificadores"""
+    digitos = normalizar_documento(documento)
+    if not digitos or digitos == digitos[0] * len(digitos):
+        return False
+    if len(digitos) == 11:
+        return _digitos_verificadores_ok(digitos, [11, 10, 9, 8, 7, 6, 5, 4, 3, 2])
+    if len(digitos) == 14:
+        return _digitos_verificadores_ok(digitos, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    return False
+
+
+def _parse_decimal(valor: str) -> Decimal:
+    if not valor:
+        raise ValueError('valor não informado')
+    texto = valor.replace(' ', '')
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        resultado = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f'valor inválido: {valor}')
+    if resultado <= 0:
+        raise ValueError(f'valor deve ser positivo: {valor}')
+    if resultado >= Decimal('100000000'):
+        raise ValueError(f'valor acima do limite: {valor}')
+    return resultado.quantize(Decimal('0.01'))
+
+
+def _parse_date(valor: str, campo: str) -> Optional[date]:
+    if not valor:
+        return None
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d%m%Y'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f'{campo} inválida: {valor}')
+
+
+def _parse_parte(dados: Any, tipo: str, obrigatoria: bool) -> Optional[Dict[str, Any]]:
+    if not isinstance(dados, dict) or not any(dados.values()):
+        if obrigatoria:
+            raise ValueError(f'{tipo} não informado')
+        return None
+    if not dados.get('documento'):
+        raise ValueError(f'documento do {tipo} não informado')
+    if not documento_valido(dados['documento']):
+        raise ValueError(f"documento do {tipo} inválido (CPF/CNPJ): {dados['documento']}")
+    if tipo == 'devedor' and not dados.get('nome'):
+        raise ValueError('nome do devedor não informado')
+    parte = {campo: (dados.get(campo) or None) for campo in CAMPOS_PARTE}
+    if parte['uf']:
+        parte['uf'] = parte['uf'].upper()[:2]
+    return parte
+
+
+def converter_titulo(dados: Dict[str, Any]) -> Tuple[Tuple[Dict[str, Any], Optional[Dict[str, Any]], Dict[str, Any]], List[str]]:
+    """
+    Valida e converte os dados de um título lido do XML
+
+    Returns:
+        Tuple: ((colunas do título, credor ou None, devedor), avisos)
+
+    Raises:
+        ValueError: Se o título for inválido
+    """
+    numero = dados.get('numero')
+    if not numero:
+        raise ValueError('número do título não informado')
+    if len(numero) > 50:
+        raise ValueError('número do título excede 50 caracteres')
+    protocolo = dados.get('protocolo') or None
+    if protocolo and not _PROTOCOLO.match(protocolo):
+        raise ValueError(f'protocolo em formato inválido: {protocolo}')
+
+    titulo = {
+        'numero': numero,
+        'protocolo': protocolo,
+        'valor': _parse_decimal(dados.get('valor')),
+        'data_emissao': _parse_date(dados.get('data_emissao'), 'data de emissão'),
+        'data_vencimento': _parse_date(dados.get('data_vencimento'), 'data de vencimento'),
+        'especie': dados.get('especie') or None,
+        'aceite': (dados.get('aceite') or '').upper() in ('S', 'SIM', 'TRUE', '1'),
+        'nosso_numero': dados.get('nosso_numero') or None,
+        'status': 'Pendente',
+    }
+    credor = _parse_parte(dados.get('credor'), 'credor', obrigatoria=False)
+    devedor = _parse_parte(dados.get('devedor'), 'devedor', obrigatoria=True)
+
+    avisos = []
+    emissao, vencimento = titulo['data_emissao'], titulo['data_vencimento']
+    if emissao and emissao > date.today():
+        avisos.append(f'data de emissão no futuro: {emissao.isoformat()}')
+    if emissao and vencimento and vencimento < emissao:
+        avisos.append('data de vencimento anterior à data de emissão')
+    return (titulo, credor, devedor), avisos
+
+
+def validar_lote(lote: List[Tuple[int, Dict[str, Any]]]) -> List[Resultado]:
+    """
+    Valida um lote de títulos (executável em processo separado)
+
+    Args:
+        lote: Pares (posição no arquivo, dados lidos do XML)
+
+    Returns:
+        List[Resultado]: Resultado de cada título, na ordem do lote
+    """
+    resultados = []
+    for posicao, dados in lote:
+        numero = dados.get('numero') or None
+        try:
+            registro, avisos = converter_titulo(dados)
+            resultados.append((posicao, numero, registro, avisos))
+        except ValueError as e:
+            resultados.append((posicao, numero, None, [str(e)]))
+    return resultados
@@ -0,0 +1,140 @@
+"""
+Leitura incremental de arquivos enviados, simples ou compactados
+
+Arquivos ``.gz`` e ``.zip`` são identificados pelo conteúdo (assinatura) e
+descompactados em fluxo: os parsers de ingestão leem direto do descompactador,
+sem expandir o arquivo em memória nem em disco. Um ``.zip`` pode conter vários
+arquivos; os que não têm a extensão esperada (ex.: ``__MACOSX/``) são ignorados.
+
+O total descompactado é limitado por UPLOAD_MAX_DESCOMPACTADO, protegendo o
+processamento contra arquivos com taxa de compressão anômala.
+"""
+import gzip
+import io
+import os
+import zipfile
+import zlib
+from typing import IO, Iterator, Optional, Sequence, Tuple
+
+ASSINATURA_GZIP = b'\x1f\x8b'
+ASSINATURA_ZIP = b'PK\x03\x04'
+
+LIMITE_DESCOMPACTADO_PADRAO = 10 * 1024 ** 3  # 10 GB
+
+# Arquivo compactado corrompido ou truncado
+ERROS_COMPACTACAO = (zipfile.BadZipFile, gzip.BadGzipFile, zlib.error, EOFError)
+
+
+def extensao_permitida(filename: str, extensoes: Sequence[str]) -> bool:
+    """
+    Verifica se o nome do arquivo tem uma das extensões aceitas, simples ou compactada
+
+    Ex.: com extensoes=('.xml',), aceita ``remessa.xml``, ``remessa.xml.gz`` e ``remessas.zip``.
+    """
+    nome = (filename or '').lower()
+    if nome.endswith('.zip'):
+        return True
+    if nome.endswith('.gz'):
+        nome = nome[:-3]
+    return nome.endswith(tuple(extensoes))
+
+
+def formato_arquivo(file_path: str) -> Optional[str]:
+    """Formato de compactação do arquivo ('gzip' ou 'zip'), ou None se não compactado"""
+    with open(file_path, 'rb') as arquivo:
+        inicio = arquivo.read(4)
+    if inicio.startswith(ASSINATURA_GZIP):
+        return 'gzip'
+    if inicio.startswith(ASSINATURA_ZIP):
+        return 'zip'
+    return None
+
+
+class _LeituraLimitada(io.RawIOBase):
+    """Repassa a leitura de um fluxo descompactado, contabilizando o total lido"""
+
+    def __init__(self, stream, entrada: 'ArquivoEntrada'):
+        self._stream = stream
+        self._entrada = entrada
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dados = self._stream.read(len(buffer))
+        self._entrada._contabilizar(len(dados))
+        buffer[:len(dados)] = dados
+        return len(dados)
+
+
+class ArquivoEntrada:
+    """
+    Abre um arquivo enviado para leitura incremental dos arquivos que ele contém
+
+    Uso::
+
+        with ArquivoEntrada(file_path, ('.xml',)) as entrada:
+            for nome, stream in entrada.arquivos():
+                for titulo in iter_titulos(stream):
+                    ...
+                progresso = entrada.progresso()
+    """
+
+    def __init__(self, file_path: str, extensoes: Sequence[str], limite: Optional[int] = None):
+        self.file_path = file_path
+        self.extensoes = tuple(extensoes)
+        self.limite = limite or LIMITE_DESCOMPACTADO_PADRAO
+        self.formato = None
+        self.descompactados = 0
+        self._bruto = None
+        self._tamanho = 1
+
+    def __enter__(self):
+        self.formato = formato_arquivo(self.file_path)
+        self._tamanho = os.path.getsize(self.file_path) or 1
+        self._bruto = open(self.file_path, 'rb')
+        return self
+
+    def __exit__(self, *exc):
+        self._bruto.close()
+        return False
+
+    def _contabilizar(self, quantidade: int):
+        self.descompactados += quantidade
+        if self.formato and self.descompactados > self.limite:
+            raise ValueError('Conteúdo descompactado excede o limite permitido')
+
+    def _abrir(self, stream) -> IO[bytes]:
+        return io.BufferedReader(_LeituraLimitada(stream, self))
+
+    def arquivos(self) -> Iterator[Tuple[str, IO[bytes]]]:
+        """
+        Percorre os arquivos contidos (um só, exceto em .zip)
+
+        Yields:
+            Tuple[str, IO[bytes]]: Nome e fluxo binário descompactado do arquivo
+        """
+        nome_base = os.path.basename(self.file_path)
+        if self.formato == 'gzip':
+            with gzip.GzipFile(fileobj=self._bruto, mode='rb') as descompactado:
+                yield nome_base[:-3] if nome_base.lower().endswith('.gz') else nome_base, \
+                    self._abrir(descompactado)
+        elif self.formato == 'zip':
+            encontrados = 0
+            with zipfile.ZipFile(self._bruto) as compactado:
+                for info in compactado.infolist():
+                    nome = info.filename
+                    if info.is_dir() or nome.startswith('__MACOSX/') or \
+                            not nome.lower().endswith(self.extensoes):
+                        continue
+                    encontrados += 1
+                    with compactado.open(info) as descompactado:
+                        yield nome, self._abrir(descompactado)
+            if not encontrados:
+                raise ValueError(f"Nenhum arquivo {'/'.join(self.extensoes)} encontrado no .zip")
+        else:
+            yield nome_base, self._bruto
+
+    def progresso(self) -> int:
+        """Percentual lido do arquivo enviado (compactado), de 0 a 99"""
+        return min(99, self._bruto.tell() * 100 // self._tamanho)
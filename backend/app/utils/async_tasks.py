@@ -1,170 +1,558 @@
+import os
+import signal
+import socket
 import threading
 import time
-import queue
+import uuid
 import logging
-from typing import Callable, Dict, Any, Optional
-from flask import current_app
+import atexit
+import importlib
+import multiprocessing
+import contextvars
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+import click
+from flask import current_app, g, has_request_context
+from sqlalchemy import exc as sa_exc
+from app.utils import task_store
 
-# Fila global para tarefas assíncronas
-task_queue = queue.Queue()
+# ID da tarefa em execução no contexto atual (thread ou processo do executor)
+_current_task_id = contextvars.ContextVar('current_task_id', default=None)
 
-# Flag para controlar o worker
-should_stop = False
+# Indica que o processo atual é um processo filho do executor
+_in_task_process = False
 
-# Dicionário para armazenar o status das tarefas
-task_status = {}
+# Aplicação criada em cada processo filho do executor
+_process_app = None
+
+# Último progresso gravado por tarefa (evita gravações repetidas)
+_last_progress = {}
 
 
 class TaskStatus:
-    """Classe para armazenar o status de uma tarefa"""
-    PENDING = 'pending'
-    RUNNING = 'running'
-    COMPLETED = 'completed'
-    FAILED = 'failed'
-
-    def __init__(self, task_id: str, description: str):
-        self.task_id = task_id
-        self.description = description
-        self.status = self.PENDING
-        self.result = None
-        self.error = None
-        self.progress = 0
-        self.start_time = None
-        self.end_time = None
-
-    def to_dict(self):
-        return {
-            'task_id': self.task_id,
-            'description': self.description,
-            'status': self.status,
-            'progress': self.progress,
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'error': self.error
-        }
-
-
-def worker():
-    """Worker para processar tarefas da fila"""
-    global should_stop
-    
-    while not should_stop:
-        try:
-            # Tenta obter uma tarefa da fila (timeout para permitir verificar should_stop)
+    """Status possíveis de uma tarefa"""
+    PENDING = task_store.PENDING
+    RUNNING = task_store.RUNNING
+    COMPLETED = task_store.COMPLETED
+    FAILED = task_store.FAILED
+
+
+# Política de retentativa usada para tipos sem configuração própria
+DEFAULT_RETRY_POLICY = {
+    'max_attempts': 3,
+    'base_delay': 5,
+    'max_delay': 300,
+    'retry_all_errors': False
+}
+
+
+def get_retry_policy(task_type: str) -> Dict[str, Any]:
+    """Política de retentativa do tipo de tarefa (TASK_RETRY_POLICIES)"""
+    policies = current_app.config.get('TASK_RETRY_POLICIES', {})
+    policy = dict(DEFAULT_RETRY_POLICY)
+    policy.update(policies.get('default', {}))
+    policy.update(policies.get(task_type, {}))
+    return policy
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Indica se o erro é transitório (conexão, timeout, deadlock) e vale nova tentativa"""
+    if isinstance(error, (sa_exc.OperationalError, sa_exc.TimeoutError, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return False
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """
+    Indica se o erro vem do conteúdo processado (ex.: arquivo fora do leiaute)
+
+    Uma nova execução sobre o mesmo arquivo falharia igual: não há retentativa
+    nem com ``retry_all_errors``; o usuário envia o arquivo corrigido.
+    """
+    return isinstance(error, ValueError)
+
+
+def _record_failure(task_id: str, worker_id: str, task_type: str, error, detalhe: str = None,
+                    transitorio: bool = None):
+    """Registra a falha conforme a política de retentativa do tipo"""
+    policy = get_retry_policy(task_type)
+    if transitorio is None:
+        transitorio = is_transient_error(error) or (policy['retry_all_errors'] and not is_permanent_error(error))
+    status = task_store.record_failure(
+        task_id, worker_id, str(error), detalhe, transitorio=transitorio,
+        base_delay=policy['base_delay'], max_delay=policy['max_delay']
+    )
+    if status is None:
+        logging.warning(f"Tarefa {task_id} não está mais em execução por {worker_id}; falha descartada: {error}")
+    elif status == TaskStatus.PENDING:
+        logging.warning(f"Tarefa {task_id} falhou com erro transitório e será executada novamente: {error}")
+    else:
+        logging.error(f"Tarefa {task_id} falhou definitivamente: {error}")
+
+
+def _task_path(task_func: Callable) -> str:
+    """Retorna o caminho importável "modulo:funcao" de uma função de tarefa"""
+    module = getattr(task_func, '__module__', None)
+    qualname = getattr(task_func, '__qualname__', '')
+    if not module or '<' in qualname:
+        raise ValueError('A tarefa deve ser uma função definida em nível de módulo')
+    return f'{module}:{qualname}'
+
+
+def _resolve_task(path: str) -> Callable:
+    """Importa a função de uma tarefa a partir do caminho gravado na fila"""
+    module_name, _, qualname = path.partition(':')
+    allowed = tuple(current_app.config.get('TASK_ALLOWED_MODULES', ('app.',)))
+    if not module_name.startswith(allowed):
+        raise ValueError(f'Módulo de tarefa não permitido: {module_name}')
+
+    obj = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _execute(app, task: Dict[str, Any]):
+    """Executa uma tarefa reservada com contexto de aplicação e sessão próprios"""
+    from app import db
+
+    task_id = task['id']
+    token = _current_task_id.set(task_id)
+    try:
+        with app.app_context():
+            try:
+                task_func = _resolve_task(task['funcao'])
+                result = task_func(*task['args'], **task['kwargs'])
+            except Exception as e:
+                db.session.rollback()
+                _record_failure(task_id, task['worker'], task['tipo'], e, traceback.format_exc())
+                return None
+            finally:
+                db.session.remove()
+                _last_progress.pop(task_id, None)
+
+            if not task_store.mark_finished(task_id, task['worker'], TaskStatus.COMPLETED, resultado=result):
+                logging.warning(f"Tarefa {task_id} não está mais em execução por {task['worker']}; "
+                                f"resultado descartado")
+            return result
+    finally:
+        _current_task_id.reset(token)
+
+
+def _init_process_worker(config_name):
+    """Inicializa um processo filho do executor com a sua própria aplicação"""
+    global _in_task_process, _process_app
+    _in_task_process = True
+
+    from app import create_app
+    _process_app = create_app(config_name)
+
+
+def _run_in_process(task: Dict[str, Any]):
+    """Ponto de entrada das tarefas no pool de processos"""
+    return _execute(_process_app, task)
+
+
+class TaskExecutor:
+    """
+    Executor que consome a fila persistente de tarefas (tabela ``tasks``)
+
+    Pode rodar embutido nos workers web ou em um processo dedicado
+    (``flask worker``). As tarefas são reservadas no banco conforme há
+    capacidade livre, respeitando o número máximo de workers e o limite de
+    concorrência de cada tipo de tarefa (por padrão, o nome da função) neste
+    processo. A escolha entre as pendentes segue a prioridade e a justiça
+    entre tenants descritas em ``task_store``. Um heartbeat periódico permite
+    devolver à fila as tarefas de workers que pararam no meio da execução.
+    """
+
+    def __init__(self):
+        self.mode = 'thread'
+        self.max_workers = 4
+        self.concurrency_limits = {}
+        self.tenant_cap = None
+        self.fairness_window = task_store.FAIRNESS_WINDOW
+        self.embedded = True
+        self.poll_interval = 2
+        self.heartbeat_interval = 30
+        self.stale_timeout = 300
+        self.worker_id = None
+        self._app = None
+        self._pool = None
+        self._running = {}  # task_type -> quantidade em execução
+        self._running_ids = set()
+        self._cond = threading.Condition()
+        self._should_stop = False
+        self._dispatcher = None
+        self._last_maintenance = 0
+
+    def init_app(self, app):
+        """Configura o executor a partir da configuração da aplicação"""
+        self._app = app
+        self.mode = app.config.get('TASK_EXECUTOR', 'thread')
+        self.max_workers = max(1, int(app.config.get('TASK_MAX_WORKERS', 4)))
+        self.concurrency_limits = dict(app.config.get('TASK_CONCURRENCY_LIMITS', {}))
+        self.tenant_cap = app.config.get('TASK_TENANT_MAX_RUNNING')
+        self.fairness_window = app.config.get('TASK_FAIRNESS_WINDOW', task_store.FAIRNESS_WINDOW)
+        self.embedded = bool(app.config.get('TASK_WORKER_EMBEDDED', True))
+        self.poll_interval = app.config.get('TASK_POLL_INTERVAL', 2)
+        self.heartbeat_interval = app.config.get('TASK_HEARTBEAT_INTERVAL', 30)
+        self.stale_timeout = app.config.get('TASK_STALE_TIMEOUT', 300)
+
+    @property
+    def started(self):
+        return self._dispatcher is not None and self._dispatcher.is_alive()
+
+    @property
+    def running_count(self):
+        with self._cond:
+            return len(self._running_ids)
+
+    def start(self):
+        """Cria o pool e inicia a thread de despacho"""
+        if self.started:
+            return
+        if self._app is None:
+            raise RuntimeError('Executor de tarefas não inicializado com a aplicação')
+
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        if self.mode == 'process':
+            # 'spawn' evita herdar threads e conexões abertas do processo pai
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(self._app.config.get('APP_CONFIG_NAME'),)
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='task')
+
+        self._should_stop = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name='task-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def shutdown(self, wait=False):
+        """Interrompe a reserva de novas tarefas e encerra o pool"""
+        with self._cond:
+            self._should_stop = True
+            self._cond.notify_all()
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if wait and dispatcher is not None and dispatcher is not threading.current_thread():
+            # Sem novas reservas durante o encerramento do pool, nem despacho antigo após um novo start()
+            dispatcher.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def wake(self):
+        """Acorda o despacho (ex.: após enfileirar uma tarefa neste processo)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def limit_for(self, task_type: str) -> int:
+        return int(self.concurrency_limits.get(task_type, self.max_workers))
+
+    def _saturated_types(self):
+        """Tipos de tarefa que atingiram o limite de concorrência (requer o lock)"""
+        return [t for t, n in self._running.items() if n >= self.limit_for(t)]
+
+    def _fill(self):
+        """Reserva tarefas enquanto houver capacidade livre"""
+        claimed = False
+        while not self._should_stop:
+            with self._cond:
+                if len(self._running_ids) >= self.max_workers:
+                    break
+                saturated = self._saturated_types()
+
+            task = task_store.claim_task(self.worker_id, saturated, self.tenant_cap, self.fairness_window)
+            if task is None:
+                break
+
+            task_type = task['tipo']
+            with self._cond:
+                self._running[task_type] = self._running.get(task_type, 0) + 1
+                self._running_ids.add(task['id'])
+
             try:
-                task_id, task_func, args, kwargs = task_queue.get(timeout=1)
-            except queue.Empty:
+                if self.mode == 'process':
+                    future = self._pool.submit(_run_in_process, task)
+                else:
+                    future = self._pool.submit(_execute, self._app, task)
+            except Exception as e:
+                logging.error(f"Erro ao despachar tarefa {task['id']}: {str(e)}")
+                _record_failure(task['id'], self.worker_id, task_type, e, transitorio=True)
+                self._release(task['id'], task_type)
                 continue
-            
-            # Atualiza o status da tarefa
-            if task_id in task_status:
-                task_status[task_id].status = TaskStatus.RUNNING
-                task_status[task_id].start_time = time.time()
-            
-            # Executa a tarefa
+
+            future.add_done_callback(
+                lambda f, task_id=task['id'], task_type=task_type: self._on_done(task_id, task_type, f))
+            claimed = True
+        return claimed
+
+    def _maintenance(self):
+        """Renova heartbeats e recupera tarefas de workers inativos"""
+        agora = time.monotonic()
+        if agora - self._last_maintenance < self.heartbeat_interval:
+            return
+        self._last_maintenance = agora
+        with self._cond:
+            running_ids = list(self._running_ids)
+        task_store.touch_heartbeats(running_ids)
+        recuperadas = task_store.requeue_stale(self.stale_timeout)
+        if recuperadas:
+            logging.warning(f"{recuperadas} tarefa(s) sem heartbeat devolvida(s) à fila")
+
+    def _dispatch(self):
+        while not self._should_stop:
+            claimed = False
             try:
-                result = task_func(*args, **kwargs)
-                
-                # Atualiza o status da tarefa
-                if task_id in task_status:
-                    task_status[task_id].status = TaskStatus.COMPLETED
-                    task_status[task_id].result = result
-                    task_status[task_id].end_time = time.time()
-                    task_status[task_id].progress = 100
+                with self._app.app_context():
+                    self._maintenance()
+                    claimed = self._fill()
             except Exception as e:
-                # Registra o erro
-                logging.error(f"Erro ao executar tarefa {task_id}: {str(e)}")
-                
-                # Atualiza o status da tarefa
-                if task_id in task_status:
-                    task_status[task_id].status = TaskStatus.FAILED
-                    task_status[task_id].error = str(e)
-                    task_status[task_id].end_time = time.time()
-            
-            # Marca a tarefa como concluída na fila
-            task_queue.task_done()
+                logging.error(f"Erro no despacho de tarefas: {str(e)}")
+
+            if not claimed:
+                with self._cond:
+                    if not self._should_stop:
+                        self._cond.wait(timeout=self.poll_interval)
+
+    def _release(self, task_id: str, task_type: str):
+        with self._cond:
+            self._running[task_type] -= 1
+            self._running_ids.discard(task_id)
+            self._cond.notify_all()
+
+    def _on_done(self, task_id: str, task_type: str, future):
+        try:
+            # Falhas da própria tarefa são gravadas em _execute; aqui restam
+            # apenas falhas do pool (ex.: processo filho encerrado)
+            if future.cancelled() or future.exception() is not None:
+                error = 'Tarefa cancelada' if future.cancelled() else future.exception()
+                with self._app.app_context():
+                    # Falha do pool não é culpa da tarefa: tratar como transitória
+                    _record_failure(task_id, self.worker_id, task_type, error, transitorio=True)
         except Exception as e:
-            logging.error(f"Erro no worker: {str(e)}")
+            logging.error(f"Erro ao finalizar tarefa {task_id}: {str(e)}")
+        finally:
+            self._release(task_id, task_type)
+
+    def run_forever(self):
+        """Executa o worker em primeiro plano até receber SIGTERM/SIGINT"""
+        stop = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop.set())
+
+        self.start()
+        while not stop.wait(1):
+            if not self.started:
+                break
+        # Aguarda as tarefas em execução; as pendentes continuam na fila
+        self.shutdown(wait=True)
+
+
+# Executor compartilhado pelo processo
+executor = TaskExecutor()
 
 
 def start_worker():
-    """Inicia o worker em uma thread separada"""
-    global should_stop
-    should_stop = False
-    
-    worker_thread = threading.Thread(target=worker, daemon=True)
-    worker_thread.start()
-    
-    return worker_thread
+    """Inicia o executor de tarefas (requer contexto de aplicação se ainda não inicializado)"""
+    if executor._app is None:
+        executor.init_app(current_app._get_current_object())
+    executor.start()
+    return executor
 
 
 def stop_worker():
-    """Para o worker"""
-    global should_stop
-    should_stop = True
+    """Para o executor de tarefas"""
+    executor.shutdown()
+
+
+def get_current_task_id() -> Optional[str]:
+    """Retorna o ID da tarefa em execução no contexto atual, se houver"""
+    return _current_task_id.get()
 
 
 def enqueue_task(task_func: Callable, description: str, *args, **kwargs) -> str:
-    """Adiciona uma tarefa à fila para execução assíncrona
-    
+    """Adiciona uma tarefa à fila persistente para execução assíncrona
+
     Args:
-        task_func: Função a ser executada
+        task_func: Função a ser executada, definida em nível de módulo
         description: Descrição da tarefa
-        *args: Argumentos posicionais para a função
-        **kwargs: Argumentos nomeados para a função
-        
+        *args: Argumentos posicionais para a função (serializáveis em JSON)
+        **kwargs: Argumentos nomeados para a função (serializáveis em JSON).
+            Argumentos reservados (não repassados à função):
+            ``task_type``: tipo usado nos limites de concorrência (padrão: nome da função);
+            ``task_priority``: prioridade (padrão: TASK_PRIORITIES do tipo);
+            ``task_usuario_id`` e ``task_uf``: tenant para a justiça do
+            escalonamento (padrão: usuário autenticado na requisição e sem UF)
+
     Returns:
         str: ID da tarefa
     """
-    # Gera um ID para a tarefa
-    task_id = f"task_{int(time.time())}_{threading.get_ident()}"
-    
-    # Cria um objeto de status para a tarefa
-    task_status[task_id] = TaskStatus(task_id, description)
-    
-    # Adiciona a tarefa à fila
-    task_queue.put((task_id, task_func, args, kwargs))
-    
-    return task_id
+    row = _task_row(task_func, description, args, kwargs)
+
+    # Grava a tarefa na fila persistente
+    task_store.insert_tasks([row])
+    wake_executor()
+
+    return row['id']
+
+
+def _task_row(task_func: Callable, description: str, args, kwargs: Dict[str, Any],
+              group_id: str = None) -> Dict[str, Any]:
+    """Monta a linha da tarefa, separando os argumentos reservados de enqueue_task"""
+    kwargs = dict(kwargs)
+    task_type = kwargs.pop('task_type', None) or task_func.__name__
+    priority = kwargs.pop('task_priority', None)
+    if priority is None:
+        priority = current_app.config.get('TASK_PRIORITIES', {}).get(task_type, 0)
+    usuario_id = kwargs.pop('task_usuario_id', None)
+    if usuario_id is None and has_request_context() and getattr(g, 'user', None) is not None:
+        usuario_id = g.user.id
+    uf = kwargs.pop('task_uf', None)
+
+    # Gera um ID único para a tarefa
+    task_id = f"task_{uuid.uuid4().hex}"
+
+    return task_store.task_row(task_id, description, task_type, _task_path(task_func), args, kwargs,
+                               prioridade=priority, usuario_id=usuario_id, uf=uf,
+                               max_tentativas=get_retry_policy(task_type)['max_attempts'],
+                               grupo=group_id)
+
+
+def enqueue_task_group(tasks: Iterable[Tuple[Callable, str, tuple, Dict[str, Any]]],
+                       connection=None) -> Tuple[str, List[str]]:
+    """Adiciona um grupo de tarefas à fila com um único INSERT
+
+    O grupo pode ser acompanhado por get_task_group (progresso agregado).
+
+    Args:
+        tasks: Tuplas (função, descrição, args, kwargs), como em enqueue_task
+        connection: Conexão da transação da requisição (ex.: db.session.connection()),
+            para gravar as tarefas junto com os registros que as referenciam. Nesse
+            caso, chame wake_executor() após o commit.
+
+    Returns:
+        Tuple[str, List[str]]: ID do grupo e IDs das tarefas, na ordem recebida
+    """
+    group_id = f"group_{uuid.uuid4().hex}"
+    rows = [_task_row(task_func, description, args, kwargs, group_id)
+            for task_func, description, args, kwargs in tasks]
+
+    task_store.insert_tasks(rows, connection=connection)
+    if connection is None:
+        wake_executor()
+
+    return group_id, [row['id'] for row in rows]
+
+
+def wake_executor():
+    """Acorda o executor embutido neste processo, se houver, para buscar tarefas novas"""
+    if executor.embedded and not _in_task_process:
+        if not executor.started:
+            start_worker()
+        executor.wake()
+
+
+def get_task_group(group_id: str) -> Optional[Dict[str, Any]]:
+    """Obtém o estado agregado de um grupo de tarefas, com as tarefas do grupo
+
+    Returns:
+        Dict[str, Any]: Resumo do grupo (ver task_store.get_group) e tarefas, ou None
+    """
+    group = task_store.get_group(group_id)
+    if group:
+        group['tasks'] = [task.to_dict() for task in task_store.list_group_tasks(group_id)]
+    return group
 
 
 def get_task_status(task_id: str) -> Optional[Dict[str, Any]]:
     """Obtém o status de uma tarefa
-    
+
     Args:
         task_id: ID da tarefa
-        
+
     Returns:
         Dict[str, Any]: Status da tarefa ou None se a tarefa não existir
     """
-    if task_id in task_status:
-        return task_status[task_id].to_dict()
+    task = task_store.get_task(task_id)
+    if task:
+        return task.to_dict()
     return None
 
 
 def update_task_progress(task_id: str, progress: int):
     """Atualiza o progresso de uma tarefa
-    
+
+    Pode ser chamada dentro da própria tarefa, em qualquer modo do executor.
+    Valores repetidos não geram nova gravação.
+
     Args:
         task_id: ID da tarefa
         progress: Progresso da tarefa (0-100)
     """
-    if task_id in task_status:
-        task_status[task_id].progress = progress
+    if not task_id or _last_progress.get(task_id) == progress:
+        return
+    _last_progress[task_id] = progress
+    task_store.update_progress(task_id, progress)
+
 
+def register_worker_command(app):
+    """Registra o comando ``flask worker``"""
 
-# Inicia o worker quando o módulo é carregado
-worker_thread = start_worker()
+    @app.cli.command('worker')
+    @click.option('--concurrency', type=int, default=None, help='Número máximo de tarefas simultâneas')
+    @click.option('--executor', 'mode', type=click.Choice(['thread', 'process']), default=None,
+                  help='Tipo de pool de execução')
+    @click.option('--no-scheduler', is_flag=True, help='Não participar da execução dos agendamentos')
+    def worker_command(concurrency, mode, no_scheduler):
+        """Executa o worker de tarefas assíncronas em primeiro plano"""
+        from app.utils.scheduler import scheduler
+
+        executor.init_app(app)
+        if concurrency:
+            executor.max_workers = concurrency
+        if mode:
+            executor.mode = mode
+        click.echo(f'Worker de tarefas iniciado ({executor.mode}, {executor.max_workers} workers)')
+        if not no_scheduler:
+            # Agendamentos locais (caches dos workers web) não se aplicam a este processo
+            scheduler.start(run_local=False)
+        executor.run_forever()
+        scheduler.shutdown()
+        click.echo('Worker de tarefas encerrado')
 
 
 # Função para inicializar o sistema de tarefas assíncronas
 def init_async_tasks(app):
     """Inicializa o sistema de tarefas assíncronas
-    
+
+    Com TASK_WORKER_EMBEDDED, cada worker web também consome a fila; o executor
+    é iniciado na primeira requisição de cada processo, para que workers do
+    gunicorn criados por fork não herdem threads do processo mestre.
+
     Args:
         app: Aplicação Flask
     """
-    @app.teardown_appcontext
-    def shutdown_worker(exception=None):
-        """Para o worker quando a aplicação é encerrada"""
-        stop_worker()
\ No newline at end of file
+    register_worker_command(app)
+    if _in_task_process:
+        return
+    executor.init_app(app)
+
+    if executor.embedded:
+        @app.before_request
+        def start_embedded_worker():
+            if not executor.started:
+                executor.start()
+
+
+@atexit.register
+def _shutdown_executor():
+    """Encerra o executor ao final do processo"""
+    if executor.started:
+        executor.shutdown()
@@ -0,0 +1,366 @@
+"""
+Leitura e geração de arquivos de registros de largura fixa, em blocos e por colunas
+
+O leiaute de cada tipo de registro é declarado (``Leiaute``/``Campo``) e os
+campos são decodificados em bloco com NumPy: cada bloco do arquivo (BLOCO_LEITURA
+bytes, lido de um mmap quando o arquivo não é compactado) vira uma matriz de
+bytes ``linhas x tamanho do registro``, da qual cada campo é recortado como uma
+coluna. Números e valores são convertidos e validados por operações vetoriais,
+e datas por uma tabela (cache) dos valores distintos, evitando um ``strptime``
+por registro. A memória usada depende só do tamanho do bloco.
+
+Uso::
+
+    leitor = LeitorLarguraFixa({'0': HEADER, '1': TRANSACAO, '9': TRAILER})
+    with ArquivoEntrada(file_path, ('.txt',)) as entrada:
+        for _, stream in entrada.arquivos():
+            for registros in leitor.ler(stream):
+                for linha, campos in registros:
+                    ...
+
+Na geração (``EscritorLarguraFixa``), os mesmos leiautes formatam um bloco de
+registros por vez: cada campo é formatado como uma coluna, as linhas são
+montadas com ``join`` e o bloco é codificado de uma vez, para ser gravado ou
+enviado em fluxo sem montar o arquivo inteiro em memória::
+
+    escritor = EscritorLarguraFixa({'0': HEADER, '1': TRANSACAO, '9': TRAILER})
+    for parte in escritor.escrever([('0', [header]), ('1', transacoes), ('9', [trailer])]):
+        saida.write(parte)
+"""
+import datetime
+import io
+import mmap
+import os
+from collections import namedtuple
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+
+BLOCO_LEITURA = 4 * 1024 * 1024  # 4 MiB
+
+_ESPACO = ord(' ')
+_ZERO = ord('0')
+_SEPARADOR = ord('\n')
+
+# Campo de um leiaute: posições [inicio, fim) a partir de 0 e tipo de conversão
+#   'texto': str sem espaços nas pontas
+#   'inteiro': int (None se em branco)
+#   'valor': float com 2 casas decimais implícitas (0 se em branco)
+#   'data': datetime.date no formato DDMMAAAA (None se em branco)
+# ``erro`` é a mensagem usada quando o conteúdo não pode ser convertido
+Campo = namedtuple('Campo', ['nome', 'inicio', 'fim', 'tipo', 'erro'], defaults=('texto', None))
+
+
+class Leiaute:
+    """Leiaute de um tipo de registro de largura fixa"""
+
+    def __init__(self, nome: str, tamanho: int, campos: Sequence[Campo]):
+        self.nome = nome
+        self.tamanho = tamanho
+        self.campos = tuple(campos)
+
+
+@lru_cache(maxsize=8192)
+def _data_ddmmaaaa(valor: bytes) -> Optional[datetime.date]:
+    """Converte DDMMAAAA; None se a data não existir (ex.: 31/02)"""
+    try:
+        return datetime.date(int(valor[4:8]), int(valor[2:4]), int(valor[0:2]))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _texto_ddmmaaaa(valor: datetime.date) -> str:
+    """Formata DDMMAAAA (datas se repetem muito nos arquivos; uma formatação por data distinta)"""
+    return f'{valor.day:02d}{valor.month:02d}{valor.year:04d}'
+
+
+class Registros:
+    """
+    Registros de um mesmo tipo decodificados de um bloco do arquivo
+
+    Attributes:
+        leiaute: Leiaute dos registros (None para tipos de registro desconhecidos)
+        tipo: Identificador do tipo (primeiro caractere do registro)
+        linhas: Número da linha de cada registro no arquivo (a partir de 1)
+        comprimentos: Tamanho de cada linha, sem a quebra de linha
+        colunas: Valores de cada campo, na ordem dos registros
+        erros: Ocorrências por registro ``(indice, mensagem)``: tamanho fora do
+            leiaute ou campo que não pôde ser convertido
+    """
+
+    def __init__(self, leiaute: Optional[Leiaute], tipo: str, linhas: np.ndarray, comprimentos: np.ndarray):
+        self.leiaute = leiaute
+        self.tipo = tipo
+        self.linhas = linhas
+        self.comprimentos = comprimentos
+        self.colunas: Dict[str, List[Any]] = {}
+        self.erros: List[Tuple[int, str]] = []
+
+    def __len__(self):
+        return len(self.linhas)
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Registros sem erro (tamanho ou conversão): (linha, campos)"""
+        invalidos = {indice for indice, _ in self.erros}
+        nomes = list(self.colunas)
+        for indice, valores in enumerate(zip(*(self.colunas[nome] for nome in nomes))):
+            if indice not in invalidos:
+                yield int(self.linhas[indice]), dict(zip(nomes, valores))
+
+    def primeiro(self) -> Optional[Dict[str, Any]]:
+        """Campos do primeiro registro sem erro (ex.: header), ou None"""
+        return next((campos for _, campos in self), None)
+
+
+class LeitorLarguraFixa:
+    """Lê registros de largura fixa de um arquivo, decodificando os campos em bloco"""
+
+    def __init__(self, leiautes: Dict[str, Leiaute], encoding: str = 'latin-1',
+                 bloco: int = BLOCO_LEITURA):
+        self.leiautes = {tipo.encode('ascii')[0]: leiaute for tipo, leiaute in leiautes.items()}
+        self.encoding = encoding
+        self.bloco = bloco
+        self.tamanho = max(leiaute.tamanho for leiaute in leiautes.values())
+
+    def ler(self, stream) -> Iterator[Registros]:
+        """
+        Lê o arquivo em blocos, agrupando os registros de cada bloco por tipo
+
+        Linhas em branco são ignoradas (mas contam na numeração). Linhas de
+        tamanho diferente do leiaute do seu tipo são registradas em ``erros``.
+
+        Args:
+            stream: Arquivo binário; se for um arquivo em disco, é lido via mmap.
+                A codificação deve ter um byte por caractere (ex.: latin-1)
+        """
+        numero_linha = 0
+        for bloco in self._blocos(stream):
+            linhas = bloco.replace(b'\r', b'').split(b'\n')
+            yield from self._decodificar(linhas, numero_linha)
+            numero_linha += len(linhas)
+
+    def _blocos(self, stream) -> Iterator[bytes]:
+        """Blocos do arquivo terminados em quebra de linha"""
+        mapa = None
+        if isinstance(getattr(stream, 'raw', None), io.FileIO) and os.fstat(stream.fileno()).st_size:
+            mapa = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapa is not None:
+            with mapa:
+                inicio = 0
+                while inicio < len(mapa):
+                    fim = mapa.find(b'\n', min(inicio + self.bloco, len(mapa)) - 1)
+                    fim = len(mapa) if fim < 0 else fim + 1
+                    bloco = mapa[inicio:fim]
+                    inicio = fim
+                    yield bloco[:-1] if bloco.endswith(b'\n') else bloco
+            return
+
+        resto = b''
+        while True:
+            dados = stream.read(self.bloco)
+            if not dados:
+                break
+            dados = resto + dados
+            fim = dados.rfind(b'\n')
+            if fim < 0:
+                resto = dados
+                continue
+            resto = dados[fim + 1:]
+            yield dados[:fim]
+        if resto:
+            yield resto
+
+    def _decodificar(self, linhas: List[bytes], deslocamento: int) -> Iterator[Registros]:
+        quantidade = len(linhas)
+        comprimentos = np.fromiter(map(len, linhas), dtype=np.int64, count=quantidade)
+        # Matriz de bytes (linhas x tamanho); posições além do fim da linha ficam em branco
+        matriz = np.array(linhas, dtype=f'S{self.tamanho}').view(np.uint8).reshape(quantidade, self.tamanho)
+        matriz[matriz == 0] = _ESPACO
+        numeros = np.arange(deslocamento + 1, deslocamento + quantidade + 1)
+
+        preenchidas = (matriz != _ESPACO).any(axis=1)
+        tipos = matriz[:, 0]
+        for tipo in np.unique(tipos[preenchidas]):
+            selecao = preenchidas & (tipos == tipo)
+            leiaute = self.leiautes.get(int(tipo))
+            registros = Registros(leiaute, bytes([tipo]).decode(self.encoding),
+                                  numeros[selecao], comprimentos[selecao])
+            if leiaute is not None:
+                self._verificar_tamanho(registros)
+                self._converter(registros, matriz[selecao])
+            yield registros
+
+    @staticmethod
+    def _verificar_tamanho(registros: Registros):
+        """
+        Registra como erro as linhas fora do tamanho do leiaute
+
+        Linhas maiores que o registro seriam truncadas na matriz e linhas menores
+        completadas com espaços; em ambos os casos os campos não são confiáveis.
+        """
+        tamanho = registros.leiaute.tamanho
+        for indice in np.flatnonzero(registros.comprimentos != tamanho).tolist():
+            registros.erros.append((indice, f'registro com tamanho diferente de {tamanho} posições: '
+                                            f'{int(registros.comprimentos[indice])}'))
+
+    def _converter(self, registros: Registros, matriz: np.ndarray):
+        for campo in registros.leiaute.campos:
+            coluna = matriz[:, campo.inicio:campo.fim]
+            largura = campo.fim - campo.inicio
+            brutos = np.ascontiguousarray(coluna).view(f'S{largura}').ravel()
+            if campo.tipo == 'texto':
+                registros.colunas[campo.nome] = self._converter_texto(coluna)
+            elif campo.tipo in ('inteiro', 'valor'):
+                registros.colunas[campo.nome] = self._converter_numero(registros, campo, coluna, brutos)
+            elif campo.tipo == 'data':
+                registros.colunas[campo.nome] = self._converter_data(registros, campo, brutos)
+            else:
+                raise ValueError(f'Tipo de campo desconhecido: {campo.tipo}')
+
+    def _converter_texto(self, coluna: np.ndarray) -> List[str]:
+        """
+        Textos da coluna sem espaços nas pontas
+
+        A coluna é concatenada com um separador (quebra de linha, que não ocorre
+        nos registros) e convertida com um único decode e split.
+        """
+        quantidade, largura = coluna.shape
+        texto = np.empty((quantidade, largura + 1), dtype=np.uint8)
+        texto[:, :largura] = coluna
+        texto[:, largura] = _SEPARADOR
+        return list(map(str.strip, texto.tobytes().decode(self.encoding).split('\n')[:-1]))
+
+    def _erro(self, registros: Registros, campo: Campo, indices, brutos: np.ndarray):
+        for indice in indices:
+            valor = brutos[indice].decode(self.encoding).strip()
+            registros.erros.append((int(indice), f'{campo.erro or campo.nome + " inválido"}: {valor}'))
+
+    def _converter_numero(self, registros: Registros, campo: Campo, coluna: np.ndarray,
+                          brutos: np.ndarray) -> list:
+        digitos = (coluna >= _ZERO) & (coluna <= _ZERO + 9)
+        espacos = coluna == _ESPACO
+        # Válido: só dígitos, com espaços apenas antes ou depois (um único trecho de dígitos)
+        trechos = digitos[:, 0].astype(np.int8) + (digitos[:, 1:] & ~digitos[:, :-1]).sum(axis=1)
+        validos = (digitos | espacos).all(axis=1) & (trechos <= 1)
+        self._erro(registros, campo, np.flatnonzero(~validos), brutos)
+
+        numeros = np.zeros(len(coluna), dtype=np.int64)
+        for posicao in range(coluna.shape[1]):
+            numeros = np.where(digitos[:, posicao], numeros * 10 + (coluna[:, posicao] - _ZERO), numeros)
+        em_branco = trechos == 0
+        if campo.tipo == 'inteiro':
+            return [None if vazio else numero for numero, vazio in zip(numeros.tolist(), em_branco.tolist())]
+        return (numeros / 100).tolist()
+
+    def _converter_data(self, registros: Registros, campo: Campo, brutos: np.ndarray) -> list:
+        # Uma conversão por data distinta do bloco
+        distintas, posicoes = np.unique(brutos, return_inverse=True)
+        convertidas = []
+        invalidas = set()
+        for indice, valor in enumerate(distintas.tolist()):
+            valor = valor.strip()
+            data = None
+            if valor:
+                data = _data_ddmmaaaa(valor) if len(valor) == 8 and valor.isdigit() else None
+                if data is None:
+                    invalidas.add(indice)
+            convertidas.append(data)
+        posicoes = posicoes.ravel()
+        if invalidas:
+            self._erro(registros, campo, np.flatnonzero(np.isin(posicoes, list(invalidas))), brutos)
+        tabela = np.empty(len(convertidas), dtype=object)
+        tabela[:] = convertidas
+        return tabela[posicoes].tolist()
+
+
+class EscritorLarguraFixa:
+    """Gera registros de largura fixa a partir dos leiautes, formatando os campos por coluna"""
+
+    def __init__(self, leiautes: Dict[str, Leiaute], encoding: str = 'latin-1', quebra_linha: str = '\n'):
+        self.leiautes = leiautes
+        self.encoding = encoding
+        self.quebra_linha = quebra_linha
+        # Por tipo: trechos fixos (tipo do registro e posições sem campo) e campos, na ordem das posições
+        self._trechos = {tipo: self._compilar(tipo, leiaute) for tipo, leiaute in leiautes.items()}
+
+    @staticmethod
+    def _compilar(tipo: str, leiaute: Leiaute) -> list:
+        modelo = tipo + ' ' * (leiaute.tamanho - len(tipo))
+        trechos = []
+        posicao = 0
+        for campo in sorted(leiaute.campos, key=lambda campo: campo.inicio):
+            if campo.inicio > posicao:
+                trechos.append(modelo[posicao:campo.inicio])
+            trechos.append(campo)
+            posicao = campo.fim
+        if posicao < leiaute.tamanho:
+            trechos.append(modelo[posicao:])
+        return trechos
+
+    def formatar(self, tipo: str, registros: Sequence[Mapping[str, Any]], **colunas: Sequence) -> str:
+        """
+        Formata um bloco de registros de um tipo (linhas separadas por ``quebra_linha``)
+
+        Args:
+            tipo: Tipo do registro (chave do leiaute)
+            registros: Valores dos campos de cada registro (dict ou linha de consulta);
+                campos ausentes ficam em branco
+            **colunas: Valores de campos informados por coluna, na ordem dos
+                registros (ex.: ``sequencia_registro=range(2, 2 + len(registros))``)
+
+        Raises:
+            ValueError: Número ou valor que não cabe no campo
+        """
+        partes = []
+        for trecho in self._trechos[tipo]:
+            if isinstance(trecho, str):
+                partes.append(repeat(trecho))
+                continue
+            valores = colunas[trecho.nome] if trecho.nome in colunas else \
+                [registro.get(trecho.nome) for registro in registros]
+            partes.append(self._formatar_coluna(trecho, valores))
+        return self.quebra_linha.join(map(''.join, zip(*partes)))
+
+    def escrever(self, blocos: Iterable[Tuple[str, Sequence[Mapping[str, Any]]]]) -> Iterator[bytes]:
+        """
+        Gera o arquivo em partes, um bloco de registros por vez, já codificado
+
+        Caracteres sem representação na codificação viram '?', mantendo o
+        tamanho dos registros. Não há quebra de linha após o último registro.
+
+        Args:
+            blocos: Pares ``(tipo, registros)`` ou ``(tipo, registros, colunas)``
+                (ver ``formatar``), na ordem do arquivo
+        """
+        separador = ''
+        for tipo, registros, *colunas in blocos:
+            if not len(registros):
+                continue
+            texto = separador + self.formatar(tipo, registros, **(colunas[0] if colunas else {}))
+            separador = self.quebra_linha
+            yield texto.encode(self.encoding, errors='replace')
+
+    @staticmethod
+    def _formatar_coluna(campo: Campo, valores: Sequence) -> List[str]:
+        largura = campo.fim - campo.inicio
+        if campo.tipo == 'texto':
+            branco = ' ' * largura
+            return [branco if valor is None else str(valor)[:largura].ljust(largura) for valor in valores]
+        if campo.tipo == 'data':
+            branco = ' ' * largura
+            return [branco if valor is None else _texto_ddmmaaaa(valor) for valor in valores]
+        if campo.tipo == 'inteiro':
+            textos = ['' if valor is None else str(int(valor)) for valor in valores]
+            formatados = [texto.zfill(largura) if texto else ' ' * largura for texto in textos]
+        elif campo.tipo == 'valor':
+            # 2 casas decimais implícitas; em branco vira zero, como na leitura
+            formatados = [str(round((valor or 0) * 100)).zfill(largura) for valor in valores]
+        else:
+            raise ValueError(f'Tipo de campo desconhecido: {campo.tipo}')
+        for texto in formatados:
+            if len(texto) > largura or texto.startswith('-'):
+                raise ValueError(f'{campo.nome}: valor não cabe em {largura} posições: {texto}')
+        return formatados
@@ -0,0 +1,97 @@
+"""
+Métricas internas simples (contadores e tempos) por processo
+
+Cada worker mantém os seus próprios valores. O endpoint /api/metrics expõe o
+estado do worker que atendeu a requisição, identificado pelo PID.
+"""
+import os
+import threading
+import time
+from flask import jsonify
+
+
+class MetricsRegistry:
+    """Registro thread-safe de contadores e observações de tempo"""
+
+    def __init__(self):
+        self._counters = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        if not labels:
+            return name
+        rotulos = ','.join(f'{k}={labels[k]}' for k in sorted(labels))
+        return f'{name}{{{rotulos}}}'
+
+    def increment(self, name, value=1, **labels):
+        """Incrementa um contador"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Registra uma observação (ex.: duração em segundos)"""
+        key = self._key(name, labels)
+        with self._lock:
+            stats = self._timings.get(key)
+            if stats is None:
+                stats = self._timings[key] = {'count': 0, 'sum': 0.0, 'max': 0.0}
+            stats['count'] += 1
+            stats['sum'] += value
+            stats['max'] = max(stats['max'], value)
+
+    def get(self, name, **labels):
+        """Valor atual de um contador"""
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self):
+        """Cópia do estado atual, com médias calculadas para as observações"""
+        with self._lock:
+            timings = {
+                key: dict(stats, avg=stats['sum'] / stats['count'] if stats['count'] else 0.0)
+                for key, stats in self._timings.items()
+            }
+            return {
+                'pid': os.getpid(),
+                'uptime': time.time() - self.started_at,
+                'counters': dict(self._counters),
+                'timings': timings
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = MetricsRegistry()
+
+
+def register_metrics_endpoint(app):
+    """
+    Registra o endpoint GET /api/metrics (apenas administradores)
+
+    Args:
+        app: Aplicação Flask
+    """
+    from app.auth.middleware import auth_required
+
+    @app.route('/api/metrics', methods=['GET'])
+    @auth_required(admin_required=True)
+    def get_metrics():
+        """
+        Retorna as métricas internas do worker atual
+        ---
+        tags:
+          - Monitoramento
+        security:
+          - BasicAuth: []
+        responses:
+          200:
+            description: Contadores e tempos registrados pelo worker
+        """
+        return jsonify(metrics.snapshot()), 200
@@ -0,0 +1,73 @@
+"""
+Resolução de credores e devedores pelo documento (CPF/CNPJ) normalizado
+
+O documento é normalizado para apenas dígitos e gravado em
+``documento_normalizado``, que possui índice único. A resolução de um lote
+consulta todos os documentos de uma vez e cadastra os que faltam com um único
+``INSERT ... ON CONFLICT DO NOTHING``, de modo que processos concorrentes não
+criam partes duplicadas.
+"""
+import re
+from typing import Dict, Any, Iterable, Optional
+from sqlalchemy import select, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+
+_NAO_DIGITOS = re.compile(r'\D')
+
+
+def normalizar_documento(documento: Optional[str]) -> Optional[str]:
+    """Mantém apenas os dígitos do CPF/CNPJ (None se não houver dígitos)"""
+    if not documento:
+        return None
+    return _NAO_DIGITOS.sub('', str(documento)) or None
+
+
+def _insert_ignorando_conflitos(model, linhas):
+    dialeto = db.engine.dialect.name
+    if dialeto == 'postgresql':
+        stmt = postgresql.insert(model).on_conflict_do_nothing(index_elements=['documento_normalizado'])
+    elif dialeto == 'sqlite':
+        stmt = sqlite.insert(model).on_conflict_do_nothing(index_elements=['documento_normalizado'])
+    else:
+        stmt = insert(model)
+    db.session.execute(stmt, linhas)
+
+
+def resolver_partes(model, partes: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Obtém os IDs de credores ou devedores de um lote, cadastrando os que não existem
+
+    Args:
+        model: Credor ou Devedor
+        partes: Dicionários com as colunas da parte (``documento`` obrigatório)
+
+    Returns:
+        Dict[str, int]: Mapa documento normalizado -> ID para o lote
+    """
+    por_documento = {}
+    for parte in partes:
+        normalizado = normalizar_documento(parte.get('documento'))
+        if normalizado and normalizado not in por_documento:
+            por_documento[normalizado] = dict(parte, documento_normalizado=normalizado)
+    if not por_documento:
+        return {}
+
+    def consultar(documentos):
+        return dict(db.session.execute(
+            select(model.documento_normalizado, model.id)
+            .where(model.documento_normalizado.in_(list(documentos)))
+        ).all())
+
+    ids = consultar(por_documento)
+    faltantes = [parte for documento, parte in por_documento.items() if documento not in ids]
+    if faltantes:
+        # Cadastrados por outro processo entre a consulta e o INSERT são ignorados e relidos
+        _insert_ignorando_conflitos(model, faltantes)
+        ids.update(consultar(parte['documento_normalizado'] for parte in faltantes))
+    return ids
+
+
+def resolver_parte(model, **colunas) -> int:
+    """Resolve uma única parte pelo documento (atalho para resolver_partes)"""
+    return resolver_partes(model, [colunas])[normalizar_documento(colunas.get('documento'))]
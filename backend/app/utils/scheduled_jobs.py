@@ -0,0 +1,95 @@
+"""
+Funções executadas pelos agendamentos periódicos (SCHEDULER_JOBS)
+"""
+import os
+import subprocess
+import sys
+from flask import current_app
+from app.utils.async_tasks import TaskStatus
+from app.utils.task_utils import clear_completed_tasks
+
+
+def limpar_tarefas():
+    """Remove tarefas finalizadas da fila, mantendo as falhas (dead-letter) por mais tempo
+
+    Returns:
+        dict: Quantidade de tarefas removidas por status
+    """
+    return {
+        'concluidas': clear_completed_tasks(current_app.config.get('TASK_RETENTION_COMPLETED'),
+                                            (TaskStatus.COMPLETED,)),
+        'falhas': clear_completed_tasks(current_app.config.get('TASK_RETENTION_FAILED'),
+                                        (TaskStatus.FAILED,))
+    }
+
+
+def backup_banco():
+    """Executa o script de backup do banco (scripts/backup_database.py)
+
+    Returns:
+        dict: Código de retorno e últimas linhas da saída do script
+    """
+    script = os.path.join(os.path.dirname(current_app.root_path), 'scripts', 'backup_database.py')
+    command = [sys.executable, script]
+    if current_app.config.get('BACKUP_CONFIG_FILE'):
+        command += ['--config', current_app.config['BACKUP_CONFIG_FILE']]
+
+    result = subprocess.run(command, cwd=os.path.dirname(script), capture_output=True, text=True,
+                            timeout=current_app.config.get('BACKUP_TIMEOUT', 3600))
+    saida = (result.stdout + result.stderr).strip().splitlines()[-10:]
+    if result.returncode != 0:
+        raise RuntimeError(f"Backup falhou (código {result.returncode}): {' | '.join(saida)}")
+    return {'returncode': result.returncode, 'saida': saida}
+
+
+def aquecer_cache_dashboard():
+    """Recalcula os endpoints do dashboard para manter o cache em memória do worker preenchido
+
+    Returns:
+        list: Endpoints recalculados
+    """
+    aquecidos = []
+    for rule in current_app.url_map.iter_rules():
+        if not rule.endpoint.startswith('dashboard.') or 'GET' not in rule.methods:
+            continue
+        view = current_app.view_functions[rule.endpoint]
+        # Chama a função com cache, sem a autenticação (execução interna)
+        cached_view = getattr(view, '__wrapped__', view)
+        with current_app.test_request_context(rule.rule, query_string={'no_cache': 'true'}):
+            cached_view()
+        aquecidos.append(rule.rule)
+    return aquecidos
+
+
+def limpar_uploads_expirados():
+    """Encerra uploads em partes sem atividade há mais de UPLOAD_SESSION_TTL, removendo os arquivos parciais
+
+    Returns:
+        dict: Quantidade de uploads expirados
+    """
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models import UploadFragmentado
+    from app.utils.uploads import caminho_parcial, descartar_upload
+
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+    expirados = UploadFragmentado.query.filter(
+        UploadFragmentado.status == 'Em andamento',
+        UploadFragmentado.data_atualizacao < limite
+    ).all()
+    for upload in expirados:
+        descartar_upload(caminho_parcial(upload.id))
+        upload.status = 'Expirado'
+    db.session.commit()
+    return {'expirados': len(expirados)}
+
+
+def limpar_validacoes_previas():
+    """Remove os relatórios de validação prévia (validate_only) gerados há mais de VALIDACAO_PREVIA_TTL
+
+    Returns:
+        dict: Quantidade de relatórios removidos
+    """
+    from app.utils.validacao_previa import limpar_relatorios_expirados
+
+    return {'removidos': limpar_relatorios_expirados(current_app.config.get('VALIDACAO_PREVIA_TTL', 86400))}
@@ -0,0 +1,384 @@
+"""
+Agendador de tarefas periódicas
+
+Os agendamentos (SCHEDULER_JOBS) usam gatilhos por intervalo ou expressões no
+formato do cron (minuto, hora, dia, mês, dia da semana; horários em UTC). Cada
+execução é enfileirada como uma tarefa comum, de modo que resultado, erro,
+retentativas e duração ficam disponíveis na API de tarefas.
+
+Apenas um processo (o líder) enfileira as execuções. No PostgreSQL a liderança
+é obtida com um advisory lock de sessão, mantido enquanto a conexão do líder
+estiver aberta; se o líder cair, outro processo assume no ciclo seguinte. A
+próxima execução de cada agendamento também é avançada com um UPDATE
+condicional na tabela ``agendamentos``, o que impede execuções duplicadas mesmo
+sem o lock (ex.: SQLite em execução local).
+
+Agendamentos ``local`` (ex.: aquecimento dos caches em memória dos workers web)
+não passam pela fila nem pela eleição: são executados em cada processo.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+from sqlalchemy import select, update, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Agendamento
+from app.utils import task_store
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+agendamentos_table = Agendamento.__table__
+
+# Chave do advisory lock que elege o processo líder do agendador no PostgreSQL
+SCHEDULER_LOCK_KEY = 720190002
+
+
+class IntervalTrigger:
+    """Gatilho por intervalo fixo em segundos"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError('O intervalo deve ser positivo')
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __str__(self):
+        return f'interval:{self.seconds:g}s'
+
+
+class CronTrigger:
+    """Gatilho no formato do cron: ``minuto hora dia mês dia_da_semana``
+
+    Aceita ``*``, valores, intervalos (``1-5``), listas (``1,15``) e passos
+    (``*/10``). Domingo é 0 (ou 7). Como no cron, quando dia e dia da semana
+    são restritos, basta um deles coincidir.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f'Expressão cron inválida: {expression}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for item in field.split(','):
+            step = 1
+            if '/' in item:
+                item, step = item.split('/', 1)
+                step = int(step)
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(v) for v in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f'Campo cron inválido: {field}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays  # Python: segunda = 0
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        # Avança pelo maior campo que não coincide (mês, dia, hora, minuto)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f'Expressão cron sem próxima execução: {self.expression}')
+
+    def __str__(self):
+        return f'cron:{self.expression}'
+
+
+class Job:
+    """Agendamento periódico de uma função de tarefa"""
+
+    def __init__(self, name: str, func: str, trigger, args=(), kwargs=None, local: bool = False):
+        self.name = name
+        self.func = func  # Caminho "modulo:funcao", como nas tarefas da fila
+        self.trigger = trigger
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.local = local
+
+    @classmethod
+    def from_config(cls, name: str, spec: Dict[str, Any]) -> 'Job':
+        """Cria o agendamento a partir de uma entrada de SCHEDULER_JOBS"""
+        if spec.get('cron'):
+            trigger = CronTrigger(spec['cron'])
+        elif spec.get('interval'):
+            trigger = IntervalTrigger(spec['interval'])
+        else:
+            raise ValueError(f'Agendamento {name} sem gatilho (interval ou cron)')
+        return cls(name, spec['func'], trigger, spec.get('args', ()), spec.get('kwargs'),
+                   spec.get('local', False))
+
+
+class Scheduler:
+    """Executa os agendamentos em uma thread por processo"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.enabled = True
+        self.tick = 5
+        self.run_local = True
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._leader_connection = None
+        self._local_next: Dict[str, datetime] = {}
+        self._local_status: Dict[str, Dict[str, Any]] = {}
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('SCHEDULER_ENABLED', True)
+        self.tick = app.config.get('SCHEDULER_TICK', self.tick)
+        self.jobs = {
+            name: Job.from_config(name, spec)
+            for name, spec in app.config.get('SCHEDULER_JOBS', {}).items()
+            if spec.get('enabled', True)
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_connection is not None
+
+    def start(self, run_local: bool = True):
+        """Inicia a thread do agendador neste processo (não sobrevive a fork)"""
+        if not self.enabled or not self.jobs:
+            return
+        with self._lock:
+            if self.started:
+                return
+            self.run_local = run_local
+            self._pid = os.getpid()
+            self._leader_connection = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='task-scheduler', daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self.started:
+            self._thread.join(timeout=self.tick + 5)
+        self._release_leadership()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._app.app_context():
+                    self.run_pending()
+            except Exception as e:
+                logger.error(f"Erro no agendador de tarefas: {str(e)}")
+                self._release_leadership()
+            self._stop.wait(self.tick)
+
+    def run_pending(self, now: datetime = None):
+        """Executa um ciclo do agendador (requer contexto de aplicação)"""
+        now = now or datetime.utcnow()
+        if self.run_local:
+            for job in self.jobs.values():
+                if job.local:
+                    self._run_local_job(job, now)
+
+        shared = [job for job in self.jobs.values() if not job.local]
+        if shared and self._acquire_leadership():
+            for job in shared:
+                self._run_shared_job(job, now)
+
+    def _acquire_leadership(self) -> bool:
+        if db.engine.dialect.name != 'postgresql':
+            return True
+
+        if self._leader_connection is not None:
+            try:
+                self._leader_connection.execute(text('SELECT 1'))
+                return True
+            except Exception:
+                # Conexão perdida: o lock foi liberado pelo servidor
+                self._release_leadership()
+
+        connection = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            acquired = connection.execute(
+                text('SELECT pg_try_advisory_lock(:key)'), {'key': SCHEDULER_LOCK_KEY}
+            ).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+
+        self._leader_connection = connection
+        logger.info(f"Processo {os.getpid()} assumiu a liderança do agendador")
+        return True
+
+    def _release_leadership(self):
+        connection, self._leader_connection = self._leader_connection, None
+        if connection is not None:
+            try:
+                connection.close()  # Encerra a sessão e libera o advisory lock
+            except Exception:
+                pass
+
+    def _run_shared_job(self, job: Job, now: datetime):
+        from app.utils.async_tasks import enqueue_task, _resolve_task
+
+        with db.engine.begin() as connection:
+            row = connection.execute(
+                select(agendamentos_table).where(agendamentos_table.c.nome == job.name)
+            ).one_or_none()
+
+        if row is None:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(agendamentos_table.insert().values(
+                        nome=job.name, proxima_execucao=job.trigger.next_after(now)
+                    ))
+            except IntegrityError:
+                pass  # Registrado por outro processo
+            return
+
+        if row.proxima_execucao > now:
+            return
+
+        # Reserva a execução avançando a próxima data; só um processo vence o UPDATE.
+        # Execuções perdidas (ex.: sistema fora do ar) são agrupadas em uma só.
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                update(agendamentos_table)
+                .where(agendamentos_table.c.nome == job.name,
+                       agendamentos_table.c.proxima_execucao == row.proxima_execucao)
+                .values(proxima_execucao=job.trigger.next_after(now), ultima_execucao=now)
+            ).rowcount
+        if not claimed:
+            return
+
+        # Não sobrepor execuções do mesmo agendamento
+        if row.ultima_task_id:
+            anterior = task_store.get_task(row.ultima_task_id)
+            if anterior is not None and anterior.status in (task_store.PENDING, task_store.RUNNING):
+                logger.warning(f"Agendamento {job.name} ignorado: execução anterior ainda em andamento")
+                metrics.increment('agendador.ignorados', job=job.name)
+                return
+
+        task_id = enqueue_task(_resolve_task(job.func), f'Agendamento {job.name}', *job.args,
+                               task_type=job.name, **job.kwargs)
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(agendamentos_table)
+                .where(agendamentos_table.c.nome == job.name)
+                .values(ultima_task_id=task_id)
+            )
+        metrics.increment('agendador.execucoes', job=job.name)
+
+    def _run_local_job(self, job: Job, now: datetime):
+        from app.utils.async_tasks import _resolve_task
+
+        # Agendamentos locais executam logo ao iniciar o processo
+        next_run = self._local_next.setdefault(job.name, now)
+        if next_run > now:
+            return
+        self._local_next[job.name] = job.trigger.next_after(now)
+
+        inicio = time.time()
+        status = {'last_run_at': now.isoformat(), 'error': None}
+        try:
+            status['result'] = _resolve_task(job.func)(*job.args, **job.kwargs)
+        except Exception as e:
+            db.session.rollback()
+            status['error'] = str(e)
+            metrics.increment('agendador.falhas', job=job.name)
+            logger.error(f"Erro no agendamento local {job.name}: {str(e)}")
+        finally:
+            db.session.remove()
+        status['duration'] = time.time() - inicio
+        metrics.observe('agendador.duracao', status['duration'], job=job.name)
+        self._local_status[job.name] = status
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Agendamentos com a próxima execução e a última tarefa (ou execução local neste worker)"""
+        estados = {row.nome: row for row in Agendamento.query.filter(
+            Agendamento.nome.in_(list(self.jobs))).all()}
+        jobs = []
+        for job in self.jobs.values():
+            item = {'name': job.name, 'trigger': str(job.trigger), 'function': job.func, 'local': job.local}
+            if job.local:
+                next_run = self._local_next.get(job.name)
+                item['next_run_at'] = next_run.isoformat() if next_run else None
+                item['last_run'] = self._local_status.get(job.name)
+            else:
+                estado = estados.get(job.name)
+                last_task = task_store.get_task(estado.ultima_task_id) if estado and estado.ultima_task_id else None
+                item['next_run_at'] = estado.proxima_execucao.isoformat() if estado else None
+                item['last_run_at'] = estado.ultima_execucao.isoformat() if estado and estado.ultima_execucao else None
+                item['last_task'] = last_task.to_dict() if last_task else None
+            jobs.append(item)
+        return jobs
+
+
+# Agendador compartilhado pelo processo
+scheduler = Scheduler()
+
+
+def init_scheduler(app):
+    """Inicializa o agendador de tarefas periódicas
+
+    Nos workers web a thread é iniciada na primeira requisição de cada processo
+    (como o executor embutido); o comando ``flask worker`` também a inicia.
+
+    Args:
+        app: Aplicação Flask
+    """
+    from app.utils import async_tasks
+
+    if async_tasks._in_task_process:
+        return
+    scheduler.init_app(app)
+
+    if scheduler.enabled and scheduler.jobs:
+        @app.before_request
+        def start_scheduler():
+            if not scheduler.started:
+                scheduler.start()
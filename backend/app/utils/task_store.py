@@ -0,0 +1,514 @@
+"""
+Persistência da fila de tarefas assíncronas na tabela ``tasks``
+
+Todas as operações usam conexões próprias (``db.engine.begin()``), de modo que
+o estado das tarefas é gravado imediatamente e não depende da transação da
+requisição ou da própria tarefa.
+
+A reserva de tarefas usa ``SELECT ... FOR UPDATE SKIP LOCKED`` no PostgreSQL,
+permitindo vários workers consumindo a mesma fila sem disputa. Nos demais
+bancos (ex.: SQLite em execução local) a reserva é feita com um UPDATE
+condicional ao status ``pending``.
+
+Escalonamento: a próxima tarefa é escolhida pela maior prioridade e, entre
+tenants (usuário + UF) com a mesma prioridade, pelo tenant com menos tarefas em
+execução e atendido há mais tempo (round-robin). Tenants que atingiram o limite
+de tarefas simultâneas são ignorados até liberarem capacidade. As consultas de
+escalonamento olham só as tarefas pendentes, as em execução e os atendimentos
+da janela recente (``janela_atendimento``), com índices próprios, para que o
+custo da reserva não cresça com o histórico da fila.
+"""
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Iterable, List
+from sqlalchemy import select, update, delete, func, text, or_, case
+from app import db
+from app.models import Task
+from app.utils.metrics import metrics
+
+tasks_table = Task.__table__
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# Tentativas de reserva quando outro worker ganha a disputa (bancos sem SKIP LOCKED)
+CLAIM_ATTEMPTS = 5
+
+# Chave do advisory lock que serializa a escolha de tarefas no PostgreSQL
+CLAIM_LOCK_KEY = 720190001
+
+# Janela (segundos) de atendimentos considerada no round-robin entre tenants;
+# tenants não atendidos nesse período contam como os atendidos há mais tempo
+FAIRNESS_WINDOW = 3600
+
+# Sinaliza alterações de tarefas feitas neste processo (acorda os streams de progresso)
+_changed = threading.Condition()
+
+
+def _notify_change():
+    with _changed:
+        _changed.notify_all()
+
+
+def wait_for_change(timeout: float):
+    """Aguarda até que uma tarefa seja alterada neste processo ou o tempo se esgote"""
+    with _changed:
+        _changed.wait(timeout)
+
+
+def _next_version():
+    """Incrementa a versão da tarefa (usada para retomar streams de progresso)"""
+    return tasks_table.c.versao + 1
+
+
+def tenant_key(usuario_id=None, uf=None) -> str:
+    """Identificação do tenant usada na justiça do escalonamento"""
+    return f"{usuario_id or ''}:{(uf or '').upper()}"
+
+
+def task_row(task_id: str, descricao: str, tipo: str, funcao: str, args, kwargs,
+             prioridade: int = 0, usuario_id: int = None, uf: str = None, max_tentativas: int = 1,
+             grupo: str = None) -> Dict[str, Any]:
+    """Monta a linha de uma nova tarefa pendente"""
+    return {
+        'id': task_id,
+        'descricao': descricao,
+        'tipo': tipo,
+        'funcao': funcao,
+        'argumentos': json.dumps({'args': list(args), 'kwargs': kwargs}),
+        'status': PENDING,
+        'prioridade': prioridade,
+        'usuario_id': usuario_id,
+        'uf': uf.upper() if uf else None,
+        'tenant': tenant_key(usuario_id, uf),
+        'grupo': grupo,
+        'tentativas': 0,
+        'max_tentativas': max(1, max_tentativas),
+        'progresso': 0,
+        'versao': 1,
+        'data_criacao': datetime.utcnow()
+    }
+
+
+def insert_task(task_id: str, descricao: str, tipo: str, funcao: str, args, kwargs,
+                prioridade: int = 0, usuario_id: int = None, uf: str = None, max_tentativas: int = 1):
+    """Insere uma nova tarefa pendente"""
+    insert_tasks([task_row(task_id, descricao, tipo, funcao, args, kwargs, prioridade=prioridade,
+                           usuario_id=usuario_id, uf=uf, max_tentativas=max_tentativas)])
+
+
+def insert_tasks(rows: List[Dict[str, Any]], connection=None):
+    """
+    Insere várias tarefas pendentes com um único comando
+
+    Args:
+        rows: Linhas montadas com task_row
+        connection: Conexão de uma transação em andamento (ex.: db.session.connection()).
+            As tarefas só ficam visíveis aos workers após o commit dessa transação.
+            Sem conexão, são gravadas em transação própria.
+    """
+    if not rows:
+        return
+    if connection is not None:
+        connection.execute(tasks_table.insert(), rows)
+    else:
+        with db.engine.begin() as own_connection:
+            own_connection.execute(tasks_table.insert(), rows)
+    _notify_change()
+
+
+def _pending_filter(exclude_types: Iterable[str]):
+    conditions = [
+        tasks_table.c.status == PENDING,
+        or_(tasks_table.c.proxima_execucao.is_(None), tasks_table.c.proxima_execucao <= datetime.utcnow())
+    ]
+    exclude_types = list(exclude_types)
+    if exclude_types:
+        conditions.append(tasks_table.c.tipo.notin_(exclude_types))
+    return conditions
+
+
+def _rank_tenants(connection, exclude_types, tenant_cap, janela_atendimento=FAIRNESS_WINDOW):
+    """
+    Ordena os tenants com tarefas pendentes elegíveis
+
+    Ordem: maior prioridade pendente, menos tarefas em execução, atendimento
+    mais antigo e, no empate, a tarefa pendente mais antiga. Tenants no limite
+    de concorrência são descartados. O último atendimento é procurado só nos
+    últimos ``janela_atendimento`` segundos (varredura limitada do índice
+    tenant + data_inicio), não em todo o histórico.
+    """
+    conditions = _pending_filter(exclude_types)
+    pendentes = connection.execute(
+        select(tasks_table.c.tenant, func.max(tasks_table.c.prioridade), func.min(tasks_table.c.data_criacao))
+        .where(*conditions)
+        .group_by(tasks_table.c.tenant)
+    ).all()
+    if not pendentes:
+        return []
+
+    tenants = [row[0] for row in pendentes]
+    em_execucao = dict(connection.execute(
+        select(tasks_table.c.tenant, func.count())
+        .where(tasks_table.c.status == RUNNING, tasks_table.c.tenant.in_(tenants))
+        .group_by(tasks_table.c.tenant)
+    ).all())
+    ultimo_atendimento = dict(connection.execute(
+        select(tasks_table.c.tenant, func.max(tasks_table.c.data_inicio))
+        .where(tasks_table.c.tenant.in_(tenants),
+               tasks_table.c.data_inicio >= datetime.utcnow() - timedelta(seconds=janela_atendimento))
+        .group_by(tasks_table.c.tenant)
+    ).all())
+
+    candidatos = [
+        (tenant, prioridade or 0, mais_antiga or datetime.min) for tenant, prioridade, mais_antiga in pendentes
+        if not tenant_cap or em_execucao.get(tenant, 0) < tenant_cap
+    ]
+    candidatos.sort(key=lambda item: (
+        -item[1],
+        em_execucao.get(item[0], 0),
+        ultimo_atendimento.get(item[0]) or datetime.min,
+        item[2]
+    ))
+    return [item[0] for item in candidatos]
+
+
+def _load_claimed(connection, task_id):
+    row = connection.execute(
+        select(tasks_table.c.id, tasks_table.c.tipo, tasks_table.c.funcao, tasks_table.c.argumentos,
+               tasks_table.c.prioridade, tasks_table.c.data_criacao, tasks_table.c.worker)
+        .where(tasks_table.c.id == task_id)
+    ).one()
+    argumentos = json.loads(row.argumentos or '{}')
+    return {
+        'id': row.id,
+        'worker': row.worker,
+        'tipo': row.tipo,
+        'funcao': row.funcao,
+        'prioridade': row.prioridade,
+        'data_criacao': row.data_criacao,
+        'args': tuple(argumentos.get('args', ())),
+        'kwargs': argumentos.get('kwargs', {})
+    }
+
+
+def claim_task(worker_id: str, exclude_types: Iterable[str] = (),
+               tenant_cap: int = None, janela_atendimento: int = FAIRNESS_WINDOW) -> Optional[Dict[str, Any]]:
+    """
+    Reserva a próxima tarefa pendente para o worker informado
+
+    Args:
+        worker_id: Identificação do worker (host:pid)
+        exclude_types: Tipos de tarefa que o worker não pode executar agora
+        tenant_cap: Máximo de tarefas simultâneas por tenant (usuário + UF)
+        janela_atendimento: Segundos de histórico considerados no round-robin entre tenants
+
+    Returns:
+        dict com id, tipo, funcao, args e kwargs, ou None se não houver tarefa
+    """
+    exclude_types = list(exclude_types)
+    postgres = db.engine.dialect.name == 'postgresql'
+
+    for _ in range(CLAIM_ATTEMPTS):
+        claimed = None
+        agora = datetime.utcnow()
+        with db.engine.begin() as connection:
+            if postgres:
+                # Serializa a escolha entre workers para que os limites por tenant sejam exatos
+                connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': CLAIM_LOCK_KEY})
+
+            tenants = _rank_tenants(connection, exclude_types, tenant_cap, janela_atendimento)
+            if not tenants:
+                return None
+
+            for tenant in tenants:
+                stmt = (
+                    select(tasks_table.c.id)
+                    .where(*_pending_filter(exclude_types), tasks_table.c.tenant == tenant)
+                    .order_by(tasks_table.c.prioridade.desc(), tasks_table.c.data_criacao)
+                    .limit(1)
+                )
+                if postgres:
+                    stmt = stmt.with_for_update(skip_locked=True)
+                task_id = connection.execute(stmt).scalar()
+                if task_id is None:
+                    continue
+
+                result = connection.execute(
+                    update(tasks_table)
+                    .where(tasks_table.c.id == task_id, tasks_table.c.status == PENDING)
+                    .values(status=RUNNING, worker=worker_id, data_inicio=agora, heartbeat=agora,
+                            proxima_execucao=None, tentativas=tasks_table.c.tentativas + 1,
+                            versao=_next_version())
+                )
+                if result.rowcount == 1:
+                    claimed = _load_claimed(connection, task_id)
+                    break
+
+        if claimed:
+            espera = (agora - claimed['data_criacao']).total_seconds() if claimed['data_criacao'] else 0
+            metrics.observe('tarefas.tempo_espera', espera, classe=claimed['tipo'])
+            _notify_change()
+            return claimed
+        if postgres:
+            return None
+    return None
+
+
+def _owned_by(task_id: str, worker_id: str) -> list:
+    """Filtro da tarefa ainda em execução pelo worker (não devolvida à fila nem finalizada)"""
+    return [tasks_table.c.id == task_id, tasks_table.c.worker == worker_id, tasks_table.c.status == RUNNING]
+
+
+def mark_finished(task_id: str, worker_id: str, status: str, resultado=None, erro: str = None) -> bool:
+    """
+    Registra o término (com sucesso ou falha) de uma tarefa
+
+    Só altera a tarefa se ela ainda estiver em execução pelo worker: uma tarefa
+    devolvida à fila por falta de heartbeat e reservada por outro worker não é
+    sobrescrita pela execução antiga.
+
+    Returns:
+        bool: Se o término foi registrado
+    """
+    values = dict(status=status, data_fim=datetime.utcnow(), erro=erro, versao=_next_version())
+    if status == COMPLETED:
+        values['progresso'] = 100
+        values['resultado'] = json.dumps(resultado, default=str) if resultado is not None else None
+    with db.engine.begin() as connection:
+        result = connection.execute(update(tasks_table).where(*_owned_by(task_id, worker_id)).values(**values))
+    if result.rowcount != 1:
+        return False
+    _notify_change()
+    return True
+
+
+def backoff_delay(tentativa: int, base_delay: float, max_delay: float) -> float:
+    """Atraso exponencial com jitter (entre metade e o total do atraso calculado)"""
+    atraso = min(max_delay, base_delay * (2 ** max(0, tentativa - 1)))
+    return random.uniform(atraso / 2, atraso)
+
+
+def record_failure(task_id: str, worker_id: str, erro: str, erro_detalhe: str = None, transitorio: bool = False,
+                   base_delay: float = 5, max_delay: float = 300) -> Optional[str]:
+    """
+    Registra a falha de uma execução, agendando nova tentativa quando cabível
+
+    Como em mark_finished, só altera a tarefa se ela ainda estiver em execução
+    pelo worker.
+
+    Args:
+        task_id: ID da tarefa
+        worker_id: Worker que executou a tarefa
+        erro: Mensagem da falha
+        erro_detalhe: Traceback da falha
+        transitorio: Se o erro é transitório (ex.: falha de conexão com o banco)
+        base_delay: Atraso base do backoff em segundos
+        max_delay: Atraso máximo do backoff em segundos
+
+    Returns:
+        Optional[str]: Novo status da tarefa (pending para retentativa ou failed),
+        ou None se a tarefa não está mais em execução pelo worker
+    """
+    with db.engine.begin() as connection:
+        row = connection.execute(
+            select(tasks_table.c.tentativas, tasks_table.c.max_tentativas)
+            .where(*_owned_by(task_id, worker_id))
+        ).one_or_none()
+        if row is None:
+            return None
+
+        tentativas = row.tentativas or 0
+        if transitorio and tentativas < (row.max_tentativas or 1):
+            proxima = datetime.utcnow() + timedelta(seconds=backoff_delay(tentativas, base_delay, max_delay))
+            values = dict(status=PENDING, proxima_execucao=proxima, worker=None, heartbeat=None)
+            status = PENDING
+        else:
+            values = dict(status=FAILED, data_fim=datetime.utcnow())
+            status = FAILED
+
+        result = connection.execute(
+            update(tasks_table).where(*_owned_by(task_id, worker_id))
+            .values(erro=erro, erro_detalhe=erro_detalhe, versao=_next_version(), **values)
+        )
+    if result.rowcount != 1:
+        return None
+    _notify_change()
+    return status
+
+
+def list_dead_letter(task_type: str = None, limit: int = 100) -> List[Task]:
+    """Lista as tarefas com falha definitiva (dead-letter), mais recentes primeiro"""
+    query = Task.query.filter(Task.status == FAILED)
+    if task_type:
+        query = query.filter(Task.tipo == task_type)
+    return query.order_by(Task.data_fim.desc()).limit(limit).all()
+
+
+def requeue_dead_letter(task_ids: Iterable[str] = None, task_type: str = None) -> List[str]:
+    """
+    Devolve à fila tarefas com falha definitiva, zerando as tentativas
+
+    Os argumentos originais (incluindo o caminho do arquivo já salvo em
+    UPLOAD_FOLDER) são reaproveitados.
+
+    Args:
+        task_ids: IDs das tarefas (opcional)
+        task_type: Tipo das tarefas (opcional)
+
+    Returns:
+        List[str]: IDs das tarefas reenfileiradas
+    """
+    conditions = [tasks_table.c.status == FAILED]
+    if task_ids is not None:
+        conditions.append(tasks_table.c.id.in_(list(task_ids)))
+    if task_type:
+        conditions.append(tasks_table.c.tipo == task_type)
+
+    with db.engine.begin() as connection:
+        ids = list(connection.execute(select(tasks_table.c.id).where(*conditions)).scalars())
+        if ids:
+            connection.execute(
+                update(tasks_table)
+                .where(tasks_table.c.id.in_(ids), tasks_table.c.status == FAILED)
+                .values(status=PENDING, tentativas=0, progresso=0, proxima_execucao=None,
+                        erro=None, erro_detalhe=None, resultado=None, worker=None,
+                        data_inicio=None, data_fim=None, heartbeat=None, versao=_next_version())
+            )
+    if ids:
+        _notify_change()
+    return ids
+
+
+def update_progress(task_id: str, progresso: int):
+    """Atualiza o progresso de uma tarefa em execução (também renova o heartbeat)"""
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(tasks_table)
+            .where(tasks_table.c.id == task_id)
+            .values(progresso=progresso, heartbeat=datetime.utcnow(), versao=_next_version())
+        )
+    _notify_change()
+
+
+def touch_heartbeats(task_ids: Iterable[str]):
+    """Renova o heartbeat das tarefas em execução neste worker"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(tasks_table)
+            .where(tasks_table.c.id.in_(task_ids), tasks_table.c.status == RUNNING)
+            .values(heartbeat=datetime.utcnow())
+        )
+
+
+def requeue_stale(timeout: int) -> int:
+    """
+    Devolve à fila tarefas em execução cujo worker parou de enviar heartbeat
+
+    Returns:
+        int: Quantidade de tarefas devolvidas
+    """
+    limite = datetime.utcnow() - timedelta(seconds=timeout)
+    inativas = [tasks_table.c.status == RUNNING, tasks_table.c.heartbeat < limite]
+    with db.engine.begin() as connection:
+        # Tarefas que já esgotaram as tentativas (ex.: derrubam o worker) vão para o dead-letter
+        esgotadas = connection.execute(
+            update(tasks_table)
+            .where(*inativas, tasks_table.c.tentativas >= tasks_table.c.max_tentativas)
+            .values(status=FAILED, erro='Worker interrompido durante a execução',
+                    data_fim=datetime.utcnow(), versao=_next_version())
+        )
+        result = connection.execute(
+            update(tasks_table)
+            .where(*inativas)
+            .values(status=PENDING, worker=None, data_inicio=None, heartbeat=None, versao=_next_version())
+        )
+    if result.rowcount or esgotadas.rowcount:
+        _notify_change()
+    return result.rowcount
+
+
+def get_tasks_snapshot(task_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Obtém o estado atual de várias tarefas com uma única consulta por chave primária
+
+    Returns:
+        Lista de dicionários no formato de Task.to_dict() acrescidos da chave 'versao'
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return []
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(tasks_table).where(tasks_table.c.id.in_(task_ids))
+        ).mappings().all()
+    return [dict(Task(**row).to_dict(), versao=row['versao'] or 0) for row in rows]
+
+
+def get_group(grupo: str) -> Optional[Dict[str, Any]]:
+    """
+    Resume o estado de um grupo de tarefas com uma consulta agregada
+
+    O progresso do grupo é a média do progresso das tarefas, contando como 100%
+    as já finalizadas (concluídas ou com falha definitiva).
+
+    Returns:
+        Dict com total, contagem por status, progresso e status do grupo, ou None
+    """
+    progresso_efetivo = case((tasks_table.c.status.in_([COMPLETED, FAILED]), 100),
+                             else_=func.coalesce(tasks_table.c.progresso, 0))
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(tasks_table.c.status, func.count(), func.sum(progresso_efetivo))
+            .where(tasks_table.c.grupo == grupo)
+            .group_by(tasks_table.c.status)
+        ).all()
+    if not rows:
+        return None
+
+    counts = {PENDING: 0, RUNNING: 0, COMPLETED: 0, FAILED: 0}
+    total = 0
+    soma_progresso = 0
+    for status, quantidade, progresso in rows:
+        counts[status] = quantidade
+        total += quantidade
+        soma_progresso += progresso or 0
+
+    if counts[PENDING] or counts[RUNNING]:
+        status = RUNNING if counts[RUNNING] or counts[COMPLETED] or counts[FAILED] else PENDING
+    else:
+        status = FAILED if counts[FAILED] else COMPLETED
+    return {
+        'group_id': grupo,
+        'status': status,
+        'total': total,
+        'counts': counts,
+        'progress': int(soma_progresso / total)
+    }
+
+
+def list_group_tasks(grupo: str) -> List[Task]:
+    """Lista as tarefas de um grupo, na ordem de criação"""
+    return Task.query.filter_by(grupo=grupo).order_by(Task.data_criacao, Task.id).all()
+
+
+def get_task(task_id: str) -> Optional[Task]:
+    """Obtém uma tarefa pelo ID"""
+    return db.session.get(Task, task_id)
+
+
+def delete_finished(older_than: int = None, statuses: Iterable[str] = (COMPLETED, FAILED)) -> int:
+    """Remove tarefas concluídas ou com falha, opcionalmente apenas as mais antigas"""
+    stmt = delete(tasks_table).where(tasks_table.c.status.in_(list(statuses)))
+    if older_than:
+        stmt = stmt.where(tasks_table.c.data_fim < datetime.utcnow() - timedelta(seconds=older_than))
+    with db.engine.begin() as connection:
+        result = connection.execute(stmt)
+    return result.rowcount
@@ -1,76 +1,101 @@
+from datetime import datetime, timedelta
 from typing import Dict, List, Any
-from app.utils.async_tasks import task_status, TaskStatus
+from app import db
+from app.models import Task
+from app.utils import task_store
+from app.utils.async_tasks import TaskStatus
 
 def list_tasks(status_filter=None, limit=None) -> List[Dict[str, Any]]:
-    """Lista todas as tarefas, opcionalmente filtradas por status
-    
+    """Lista as tarefas da fila persistente, opcionalmente filtradas por status
+
     Args:
         status_filter: Filtro de status (opcional)
         limit: Limite de tarefas a serem retornadas (opcional)
-        
+
     Returns:
-        List[Dict[str, Any]]: Lista de tarefas
+        List[Dict[str, Any]]: Lista de tarefas (mais recentes primeiro)
     """
-    tasks = []
-    
-    # Converte o dicionário de tarefas em uma lista
-    for task_id, task in task_status.items():
-        # Filtra por status, se especificado
-        if status_filter and task.status != status_filter:
-            continue
-        
-        # Adiciona a tarefa à lista
-        tasks.append(task.to_dict())
-    
-    # Ordena as tarefas por tempo de início (mais recentes primeiro)
-    tasks.sort(key=lambda x: x.get('start_time', 0) or 0, reverse=True)
-    
+    # Filtro por status e ordenação usam o índice (status, data_criacao)
+    query = Task.query
+    if status_filter:
+        query = query.filter(Task.status == status_filter)
+    query = query.order_by(Task.data_criacao.desc())
+
     # Limita o número de tarefas, se especificado
     if limit and isinstance(limit, int) and limit > 0:
-        tasks = tasks[:limit]
-    
-    return tasks
+        query = query.limit(limit)
+
+    return [task.to_dict() for task in query.all()]
 
 def get_pending_tasks() -> List[Dict[str, Any]]:
     """Obtém todas as tarefas pendentes ou em execução
-    
+
     Returns:
         List[Dict[str, Any]]: Lista de tarefas pendentes ou em execução
     """
-    pending_tasks = []
-    
-    for task_id, task in task_status.items():
-        if task.status in [TaskStatus.PENDING, TaskStatus.RUNNING]:
-            pending_tasks.append(task.to_dict())
-    
-    # Ordena as tarefas por tempo de início (mais recentes primeiro)
-    pending_tasks.sort(key=lambda x: x.get('start_time', 0) or 0, reverse=True)
-    
-    return pending_tasks
-
-def clear_completed_tasks(older_than=None):
-    """Remove tarefas concluídas ou falhas do dicionário de status
-    
+    tasks = Task.query.filter(
+        Task.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING])
+    ).order_by(Task.data_criacao.desc()).all()
+
+    return [task.to_dict() for task in tasks]
+
+def clear_completed_tasks(older_than=None, statuses=(TaskStatus.COMPLETED, TaskStatus.FAILED)):
+    """Remove tarefas concluídas ou falhas da fila persistente
+
     Args:
         older_than: Tempo em segundos para considerar uma tarefa antiga (opcional)
+        statuses: Status das tarefas a remover (padrão: concluídas e com falha)
+
+    Returns:
+        int: Quantidade de tarefas removidas
     """
-    import time
-    current_time = time.time()
-    
-    to_remove = []
-    for task_id, task in task_status.items():
-        # Verifica se a tarefa está concluída ou falhou
-        if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-            # Verifica se a tarefa é antiga o suficiente para ser removida
-            if older_than and task.end_time:
-                if current_time - task.end_time > older_than:
-                    to_remove.append(task_id)
-            # Se não foi especificado um tempo, remove todas as tarefas concluídas
-            elif not older_than:
-                to_remove.append(task_id)
-    
-    # Remove as tarefas do dicionário
-    for task_id in to_remove:
-        del task_status[task_id]
-    
-    return len(to_remove)
\ No newline at end of file
+    return task_store.delete_finished(older_than, statuses)
+
+def get_queue_metrics(window=3600) -> Dict[str, Any]:
+    """Calcula métricas da fila por classe (tipo de tarefa) a partir da tabela de tarefas
+
+    Como a tabela é compartilhada, os valores consideram todos os workers.
+
+    Args:
+        window: Janela em segundos para o tempo de espera das tarefas iniciadas
+
+    Returns:
+        Dict[str, Any]: Por classe, tarefas pendentes, idade da mais antiga e
+        tempo de espera (médio e máximo) até o início da execução
+    """
+    agora = datetime.utcnow()
+    classes = {}
+
+    def _classe(tipo):
+        return classes.setdefault(tipo, {
+            'pending': 0, 'running': 0, 'oldest_pending_age': 0.0,
+            'started': 0, 'avg_wait': 0.0, 'max_wait': 0.0
+        })
+
+    # Pendentes e em execução (agregado no banco)
+    rows = db.session.query(
+        Task.tipo, Task.status, db.func.count(Task.id), db.func.min(Task.data_criacao)
+    ).filter(
+        Task.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING])
+    ).group_by(Task.tipo, Task.status).all()
+    for tipo, status, quantidade, mais_antiga in rows:
+        classe = _classe(tipo)
+        classe[status] = quantidade
+        if status == TaskStatus.PENDING and mais_antiga:
+            classe['oldest_pending_age'] = (agora - mais_antiga).total_seconds()
+
+    # Tempo de espera das tarefas iniciadas na janela
+    iniciadas = db.session.query(Task.tipo, Task.data_criacao, Task.data_inicio).filter(
+        Task.data_inicio >= agora - timedelta(seconds=window)
+    ).all()
+    for tipo, criacao, inicio in iniciadas:
+        classe = _classe(tipo)
+        espera = (inicio - criacao).total_seconds()
+        classe['started'] += 1
+        classe['avg_wait'] += espera
+        classe['max_wait'] = max(classe['max_wait'], espera)
+    for classe in classes.values():
+        if classe['started']:
+            classe['avg_wait'] /= classe['started']
+
+    return {'window': window, 'classes': classes}
@@ -0,0 +1,144 @@
+"""
+Gravação de arquivos recebidos por upload
+
+O arquivo é copiado em blocos para o disco enquanto o SHA-256 do conteúdo é
+calculado, sem manter o arquivo inteiro em memória nem relê-lo depois. O hash
+é gravado no registro criado pelo upload (``hash_arquivo``) e permite
+reconhecer o reenvio do mesmo arquivo (ex.: cliente que repete o upload após um
+timeout), devolvendo o registro e a tarefa já existentes em vez de processar o
+conteúdo novamente.
+"""
+import hashlib
+import os
+import uuid
+from datetime import datetime
+from typing import Tuple
+from flask import current_app
+from sqlalchemy import text
+from app import db
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024  # 1 MiB
+
+
+def nome_unico(filename: str) -> str:
+    """Nome de arquivo único no diretório de uploads"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{filename}"
+
+
+def salvar_upload(file, pasta: str, filename: str) -> Tuple[str, str]:
+    """
+    Grava o arquivo enviado calculando o SHA-256 durante a cópia
+
+    Args:
+        file: FileStorage recebido em request.files
+        pasta: Diretório de destino (criado se não existir)
+        filename: Nome do arquivo já sanitizado (secure_filename)
+
+    Returns:
+        Tuple[str, str]: Caminho do arquivo gravado e hash SHA-256 (hexadecimal)
+    """
+    os.makedirs(pasta, exist_ok=True)
+    file_path = os.path.join(pasta, nome_unico(filename))
+    sha256 = hashlib.sha256()
+    try:
+        with open(file_path, 'wb') as destino:
+            while True:
+                bloco = file.stream.read(UPLOAD_BLOCK_SIZE)
+                if not bloco:
+                    break
+                sha256.update(bloco)
+                destino.write(bloco)
+    except BaseException:
+        descartar_upload(file_path)
+        raise
+    return file_path, sha256.hexdigest()
+
+
+def caminho_parcial(upload_id: str) -> str:
+    """Arquivo parcial de um upload em partes (UploadFragmentado)"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'partes', f'{upload_id}.part')
+
+
+def caminho_recebimento(upload_id: str) -> str:
+    """Arquivo temporário (e único) de uma parte em recebimento, antes de ir para o arquivo parcial"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'partes', f'{upload_id}.{uuid.uuid4().hex}.recv')
+
+
+def gravar_parte(stream, file_path: str, offset: int, limite: int) -> Tuple[int, str]:
+    """
+    Grava uma parte de um upload fragmentado na posição indicada do arquivo
+
+    Args:
+        stream: Corpo da requisição ou arquivo de recebimento (lido em blocos)
+        file_path: Arquivo de destino (já existente)
+        offset: Posição inicial da parte
+        limite: Quantidade máxima de bytes aceita a partir do offset
+
+    Returns:
+        Tuple[int, str]: Bytes gravados e SHA-256 da parte
+
+    Raises:
+        ValueError: Se a parte ultrapassar o limite
+    """
+    sha256 = hashlib.sha256()
+    gravados = 0
+    with open(file_path, 'r+b') as destino:
+        destino.seek(offset)
+        while True:
+            bloco = stream.read(UPLOAD_BLOCK_SIZE)
+            if not bloco:
+                break
+            gravados += len(bloco)
+            if gravados > limite:
+                raise ValueError('A parte ultrapassa o tamanho declarado do arquivo')
+            sha256.update(bloco)
+            destino.write(bloco)
+    return gravados, sha256.hexdigest()
+
+
+def calcular_hash(file_path: str) -> str:
+    """SHA-256 de um arquivo em disco, lido em blocos"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(UPLOAD_BLOCK_SIZE), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def descartar_upload(file_path: str):
+    """Remove um arquivo gravado que não será processado"""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def buscar_reenvio(model, hash_arquivo: str, usuario_id: int, status_falha: str = 'Erro', **filtros):
+    """
+    Obtém o registro de um upload anterior do mesmo usuário com o mesmo conteúdo
+
+    O reenvio só é reconhecido no escopo de quem enviou (usuário e, para
+    remessas, a UF informada): o mesmo arquivo enviado por outro usuário ou
+    para outra UF é um envio novo. Registros no status de falha do modelo são
+    ignorados, permitindo reenviar o arquivo para nova tentativa. No
+    PostgreSQL, uploads simultâneos do mesmo arquivo são serializados por um
+    advisory lock transacional (liberado no commit do registro criado), para
+    que apenas um deles seja processado.
+
+    Args:
+        model: Modelo com as colunas ``hash_arquivo``, ``status`` e ``usuario_id``
+        hash_arquivo: SHA-256 do arquivo enviado
+        usuario_id: Usuário que está enviando o arquivo
+        status_falha: Status final de falha do modelo (ex.: 'Rejeitada' nas desistências)
+        **filtros: Filtros adicionais (ex.: tipo e UF da remessa)
+
+    Returns:
+        Registro existente ou None
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:chave))"),
+                           {'chave': f'{model.__tablename__}:{hash_arquivo}'})
+    return model.query.filter_by(hash_arquivo=hash_arquivo, usuario_id=usuario_id, **filtros) \
+        .filter(model.status != status_falha) \
+        .order_by(model.id.desc()) \
+        .first()
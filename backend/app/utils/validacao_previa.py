@@ -0,0 +1,234 @@
+"""
+Relatório da validação prévia de arquivos (``validate_only``)
+
+A validação prévia executa o parser e as validações da ingestão sem gravar no
+banco. A resposta traz só um resumo (contagem por tipo de ocorrência e uma
+amostra). As ocorrências de cada registro são gravadas em disco, uma por linha
+(JSON Lines), e consultadas depois de forma paginada. O relatório expira após
+VALIDACAO_PREVIA_TTL segundos (job ``limpeza_validacoes_previas``).
+"""
+import csv
+import io
+import json
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from flask import current_app, jsonify, request, Response, stream_with_context
+
+TAMANHO_AMOSTRA = 10
+MAX_TIPOS_RESUMO = 20
+MAX_POR_PAGINA = 1000
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def validate_only_solicitado() -> bool:
+    """Verifica se a requisição pede apenas a validação do arquivo (form ou query string)"""
+    valor = request.form.get('validate_only') or request.args.get('validate_only') or ''
+    return valor.lower() in ('true', '1', 'sim')
+
+
+def pasta_validacoes() -> str:
+    """Diretório dos relatórios de validação prévia"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'validacoes')
+
+
+class RelatorioValidacao:
+    """
+    Acumula as ocorrências de uma validação prévia
+
+    Uso::
+
+        with RelatorioValidacao('Remessa', nome_arquivo, usuario_id) as relatorio:
+            relatorio.registrar(posicao, 'Valor inválido', referencia=numero)
+            ...
+            relatorio.registros = total_lido
+        resumo = relatorio.resumo()
+    """
+
+    def __init__(self, tipo: str, nome_arquivo: str, usuario_id: Optional[int]):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.nome_arquivo = nome_arquivo
+        self.usuario_id = usuario_id
+        self.registros = 0
+        self.erros = 0
+        self.avisos = 0
+        self._tipos = Counter()
+        self._amostra = []
+        self._pasta = pasta_validacoes()
+        self._saida = None
+
+    def __enter__(self):
+        os.makedirs(self._pasta, exist_ok=True)
+        self._saida = open(os.path.join(self._pasta, f'{self.id}.jsonl'), 'w', encoding='utf-8')
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self._saida.close()
+        if exc_type is not None:
+            descartar_relatorio(self.id)
+            return False
+        with open(os.path.join(self._pasta, f'{self.id}.json'), 'w', encoding='utf-8') as saida:
+            json.dump(dict(self.resumo(), usuario_id=self.usuario_id), saida, ensure_ascii=False)
+        return False
+
+    def registrar(self, posicao: Optional[int], mensagem: str, referencia: Optional[str] = None,
+                  nivel: str = 'erro'):
+        """
+        Registra uma ocorrência
+
+        Args:
+            posicao: Linha (arquivo texto) ou posição do registro no arquivo (XML)
+            mensagem: Descrição da ocorrência; no resumo, as ocorrências são agrupadas
+                pelo texto anterior a ': ' (ex.: 'valor inválido: abc' -> 'valor inválido')
+            referencia: Identificação do registro (ex.: número ou protocolo do título)
+            nivel: 'erro' (registro seria rejeitado) ou 'aviso'
+        """
+        ocorrencia = {'posicao': posicao, 'referencia': referencia, 'nivel': nivel, 'mensagem': mensagem}
+        if nivel == 'erro':
+            self.erros += 1
+        else:
+            self.avisos += 1
+        self._tipos[(nivel, mensagem.split(': ', 1)[0])] += 1
+        if len(self._amostra) < TAMANHO_AMOSTRA:
+            self._amostra.append(ocorrencia)
+        self._saida.write(json.dumps(ocorrencia, ensure_ascii=False) + '\n')
+
+    def resumo(self) -> Dict[str, Any]:
+        """Resumo compacto da validação, devolvido na resposta do upload"""
+        return {
+            'validacao_id': self.id,
+            'tipo': self.tipo,
+            'nome_arquivo': self.nome_arquivo,
+            'valido': self.erros == 0,
+            'registros': self.registros,
+            'erros': self.erros,
+            'avisos': self.avisos,
+            'ocorrencias_por_tipo': [
+                {'nivel': nivel, 'mensagem': mensagem, 'quantidade': quantidade}
+                for (nivel, mensagem), quantidade in self._tipos.most_common(MAX_TIPOS_RESUMO)
+            ],
+            'amostra': self._amostra
+        }
+
+
+def carregar_relatorio(validacao_id: str) -> Optional[Dict[str, Any]]:
+    """Resumo de um relatório de validação (ou None se não existir ou tiver expirado)"""
+    if not _ID_VALIDO.match(validacao_id or ''):
+        return None
+    try:
+        with open(os.path.join(pasta_validacoes(), f'{validacao_id}.json'), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def iter_ocorrencias(validacao_id: str, nivel: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Percorre as ocorrências de um relatório, na ordem do arquivo validado"""
+    with open(os.path.join(pasta_validacoes(), f'{validacao_id}.jsonl'), encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            ocorrencia = json.loads(linha)
+            if nivel is None or ocorrencia['nivel'] == nivel:
+                yield ocorrencia
+
+
+def pagina_ocorrencias(validacao_id: str, page: int, per_page: int,
+                       nivel: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Página das ocorrências de um relatório
+
+    Returns:
+        Tuple[List[Dict[str, Any]], int]: Ocorrências da página e total de ocorrências
+    """
+    relatorio = carregar_relatorio(validacao_id)
+    total = relatorio['erros'] + relatorio['avisos'] if nivel is None else \
+        relatorio['erros' if nivel == 'erro' else 'avisos']
+    inicio = (page - 1) * per_page
+    itens = []
+    for indice, ocorrencia in enumerate(iter_ocorrencias(validacao_id, nivel)):
+        if indice >= inicio + per_page:
+            break
+        if indice >= inicio:
+            itens.append(ocorrencia)
+    return itens, total
+
+
+def resposta_ocorrencias(validacao_id: str, usuario):
+    """
+    Resposta da consulta às ocorrências de um relatório (rotas GET .../validacoes/<id>)
+
+    Parâmetros da query string: page, per_page (até MAX_POR_PAGINA) e nivel
+    ('erro' ou 'aviso'); ``formato=csv`` devolve todas as ocorrências em CSV.
+    Só o usuário que enviou o arquivo (ou um administrador) tem acesso.
+    """
+    relatorio = carregar_relatorio(validacao_id)
+    if not relatorio or not usuario or \
+            (relatorio['usuario_id'] != usuario.id and not usuario.admin):
+        return jsonify({'message': 'Relatório de validação não encontrado ou expirado'}), 404
+
+    nivel = request.args.get('nivel')
+    if nivel not in (None, 'erro', 'aviso'):
+        return jsonify({'message': 'Nível inválido. Deve ser erro ou aviso'}), 400
+
+    if request.args.get('formato') == 'csv':
+        def gerar():
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(['posicao', 'referencia', 'nivel', 'mensagem'])
+            for ocorrencia in iter_ocorrencias(validacao_id, nivel):
+                escritor.writerow([ocorrencia['posicao'], ocorrencia['referencia'],
+                                   ocorrencia['nivel'], ocorrencia['mensagem']])
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        return Response(stream_with_context(gerar()), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename=validacao_{validacao_id}.csv'
+        })
+
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = request.args.get('per_page', 100, type=int)
+    if per_page < 1 or per_page > MAX_POR_PAGINA:
+        per_page = 100
+    itens, total = pagina_ocorrencias(validacao_id, page, per_page, nivel)
+    pages = (total + per_page - 1) // per_page
+    return jsonify({
+        'resumo': {campo: valor for campo, valor in relatorio.items() if campo != 'usuario_id'},
+        'items': itens,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages,
+        'next_page': page + 1 if page < pages else None,
+        'prev_page': page - 1 if page > 1 else None
+    }), 200
+
+
+def descartar_relatorio(validacao_id: str):
+    """Remove os arquivos de um relatório de validação"""
+    for extensao in ('.json', '.jsonl'):
+        try:
+            os.remove(os.path.join(pasta_validacoes(), f'{validacao_id}{extensao}'))
+        except OSError:
+            pass
+
+
+def limpar_relatorios_expirados(ttl: int) -> int:
+    """Remove os relatórios gerados há mais de ``ttl`` segundos; retorna a quantidade removida"""
+    pasta = pasta_validacoes()
+    if not os.path.isdir(pasta):
+        return 0
+    limite = time.time() - ttl
+    removidos = 0
+    for nome in os.listdir(pasta):
+        validacao_id, extensao = os.path.splitext(nome)
+        if extensao == '.jsonl' and os.path.getmtime(os.path.join(pasta, nome)) < limite:
+            descartar_relatorio(validacao_id)
+            removidos += 1
+    return removidos
@@ -23,6 +23,101 @@ class Config:
     JWT_COOKIE_SECURE = True
     JWT_COOKIE_CSRF_PROTECT = True
     JWT_COOKIE_SAMESITE = 'Lax'
+    # Intervalo de sincronização dos tokens revogados no logout (tabela compartilhada entre workers)
+    TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 5))  # segundos
+    
+    # Cache de credenciais Basic Auth já verificadas (por worker)
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 300))  # segundos
+    AUTH_CACHE_MAX_SIZE = int(os.environ.get('AUTH_CACHE_MAX_SIZE', 1024))
+    
+    # Cache de snapshots de usuários (por worker)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # segundos
+    USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 4096))
+    
+    # Gravação em lote do último acesso (intervalo máximo entre gravações)
+    LAST_ACCESS_FLUSH_INTERVAL = int(os.environ.get('LAST_ACCESS_FLUSH_INTERVAL', 30))  # segundos
+    LAST_ACCESS_MAX_PENDING = int(os.environ.get('LAST_ACCESS_MAX_PENDING', 10000))
+    
+    # Executor de tarefas assíncronas ('thread' ou 'process')
+    TASK_EXECUTOR = os.environ.get('TASK_EXECUTOR', 'thread')
+    TASK_MAX_WORKERS = int(os.environ.get('TASK_MAX_WORKERS', 4))
+    # Limite de tarefas simultâneas por tipo (nome da função da tarefa)
+    TASK_CONCURRENCY_LIMITS = {
+        'processar_remessa': int(os.environ.get('TASK_LIMIT_REMESSA', 2)),
+        'processar_desistencia': int(os.environ.get('TASK_LIMIT_DESISTENCIA', 2)),
+        'processar_autorizacao': int(os.environ.get('TASK_LIMIT_AUTORIZACAO', 2)),
+    }
+    # Prioridade por tipo de tarefa (maior valor é executado antes)
+    TASK_PRIORITIES = {
+        'processar_desistencia': 10,
+        'processar_remessa': 0,
+    }
+    # Máximo de tarefas simultâneas por tenant (usuário + UF) em toda a fila
+    TASK_TENANT_MAX_RUNNING = int(os.environ.get('TASK_TENANT_MAX_RUNNING', 2))
+    # Janela de atendimentos considerada no round-robin entre tenants (limita o custo da reserva)
+    TASK_FAIRNESS_WINDOW = int(os.environ.get('TASK_FAIRNESS_WINDOW', 3600))  # segundos
+    # Consumir a fila também nos workers web (desative ao usar 'flask worker')
+    TASK_WORKER_EMBEDDED = os.environ.get('TASK_WORKER_EMBEDDED', 'true').lower() in ('true', '1', 'yes')
+    TASK_POLL_INTERVAL = float(os.environ.get('TASK_POLL_INTERVAL', 2))  # segundos
+    TASK_HEARTBEAT_INTERVAL = int(os.environ.get('TASK_HEARTBEAT_INTERVAL', 30))  # segundos
+    TASK_STALE_TIMEOUT = int(os.environ.get('TASK_STALE_TIMEOUT', 300))  # segundos sem heartbeat
+    TASK_ALLOWED_MODULES = ('app.',)
+    # Retentativas por tipo de tarefa (erros transitórios de banco/conexão)
+    # max_attempts inclui a primeira execução; atraso = base_delay * 2^(tentativa-1), limitado a max_delay
+    TASK_RETRY_POLICIES = {
+        'default': {'max_attempts': 3, 'base_delay': 5, 'max_delay': 300},
+        'processar_remessa': {'max_attempts': 5, 'base_delay': 10, 'max_delay': 600},
+        'processar_desistencia': {'max_attempts': 5, 'base_delay': 10, 'max_delay': 600},
+        'processar_autorizacao': {'max_attempts': 5, 'base_delay': 10, 'max_delay': 600},
+    }
+    # Stream de progresso das tarefas (Server-Sent Events)
+    TASK_STREAM_POLL_INTERVAL = float(os.environ.get('TASK_STREAM_POLL_INTERVAL', 1))  # segundos
+    TASK_STREAM_HEARTBEAT = int(os.environ.get('TASK_STREAM_HEARTBEAT', 15))  # segundos
+    # Conexões curtas: cada stream ocupa uma thread do worker; o EventSource reconecta e retoma pelo Last-Event-ID
+    TASK_STREAM_MAX_DURATION = int(os.environ.get('TASK_STREAM_MAX_DURATION', 60))  # segundos por conexão
+    TASK_STREAM_TOKEN_TTL = int(os.environ.get('TASK_STREAM_TOKEN_TTL', 120))  # validade do token de stream
+    TASK_STREAM_MAX_IDS = int(os.environ.get('TASK_STREAM_MAX_IDS', 50))
+    # Retenção das tarefas finalizadas (falhas ficam mais tempo para reprocessamento)
+    TASK_RETENTION_COMPLETED = int(os.environ.get('TASK_RETENTION_COMPLETED', 7 * 24 * 3600))  # segundos
+    TASK_RETENTION_FAILED = int(os.environ.get('TASK_RETENTION_FAILED', 30 * 24 * 3600))  # segundos
+    
+    # Agendador de tarefas periódicas (horários cron em UTC)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    SCHEDULER_TICK = float(os.environ.get('SCHEDULER_TICK', 5))  # segundos entre verificações
+    SCHEDULER_JOBS = {
+        'limpeza_tarefas': {
+            'func': 'app.utils.scheduled_jobs:limpar_tarefas',
+            'interval': 3600,
+        },
+        'limpeza_uploads_fragmentados': {
+            'func': 'app.utils.scheduled_jobs:limpar_uploads_expirados',
+            'interval': 3600,
+        },
+        'limpeza_validacoes_previas': {
+            'func': 'app.utils.scheduled_jobs:limpar_validacoes_previas',
+            'interval': 3600,
+        },
+        'backup_banco': {
+            'func': 'app.utils.scheduled_jobs:backup_banco',
+            'cron': os.environ.get('BACKUP_CRON', '0 5 * * *'),  # 02:00 em Brasília
+            'enabled': os.environ.get('BACKUP_ENABLED', 'false').lower() in ('true', '1', 'yes'),
+        },
+        # Cache em memória é por worker: executado em cada processo web, fora da fila
+        'aquecimento_cache_dashboard': {
+            'func': 'app.utils.scheduled_jobs:aquecer_cache_dashboard',
+            'interval': 240,
+            'local': True,
+        },
+    }
+    BACKUP_CONFIG_FILE = os.environ.get('BACKUP_CONFIG_FILE')
+    BACKUP_TIMEOUT = int(os.environ.get('BACKUP_TIMEOUT', 3600))  # segundos
+    
+    # Ingestão de remessas: títulos gravados por lote (memória e transações limitadas)
+    REMESSA_CHUNK_SIZE = int(os.environ.get('REMESSA_CHUNK_SIZE', 1000))
+    AUTORIZACAO_CHUNK_SIZE = int(os.environ.get('AUTORIZACAO_CHUNK_SIZE', 5000))  # Transações de autorização por lote
+    RETORNO_CHUNK_SIZE = int(os.environ.get('RETORNO_CHUNK_SIZE', 5000))  # Títulos por bloco nos arquivos de retorno
+    # Processos para validação dos lotes (0 = validação no próprio processo)
+    VALIDACAO_WORKERS = int(os.environ.get('VALIDACAO_WORKERS', min(4, (os.cpu_count() or 1) - 1)))
     
     # Configurações de cache
     CACHE_TYPE = 'SimpleCache'
@@ -31,6 +126,15 @@ class Config:
     # Configurações de upload
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
+    
+    # Upload em partes (arquivos acima de MAX_CONTENT_LENGTH)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # Sugerido ao cliente
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 2 * 1024 ** 3))  # 2 GB
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 86400))  # segundos sem receber partes
+    UPLOAD_LOTE_MAX_ARQUIVOS = int(os.environ.get('UPLOAD_LOTE_MAX_ARQUIVOS', 100))  # Arquivos por upload em lote
+    VALIDACAO_PREVIA_TTL = int(os.environ.get('VALIDACAO_PREVIA_TTL', 86400))  # segundos de retenção dos relatórios de validate_only
+    # Limite do conteúdo descompactado de uploads .gz/.zip
+    UPLOAD_MAX_DESCOMPACTADO = int(os.environ.get('UPLOAD_MAX_DESCOMPACTADO', 10 * 1024 ** 3))  # 10 GB
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
     
     # Configurações de logging
@@ -83,6 +187,12 @@ class TestingConfig(Config):
     # Configurações específicas para testes
     WTF_CSRF_ENABLED = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
+    # Sem limite de requisições: os testes de carga fazem dezenas de chamadas ao mesmo endpoint
+    RATELIMIT_ENABLED = False
+    SCHEDULER_ENABLED = False
+    VALIDACAO_WORKERS = 0
+    # Sem executor embutido: os testes que precisam da fila iniciam o executor explicitamente
+    TASK_WORKER_EMBEDDED = False
     
     @classmethod
     def init_app(cls, app):
@@ -0,0 +1,45 @@
+"""Cria tabela de tarefas assíncronas persistentes
+
+Revision ID: b1c2d3e4f501
+Revises: 9a9b5e31f254
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f501'
+down_revision = '9a9b5e31f254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tasks',
+        sa.Column('id', sa.String(length=50), nullable=False),
+        sa.Column('descricao', sa.String(length=255), nullable=True),
+        sa.Column('tipo', sa.String(length=100), nullable=True),
+        sa.Column('funcao', sa.String(length=255), nullable=False),
+        sa.Column('argumentos', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('progresso', sa.Integer(), nullable=True),
+        sa.Column('resultado', sa.Text(), nullable=True),
+        sa.Column('erro', sa.Text(), nullable=True),
+        sa.Column('worker', sa.String(length=100), nullable=True),
+        sa.Column('data_criacao', sa.DateTime(), nullable=True),
+        sa.Column('data_inicio', sa.DateTime(), nullable=True),
+        sa.Column('data_fim', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_tasks_status_criacao', 'tasks', ['status', 'data_criacao'], unique=False)
+    op.create_index(op.f('ix_tasks_tipo'), 'tasks', ['tipo'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_tasks_tipo'), table_name='tasks')
+    op.drop_index('idx_tasks_status_criacao', table_name='tasks')
+    op.drop_table('tasks')
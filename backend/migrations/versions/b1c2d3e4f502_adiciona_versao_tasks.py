@@ -0,0 +1,24 @@
+"""Adiciona versão às tarefas para o stream de progresso
+
+Revision ID: b1c2d3e4f502
+Revises: b1c2d3e4f501
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f502'
+down_revision = 'b1c2d3e4f501'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('versao', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('tasks', 'versao')
@@ -0,0 +1,38 @@
+"""Adiciona prioridade e tenant às tarefas para escalonamento justo
+
+Revision ID: b1c2d3e4f503
+Revises: b1c2d3e4f502
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f503'
+down_revision = 'b1c2d3e4f502'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('prioridade', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tasks', sa.Column('usuario_id', sa.Integer(), nullable=True))
+    op.add_column('tasks', sa.Column('uf', sa.String(length=2), nullable=True))
+    op.add_column('tasks', sa.Column('tenant', sa.String(length=50), nullable=True))
+    # Tarefas existentes ficam no tenant sem usuário e sem UF
+    op.execute("UPDATE tasks SET tenant = ':' WHERE tenant IS NULL")
+    op.create_foreign_key('fk_tasks_usuario_id', 'tasks', 'users', ['usuario_id'], ['id'])
+    op.create_index('idx_tasks_tenant_status', 'tasks', ['tenant', 'status'], unique=False)
+    op.create_index('idx_tasks_tenant_inicio', 'tasks', ['tenant', 'data_inicio'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_tasks_tenant_inicio', table_name='tasks')
+    op.drop_index('idx_tasks_tenant_status', table_name='tasks')
+    op.drop_constraint('fk_tasks_usuario_id', 'tasks', type_='foreignkey')
+    op.drop_column('tasks', 'tenant')
+    op.drop_column('tasks', 'uf')
+    op.drop_column('tasks', 'usuario_id')
+    op.drop_column('tasks', 'prioridade')
@@ -0,0 +1,30 @@
+"""Adiciona controle de retentativas e dead-letter às tarefas
+
+Revision ID: b1c2d3e4f504
+Revises: b1c2d3e4f503
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f504'
+down_revision = 'b1c2d3e4f503'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('tentativas', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tasks', sa.Column('max_tentativas', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('tasks', sa.Column('proxima_execucao', sa.DateTime(), nullable=True))
+    op.add_column('tasks', sa.Column('erro_detalhe', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('tasks', 'erro_detalhe')
+    op.drop_column('tasks', 'proxima_execucao')
+    op.drop_column('tasks', 'max_tentativas')
+    op.drop_column('tasks', 'tentativas')
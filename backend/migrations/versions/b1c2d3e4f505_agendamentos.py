@@ -0,0 +1,31 @@
+"""Cria a tabela de agendamentos periódicos
+
+Revision ID: b1c2d3e4f505
+Revises: b1c2d3e4f504
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f505'
+down_revision = 'b1c2d3e4f504'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'agendamentos',
+        sa.Column('nome', sa.String(length=100), nullable=False),
+        sa.Column('proxima_execucao', sa.DateTime(), nullable=False),
+        sa.Column('ultima_execucao', sa.DateTime(), nullable=True),
+        sa.Column('ultima_task_id', sa.String(length=50), nullable=True),
+        sa.PrimaryKeyConstraint('nome')
+    )
+
+
+def downgrade():
+    op.drop_table('agendamentos')
@@ -0,0 +1,43 @@
+"""Adiciona documento normalizado (apenas dígitos) com índice único a credores e devedores
+
+Revision ID: b1c2d3e4f506
+Revises: b1c2d3e4f505
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f506'
+down_revision = 'b1c2d3e4f505'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for tabela in ('credores', 'devedores'):
+        op.add_column(tabela, sa.Column('documento_normalizado', sa.String(length=20), nullable=True))
+        
+        # Preencher apenas o registro mais antigo de cada documento; duplicados
+        # existentes são preservados (sem documento normalizado) para não
+        # alterar títulos já vinculados a eles
+        op.execute(f"""
+            UPDATE {tabela} SET documento_normalizado = n.normalizado
+            FROM (
+                SELECT min(id) AS id, NULLIF(regexp_replace(documento, '[^0-9]', '', 'g'), '') AS normalizado
+                FROM {tabela}
+                WHERE documento IS NOT NULL
+                GROUP BY 2
+            ) n
+            WHERE {tabela}.id = n.id AND n.normalizado IS NOT NULL
+        """)
+        
+        op.create_index(f'ix_{tabela}_documento_normalizado', tabela, ['documento_normalizado'], unique=True)
+
+
+def downgrade():
+    for tabela in ('credores', 'devedores'):
+        op.drop_index(f'ix_{tabela}_documento_normalizado', table_name=tabela)
+        op.drop_column(tabela, 'documento_normalizado')
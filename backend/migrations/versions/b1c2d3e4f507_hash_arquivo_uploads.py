@@ -0,0 +1,30 @@
+"""Adiciona o hash SHA-256 do arquivo enviado a remessas, desistências e autorizações de cancelamento
+
+Revision ID: b1c2d3e4f507
+Revises: b1c2d3e4f506
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f507'
+down_revision = 'b1c2d3e4f506'
+branch_labels = None
+depends_on = None
+
+TABELAS = ('remessas', 'desistencias', 'autorizacoes_cancelamento')
+
+
+def upgrade():
+    for tabela in TABELAS:
+        op.add_column(tabela, sa.Column('hash_arquivo', sa.String(length=64), nullable=True))
+        op.create_index(f'ix_{tabela}_hash_arquivo', tabela, ['hash_arquivo'], unique=False)
+
+
+def downgrade():
+    for tabela in TABELAS:
+        op.drop_index(f'ix_{tabela}_hash_arquivo', table_name=tabela)
+        op.drop_column(tabela, 'hash_arquivo')
@@ -0,0 +1,47 @@
+"""Cria a tabela de uploads em partes (retomáveis)
+
+Revision ID: b1c2d3e4f508
+Revises: b1c2d3e4f507
+Create Date: 2026-10-16 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f508'
+down_revision = 'b1c2d3e4f507'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'uploads_fragmentados',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('nome_arquivo', sa.String(length=100), nullable=True),
+        sa.Column('uf', sa.String(length=2), nullable=True),
+        sa.Column('tipo', sa.String(length=20), nullable=True),
+        sa.Column('descricao', sa.Text(), nullable=True),
+        sa.Column('tamanho', sa.BigInteger(), nullable=False),
+        sa.Column('bytes_recebidos', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('hash_esperado', sa.String(length=64), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('usuario_id', sa.Integer(), nullable=True),
+        sa.Column('remessa_id', sa.Integer(), nullable=True),
+        sa.Column('data_criacao', sa.DateTime(), nullable=True),
+        sa.Column('data_atualizacao', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['usuario_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['remessa_id'], ['remessas.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_uploads_fragmentados_status', 'uploads_fragmentados', ['status'], unique=False)
+    op.create_index('ix_uploads_fragmentados_data_atualizacao', 'uploads_fragmentados', ['data_atualizacao'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_uploads_fragmentados_data_atualizacao', table_name='uploads_fragmentados')
+    op.drop_index('ix_uploads_fragmentados_status', table_name='uploads_fragmentados')
+    op.drop_table('uploads_fragmentados')
@@ -0,0 +1,26 @@
+"""Adiciona o grupo às tarefas (acompanhamento agregado de uploads em lote)
+
+Revision ID: b1c2d3e4f509
+Revises: b1c2d3e4f508
+Create Date: 2026-10-16 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f509'
+down_revision = 'b1c2d3e4f508'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('grupo', sa.String(length=50), nullable=True))
+    op.create_index('ix_tasks_grupo', 'tasks', ['grupo'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tasks_grupo', table_name='tasks')
+    op.drop_column('tasks', 'grupo')
@@ -0,0 +1,28 @@
+"""Vincula as desistências ao arquivo de desistências (remessa) de origem
+
+Revision ID: b1c2d3e4f510
+Revises: b1c2d3e4f509
+Create Date: 2026-10-16 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f510'
+down_revision = 'b1c2d3e4f509'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('desistencias', sa.Column('remessa_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_desistencias_remessa_id', 'desistencias', 'remessas', ['remessa_id'], ['id'])
+    op.create_index('ix_desistencias_remessa_id', 'desistencias', ['remessa_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_desistencias_remessa_id', table_name='desistencias')
+    op.drop_constraint('fk_desistencias_remessa_id', 'desistencias', type_='foreignkey')
+    op.drop_column('desistencias', 'remessa_id')
@@ -0,0 +1,27 @@
+"""Tarefa assíncrona e ponto de retomada do processamento das autorizações de cancelamento
+
+Revision ID: b1c2d3e4f511
+Revises: b1c2d3e4f510
+Create Date: 2026-10-16 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f511'
+down_revision = 'b1c2d3e4f510'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('autorizacoes_cancelamento', sa.Column('task_id', sa.String(length=50), nullable=True))
+    op.add_column('autorizacoes_cancelamento',
+                  sa.Column('linhas_processadas', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('autorizacoes_cancelamento', 'linhas_processadas')
+    op.drop_column('autorizacoes_cancelamento', 'task_id')
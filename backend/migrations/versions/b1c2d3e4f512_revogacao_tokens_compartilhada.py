@@ -0,0 +1,35 @@
+"""Revogação de tokens compartilhada entre workers: versão dos tokens por usuário e tokens revogados
+
+Revision ID: b1c2d3e4f512
+Revises: b1c2d3e4f511
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f512'
+down_revision = 'b1c2d3e4f511'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'tokens_revogados',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(length=32), nullable=False),
+        sa.Column('expira_em', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('jti')
+    )
+    op.create_index('ix_tokens_revogados_expira_em', 'tokens_revogados', ['expira_em'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tokens_revogados_expira_em', table_name='tokens_revogados')
+    op.drop_table('tokens_revogados')
+    op.drop_column('users', 'token_version')
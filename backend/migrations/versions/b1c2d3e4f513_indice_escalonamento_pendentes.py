@@ -0,0 +1,25 @@
+"""Índice parcial das tarefas pendentes para o escalonamento por tenant
+
+Revision ID: b1c2d3e4f513
+Revises: b1c2d3e4f512
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c2d3e4f513'
+down_revision = 'b1c2d3e4f512'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_tasks_pendentes_tenant', 'tasks', ['tenant', 'prioridade', 'data_criacao'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    op.drop_index('idx_tasks_pendentes_tenant', table_name='tasks')
@@ -1,9 +1,10 @@
 import os
 import sys
+from datetime import date
+
 import pytest
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token
 
 # Adicionar o diretório raiz ao path para permitir importações relativas
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -11,13 +12,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Importar os modelos diretamente do módulo app.models
 from app.models import User, Titulo, Remessa, Credor, Devedor, Desistencia, Erro
 
-# Importar a função create_app e db do arquivo app.py
-import importlib.util
-spec = importlib.util.spec_from_file_location("app", os.path.join(os.path.dirname(__file__), "../app.py"))
-app_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(app_module)
-create_app = app_module.create_app
-db = app_module.db
+# Importar a fábrica da aplicação (carrega TestingConfig com create_app('testing'))
+from app import create_app, db
 
 @pytest.fixture
 def app():
@@ -30,6 +26,14 @@ def app():
         # Criar todas as tabelas no banco de dados de teste
         db.create_all()
         yield app
+        # Parar o executor e o agendador iniciados pelo teste antes de remover as tabelas
+        from app.utils.async_tasks import executor
+        from app.utils.scheduler import scheduler
+        from app.auth.last_access import last_access_buffer
+        executor.shutdown(wait=True)
+        scheduler.shutdown()
+        # Gravar os acessos pendentes enquanto a tabela de usuários ainda existe
+        last_access_buffer.flush()
         # Limpar o banco de dados após os testes
         db.session.remove()
         db.drop_all()
@@ -45,10 +49,13 @@ def runner(app):
     return app.test_cli_runner()
 
 @pytest.fixture
-def auth_headers():
-    """Gera headers de autenticação com um token JWT válido"""
+def auth_headers(app):
+    """Gera headers de autenticação com um token de acesso válido (o mesmo emitido por /api/auth/login)"""
+    from app.auth.tokens import create_access_token
+
     def _auth_headers(user_id=1):
-        access_token = create_access_token(identity=user_id)
+        user = db.session.get(User, user_id)
+        access_token = create_access_token(user)
         return {'Authorization': f'Bearer {access_token}'}
     return _auth_headers
 
@@ -104,8 +111,8 @@ def init_database(app):
         numero='12345',
         protocolo='PROT12345',
         valor=1000.50,
-        data_emissao='2023-01-01',
-        data_vencimento='2023-02-01',
+        data_emissao=date(2023, 1, 1),
+        data_vencimento=date(2023, 2, 1),
         status='Pendente',
         remessa_id=1,
         credor_id=1,
@@ -100,4 +100,122 @@ def test_user_inactive(client, init_database):
     
     # Reativar o usuário para outros testes
     user.ativo = True
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+def _login_token(client):
+    response = client.post(
+        '/api/auth/login',
+        data=json.dumps({
+            'email': 'test@example.com',
+            'password': 'password123'
+        }),
+        content_type='application/json'
+    )
+    assert response.status_code == 200
+    return json.loads(response.data)['access_token']
+
+def test_access_token_authenticates_requests(client, init_database):
+    """Testa que o token emitido no login autentica requisições sem Basic Auth"""
+    token = _login_token(client)
+    
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    data = json.loads(response.data)
+    
+    assert response.status_code == 200
+    assert data['email'] == 'test@example.com'
+
+def test_access_token_revoked_on_logout(client, init_database):
+    """Testa que o token deixa de ser aceito após o logout"""
+    token = _login_token(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    response = client.post('/api/auth/logout', headers=headers)
+    assert response.status_code == 200
+    
+    response = client.get('/api/auth/me', headers=headers)
+    assert response.status_code == 401
+
+def test_access_token_revoked_on_deactivation(client, init_database):
+    """Testa que desativar o usuário revoga os tokens já emitidos"""
+    token = _login_token(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    response = client.put('/api/auth/users/1', data=json.dumps({'ativo': False}),
+                          content_type='application/json', headers=headers)
+    assert response.status_code == 200
+    
+    response = client.get('/api/auth/me', headers=headers)
+    assert response.status_code == 401
+
+def test_access_token_adulterado(client, init_database):
+    """Testa que um token com assinatura inválida é rejeitado"""
+    token = _login_token(client)
+    
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token[:-2]}xx'})
+    
+    assert response.status_code == 401
+
+def test_access_token_revogado_por_outro_worker(client, init_database):
+    """Testa que revogações feitas em outro worker (apenas no banco) são respeitadas"""
+    from app.auth.tokens import revocation_list
+    from app.auth.middleware import clear_user_cache
+    
+    token = _login_token(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    # Logout em outro worker: este worker só conhece a revogação pela tabela compartilhada
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    revocation_list.clear()
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+    
+    # Desativação em outro worker: a versão dos tokens muda no banco e o snapshot expira
+    token = _login_token(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+    db.session.execute(db.update(User).where(User.id == 1).values(token_version=User.token_version + 1))
+    db.session.commit()
+    clear_user_cache(1)
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+
+def test_user_snapshot_cache_invalidado_por_versao(app, init_database):
+    """Testa que o snapshot em cache é reaproveitado e invalidado ao alterar o usuário"""
+    from app.auth.user_cache import user_cache, get_user_snapshot
+    from app.auth.middleware import clear_user_cache
+    
+    with app.app_context():
+        user_cache.clear()
+        snapshot = get_user_snapshot(1)
+        assert snapshot.nome_completo == 'Usuário de Teste'
+        assert get_user_snapshot(1) is snapshot
+        
+        user = User.query.get(1)
+        user.nome_completo = 'Nome Alterado'
+        db.session.commit()
+        
+        # Sem invalidação o snapshot antigo continua válido até o TTL
+        assert get_user_snapshot(1).nome_completo == 'Usuário de Teste'
+        
+        clear_user_cache(1)
+        assert get_user_snapshot(1).nome_completo == 'Nome Alterado'
+
+def test_ultimo_acesso_gravado_em_lote(app, init_database):
+    """Testa que acessos repetidos são coalescidos e gravados em um único UPDATE"""
+    from datetime import datetime, timedelta
+    from app.auth.last_access import LastAccessBuffer
+    from app.utils.metrics import metrics
+    
+    buffer = LastAccessBuffer()
+    buffer._app = app
+    buffer._ensure_started = lambda: None  # sem thread: gravação manual
+    agora = datetime.utcnow()
+    coalescidos = metrics.get('ultimo_acesso.coalescidos')
+    
+    with app.app_context():
+        for i in range(5):
+            buffer.record(1, agora + timedelta(seconds=i))
+        assert buffer.pending_count() == 1
+        assert metrics.get('ultimo_acesso.coalescidos') == coalescidos + 4
+        
+        assert buffer.flush() == 1
+        assert buffer.pending_count() == 0
+        db.session.expire_all()
+        assert User.query.get(1).ultimo_acesso == agora + timedelta(seconds=4)
@@ -1,22 +1,56 @@
 import os
 import json
+import hashlib
 import pytest
 from datetime import datetime, date
 from io import BytesIO
+from app import db
 from app.models import AutorizacaoCancelamento, TransacaoAutorizacaoCancelamento, Titulo
 
 
-def test_upload_autorizacao_cancelamento(client, auth_headers, app):
+def _aguardar_tarefa(task_id, tentativas=100):
+    """Aguarda a tarefa de processamento terminar (o executor não é embutido nos testes)"""
+    import time
+    from app.utils.async_tasks import get_task_status, start_worker
+    start_worker()
+    for _ in range(tentativas):
+        db.session.expire_all()
+        status = get_task_status(task_id)['status']
+        if status in ('completed', 'failed'):
+            return status
+        time.sleep(0.1)
+    return status
+
+
+def _arquivo_autorizacao(transacoes, quantidade=None):
+    """Monta um arquivo de autorização a partir das posições do leiaute"""
+    from app.autorizacoes_cancelamento.leiaute import LEIAUTES
+    from app.utils.largura_fixa import EscritorLarguraFixa
+    
+    header = {'codigo_apresentante': '001', 'nome_apresentante': 'BANCO TESTE', 'data_movimento': date(2023, 2, 1),
+              'quantidade_solicitacoes': len(transacoes) if quantidade is None else quantidade,
+              'sequencia_registro': '00001'}
+    for sequencia, transacao in enumerate(transacoes, 2):
+        transacao.setdefault('sequencia_registro', f'{sequencia:05d}')
+    trailer = {'codigo_apresentante': '001', 'sequencia_registro': f'{len(transacoes) + 2:05d}'}
+    return b''.join(EscritorLarguraFixa(LEIAUTES).escrever([('0', [header]), ('1', transacoes), ('9', [trailer])]))
+
+
+def test_upload_autorizacao_cancelamento(client, init_database, auth_headers, app):
     """Testa o upload de um arquivo de autorização de cancelamento"""
-    # Criar um arquivo de teste
-    content = (
-        "0001BANCO TESTE                                  0102202300002                                                            00001\n"
-        "1PROT12345010220231234567890DEVEDOR TESTE 1                         00000000010050A            67890           00002\n"
-        "1PROT67890010220239876543210DEVEDOR TESTE 2                         00000000020075A            12345           00003\n"
-        "9001BANCO TESTE                                  0102202300002                                                            00004"
-    )
+    from decimal import Decimal
+    
+    # Criar um arquivo de teste (PROT12345 é o título de init_database)
+    content = _arquivo_autorizacao([
+        {'numero_protocolo': 'PROT12345', 'data_protocolizacao': date(2023, 2, 1), 'numero_titulo': '1234567890',
+         'nome_devedor': 'DEVEDOR TESTE 1', 'valor_titulo': Decimal('100.50'), 'solicitacao_cancelamento': 'A',
+         'carteira_nosso_numero': '67890'},
+        {'numero_protocolo': 'PROT67890', 'data_protocolizacao': date(2023, 2, 1), 'numero_titulo': '9876543210',
+         'nome_devedor': 'DEVEDOR TESTE 2', 'valor_titulo': Decimal('200.75'), 'solicitacao_cancelamento': 'A',
+         'carteira_nosso_numero': '12345'},
+    ])
     data = {
-        'file': (BytesIO(content.encode('latin-1')), 'AC001_01022023.txt')
+        'file': (BytesIO(content), 'AC001_01022023.txt')
     }
     
     # Fazer a requisição de upload
@@ -24,10 +58,11 @@ def test_upload_autorizacao_cancelamento(client, auth_headers, app):
                           data=data,
                           headers=auth_headers())
     
-    # Verificar se o upload foi bem-sucedido
-    assert response.status_code == 200
+    # Upload aceito; o processamento segue em segundo plano
+    assert response.status_code == 202
     response_data = json.loads(response.data)
     assert 'autorizacao_id' in response_data
+    assert _aguardar_tarefa(response_data['task_id']) == 'completed'
     
     # Verificar se o registro foi criado no banco de dados
     autorizacao_id = response_data['autorizacao_id']
@@ -39,19 +74,276 @@ def test_upload_autorizacao_cancelamento(client, auth_headers, app):
         assert autorizacao.data_movimento == date(2023, 2, 1)
         assert autorizacao.quantidade_solicitacoes == 2
         assert autorizacao.status == 'Processado'
+        assert autorizacao.linhas_processadas == 3
         
-        # Verificar se as transações foram criadas
-        transacoes = TransacaoAutorizacaoCancelamento.query.filter_by(autorizacao_id=autorizacao_id).all()
-        assert len(transacoes) == 2
+        # Verificar se as transações foram criadas, na ordem do arquivo
+        transacoes = TransacaoAutorizacaoCancelamento.query.filter_by(autorizacao_id=autorizacao_id) \
+            .order_by(TransacaoAutorizacaoCancelamento.id).all()
+        assert [t.numero_protocolo for t in transacoes] == ['PROT12345', 'PROT67890']
         
-        # Verificar dados da primeira transação
-        assert transacoes[0].numero_protocolo == 'PROT12345'
+        # Verificar dados da primeira transação, vinculada ao título pelo protocolo
         assert transacoes[0].data_protocolizacao == date(2023, 2, 1)
         assert transacoes[0].numero_titulo == '1234567890'
         assert transacoes[0].nome_devedor == 'DEVEDOR TESTE 1'
         assert float(transacoes[0].valor_titulo) == 100.50
         assert transacoes[0].solicitacao_cancelamento == 'A'
         assert transacoes[0].carteira_nosso_numero == '67890'
+        assert transacoes[0].titulo_id == init_database['titulo'].id
+        
+        # Segunda transação: protocolo sem título cadastrado
+        assert transacoes[1].numero_titulo == '9876543210'
+        assert float(transacoes[1].valor_titulo) == 200.75
+        assert transacoes[1].carteira_nosso_numero == '12345'
+        assert transacoes[1].titulo_id is None
+
+
+def test_reenvio_autorizacao_identica(client, init_database, auth_headers, app):
+    """Testa que o reenvio do mesmo arquivo retorna a autorização existente sem reprocessar"""
+    header = f"0001{'BANCO TESTE'.ljust(45)}0102202300001{' ' * 60}"
+    content = "\n".join([
+        f"{header}00001",
+        f"1{'PROT12345'.ljust(10)}0102202312345678901{'DEVEDOR TESTE 1'.ljust(45)}00000000010050A"
+        f"{' ' * 12}{'67890'.ljust(12)}  00000100002",
+        f"9{header[1:]}00003",
+    ]).encode('latin-1')
+    
+    def enviar(nome):
+        return client.post('/api/autorizacoes-cancelamento/upload',
+                           data={'file': (BytesIO(content), nome)},
+                           headers=auth_headers())
+    
+    primeira = enviar('AC001_01022023.txt')
+    assert primeira.status_code == 202
+    autorizacao_id = json.loads(primeira.data)['autorizacao_id']
+    assert _aguardar_tarefa(json.loads(primeira.data)['task_id']) == 'completed'
+    
+    # Mesmo conteúdo, mesmo que com outro nome de arquivo
+    segunda = enviar('AC001_01022023_reenvio.txt')
+    assert segunda.status_code == 200
+    response_data = json.loads(segunda.data)
+    assert response_data['duplicado'] is True
+    assert response_data['autorizacao_id'] == autorizacao_id
+    
+    with app.app_context():
+        assert AutorizacaoCancelamento.query.count() == 1
+        assert TransacaoAutorizacaoCancelamento.query.count() == 1
+        autorizacao = AutorizacaoCancelamento.query.get(autorizacao_id)
+        assert autorizacao.hash_arquivo == hashlib.sha256(content).hexdigest()
+
+
+def test_validacao_previa_autorizacao(client, init_database, auth_headers, app):
+    """Testa o modo validate_only: resumo das ocorrências, sem gravar, e ocorrências paginadas"""
+    header = f"0001{'BANCO TESTE'.ljust(45)}0102202300003{' ' * 60}"
+    
+    def transacao(protocolo, data, valor):
+        return (f"1{protocolo.ljust(10)}{data}12345678901{'DEVEDOR TESTE'.ljust(45)}{valor}A"
+                f"{' ' * 12}{'67890'.ljust(12)}  00000100002")
+    
+    content = "\n".join([
+        f"{header}00001",
+        transacao('PROT1', '01022023', '00000000010050'),
+        transacao('PROT2', '31022023', '00000000010050'),
+        transacao('PROT3', '01022023', '0000000001,050'),
+        f"9{header[1:]}00005",
+    ]).encode('latin-1')
+    
+    response = client.post('/api/autorizacoes-cancelamento/upload',
+                           data={'file': (BytesIO(content), 'AC001.txt'), 'validate_only': 'true'},
+                           headers=auth_headers())
+    assert response.status_code == 200
+    resumo = json.loads(response.data)
+    assert resumo['valido'] is False
+    assert resumo['registros'] == 5
+    assert resumo['erros'] == 2
+    # Protocolos sem título cadastrado são apenas avisos
+    assert resumo['avisos'] == 1
+    tipos = {tipo['mensagem']: tipo['quantidade'] for tipo in resumo['ocorrencias_por_tipo']}
+    assert tipos['data de protocolização inválida'] == 1
+    assert tipos['valor do título inválido'] == 1
+    
+    with app.app_context():
+        assert AutorizacaoCancelamento.query.count() == 0
+    
+    url = f"/api/autorizacoes-cancelamento/validacoes/{resumo['validacao_id']}"
+    pagina = json.loads(client.get(f'{url}?nivel=erro&per_page=1&page=2', headers=auth_headers()).data)
+    assert pagina['total'] == 2
+    assert pagina['items'] == [{'posicao': 4, 'referencia': 'PROT3', 'nivel': 'erro',
+                                'mensagem': 'valor do título inválido: 0000000001,050'}]
+    csv = client.get(f'{url}?formato=csv', headers=auth_headers())
+    assert csv.mimetype == 'text/csv'
+    assert len(csv.data.decode().strip().splitlines()) == 4
+    assert client.get('/api/autorizacoes-cancelamento/validacoes/inexistente',
+                      headers=auth_headers()).status_code == 404
+
+
+def test_registro_fora_do_tamanho_e_erro(client, init_database, auth_headers, app, tmp_path):
+    """Testa que um registro maior que o leiaute é erro na validação prévia e no processamento"""
+    from app.autorizacoes_cancelamento.routes import processar_autorizacao
+    
+    linhas = _arquivo_autorizacao([
+        {'numero_protocolo': 'PROT12345', 'data_protocolizacao': date(2023, 2, 1), 'numero_titulo': '1',
+         'nome_devedor': 'DEVEDOR', 'valor_titulo': 100, 'solicitacao_cancelamento': 'A'},
+    ]).split(b'\n')
+    linhas[1] += b'X'
+    content = b'\n'.join(linhas)
+    
+    response = client.post('/api/autorizacoes-cancelamento/upload',
+                           data={'file': (BytesIO(content), 'AC001.txt'), 'validate_only': 'true'},
+                           headers=auth_headers())
+    assert response.status_code == 200
+    resumo = json.loads(response.data)
+    assert resumo['valido'] is False
+    assert resumo['erros'] == 1
+    assert [tipo['mensagem'] for tipo in resumo['ocorrencias_por_tipo']] == [
+        'registro com tamanho diferente de 127 posições']
+    
+    autorizacao = AutorizacaoCancelamento(arquivo_nome='AC.txt', status='Pendente', usuario_id=1)
+    db.session.add(autorizacao)
+    db.session.commit()
+    arquivo = tmp_path / 'AC.txt'
+    arquivo.write_bytes(content)
+    with pytest.raises(ValueError, match='Linha 2: registro com tamanho diferente de 127 posições: 128'):
+        processar_autorizacao(autorizacao.id, str(arquivo))
+    assert autorizacao.status == 'Erro'
+    assert autorizacao.transacoes.count() == 0
+
+
+def test_leitor_largura_fixa(tmp_path):
+    """Testa a leitura em blocos: quebras de bloco, CRLF, linhas em branco, gzip e campos inválidos"""
+    import gzip
+    from app.utils.largura_fixa import LeitorLarguraFixa
+    from app.autorizacoes_cancelamento.leiaute import LEIAUTES
+    
+    def transacao(i, data='01022023', valor='00000000010050'):
+        return (f"1{f'P{i}'.ljust(10)}{data}{i:011d}{f'DEVEDOR ÇÃO {i}'.ljust(45)}{valor}A"
+                f"{' ' * 12}{'67890'.ljust(12)}  {i:06d}{i:05d}")
+    
+    linhas = [f"0001{'BANCO TESTE'.ljust(45)}0102202300050{' ' * 60}00001"]
+    linhas += [transacao(i) for i in range(50)]
+    linhas[10] = transacao(9, data='31022023')
+    linhas[20] = transacao(19, valor='0000000001,050')
+    # Registros fora do tamanho do leiaute não são truncados nem completados em silêncio
+    linhas[30] = transacao(29) + 'EXCEDENTE'
+    linhas[40] = transacao(39)[:100]
+    linhas += ['', 'X registro desconhecido', f"9{linhas[0][1:]}"]
+    conteudo = '\r\n'.join(linhas).encode('latin-1')
+    
+    arquivo = tmp_path / 'AC.txt'
+    arquivo.write_bytes(conteudo)
+    leitor = LeitorLarguraFixa(LEIAUTES, bloco=1000)
+    
+    def ler(stream):
+        transacoes, erros, desconhecidos, tipos = [], [], [], set()
+        for registros in leitor.ler(stream):
+            tipos.add(registros.tipo)
+            if registros.leiaute is None:
+                desconhecidos += registros.linhas.tolist()
+            erros += [(int(registros.linhas[i]), mensagem) for i, mensagem in registros.erros]
+            if registros.leiaute is LEIAUTES['1']:
+                transacoes += list(registros)
+        return transacoes, erros, desconhecidos, tipos
+    
+    with open(arquivo, 'rb') as stream:
+        mapeado = ler(stream)
+    transacoes, erros, desconhecidos, tipos = mapeado
+    assert tipos == {'0', '1', '9', 'X'}
+    assert len(transacoes) == 46
+    assert erros == [(11, 'data de protocolização inválida: 31022023'),
+                     (21, 'valor do título inválido: 0000000001,050'),
+                     (31, 'registro com tamanho diferente de 127 posições: 136'),
+                     (41, 'registro com tamanho diferente de 127 posições: 100')]
+    assert desconhecidos == [53]
+    
+    linha, campos = transacoes[0]
+    assert linha == 2
+    assert campos['numero_protocolo'] == 'P0'
+    assert campos['nome_devedor'] == 'DEVEDOR ÇÃO 0'
+    assert campos['valor_titulo'] == 100.5
+    assert campos['data_protocolizacao'] == date(2023, 2, 1)
+    assert campos['sequencia_registro'] == '00000'
+    
+    # Fluxo descompactado (sem mmap) produz o mesmo resultado
+    with gzip.open(BytesIO(gzip.compress(conteudo))) as stream:
+        assert ler(stream) == mapeado
+
+
+def test_processar_arquivo_resolve_protocolos_em_lote(app, init_database, tmp_path):
+    """Testa que os protocolos são resolvidos com uma consulta por lote e as transações inseridas em bloco"""
+    from sqlalchemy import event
+    from app.autorizacoes_cancelamento.routes import processar_autorizacao
+    
+    for i in range(3):
+        db.session.add(Titulo(numero=f'L{i}', protocolo=f'LOTE{i}', valor=10, status='Protestado',
+                              remessa_id=1, credor_id=1, devedor_id=1))
+    autorizacao = AutorizacaoCancelamento(arquivo_nome='AC.txt', status='Pendente', usuario_id=1)
+    db.session.add(autorizacao)
+    db.session.commit()
+    
+    header = f"0001{'BANCO TESTE'.ljust(45)}0102202300005{' ' * 60}"
+    protocolos = ['LOTE0', 'LOTE1', 'SEMTITULO', 'LOTE2', 'PROT12345']
+    arquivo = tmp_path / 'AC.txt'
+    arquivo.write_bytes("\n".join([f"{header}00001"] + [
+        f"1{protocolo.ljust(10)}0102202312345678901{'DEVEDOR'.ljust(45)}00000000010050A"
+        f"{' ' * 12}{'67890'.ljust(12)}  000001{i + 2:05d}" for i, protocolo in enumerate(protocolos)
+    ] + [f"9{header[1:]}00007"]).encode('latin-1'))
+    
+    comandos = []
+    
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement.split()[0].upper() + (' titulos' if 'FROM titulos' in statement else ''))
+    
+    app.config['AUTORIZACAO_CHUNK_SIZE'] = 2
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        processar_autorizacao(autorizacao.id, str(arquivo))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+    
+    # Lotes de 2 transações: 3 consultas de protocolos e 3 INSERTs
+    assert comandos.count('SELECT titulos') == 3
+    assert comandos.count('INSERT') == 3
+    assert autorizacao.status == 'Processado'
+    transacoes = TransacaoAutorizacaoCancelamento.query.filter_by(autorizacao_id=autorizacao.id) \
+        .order_by(TransacaoAutorizacaoCancelamento.sequencia_registro).all()
+    titulos = {t.protocolo: t.id for t in Titulo.query.all()}
+    assert [t.titulo_id for t in transacoes] == [titulos.get(p) for p in protocolos]
+
+
+def test_processar_arquivo_retoma_apos_falha(app, init_database, tmp_path):
+    """Testa que uma falha no meio do arquivo mantém os lotes confirmados e a nova execução retoma dali"""
+    from app.autorizacoes_cancelamento.routes import processar_autorizacao
+    
+    autorizacao = AutorizacaoCancelamento(arquivo_nome='AC.txt', status='Pendente', usuario_id=1)
+    db.session.add(autorizacao)
+    db.session.commit()
+    
+    header = f"0001{'BANCO TESTE'.ljust(45)}0102202300006{' ' * 60}"
+    
+    def transacao(i, valor='00000000010050'):
+        return (f"1{f'RET{i}'.ljust(10)}0102202312345678901{'DEVEDOR'.ljust(45)}{valor}A"
+                f"{' ' * 12}{'67890'.ljust(12)}  000001{i + 2:05d}")
+    
+    linhas = [f"{header}00001"] + [transacao(i) for i in range(6)] + [f"9{header[1:]}00008"]
+    arquivo = tmp_path / 'AC.txt'
+    app.config['AUTORIZACAO_CHUNK_SIZE'] = 2
+    
+    # Valor inválido na linha 6: as transações das linhas 2 a 5 ficam gravadas
+    invalido = list(linhas)
+    invalido[5] = transacao(4, valor='0000000001,050')
+    arquivo.write_bytes("\n".join(invalido).encode('latin-1'))
+    with pytest.raises(ValueError, match='Linha 6'):
+        processar_autorizacao(autorizacao.id, str(arquivo))
+    assert autorizacao.status == 'Erro'
+    assert autorizacao.linhas_processadas == 5
+    assert autorizacao.transacoes.count() == 4
+    
+    # Nova execução (ex.: tarefa reenfileirada após a correção do arquivo) continua da linha 6
+    arquivo.write_bytes("\n".join(linhas).encode('latin-1'))
+    resumo = processar_autorizacao(autorizacao.id, str(arquivo))
+    assert resumo['retomada_linha'] == 5
+    assert autorizacao.status == 'Processado'
+    assert autorizacao.linhas_processadas == 7
+    assert sorted(t.numero_protocolo for t in autorizacao.transacoes) == [f'RET{i}' for i in range(6)]
 
 
 def test_listar_autorizacoes(client, auth_headers, app, init_database):
@@ -67,7 +359,6 @@ def test_listar_autorizacoes(client, auth_headers, app, init_database):
             status='Processado',
             usuario_id=1
         )
-        db = app.extensions['sqlalchemy'].db
         db.session.add(autorizacao)
         db.session.commit()
     
@@ -102,7 +393,6 @@ def test_detalhes_autorizacao(client, auth_headers, app, init_database):
             status='Processado',
             usuario_id=1
         )
-        db = app.extensions['sqlalchemy'].db
         db.session.add(autorizacao)
         db.session.commit()
         autorizacao_id = autorizacao.id
@@ -122,8 +412,6 @@ def test_processar_transacao(client, auth_headers, app, init_database):
     """Testa o processamento de uma transação de autorização de cancelamento"""
     # Criar uma autorização e uma transação de teste
     with app.app_context():
-        db = app.extensions['sqlalchemy'].db
-        
         # Obter um título existente e marcar como protestado
         titulo = Titulo.query.first()
         titulo.status = 'Protestado'
@@ -176,7 +464,82 @@ def test_processar_transacao(client, auth_headers, app, init_database):
         assert titulo.status == 'Cancelado'
 
 
-def test_gerar_arquivo_exemplo(client, auth_headers):
+def test_processar_transacoes_em_lote(client, auth_headers, app, init_database):
+    """Testa o processamento em lote: comandos em conjunto, contagem por status e transações ignoradas"""
+    from sqlalchemy import event
+    
+    titulos = {}
+    for protocolo, status in [('BULK1', 'Protestado'), ('BULK2', 'Pendente'), ('BULK3', 'Protestado')]:
+        titulos[protocolo] = Titulo(numero=protocolo, protocolo=protocolo, valor=10, status=status,
+                                    remessa_id=1, credor_id=1, devedor_id=1)
+    db.session.add_all(titulos.values())
+    autorizacao = AutorizacaoCancelamento(arquivo_nome='AC.txt', status='Processado', usuario_id=1)
+    outra = AutorizacaoCancelamento(arquivo_nome='AC2.txt', status='Processado', usuario_id=1)
+    db.session.add_all([autorizacao, outra])
+    db.session.commit()
+    
+    def transacao(autorizacao_id, protocolo, status='Pendente', vinculada=False):
+        t = TransacaoAutorizacaoCancelamento(autorizacao_id=autorizacao_id, numero_protocolo=protocolo,
+                                             status=status, solicitacao_cancelamento='A',
+                                             titulo_id=titulos[protocolo].id if vinculada else None)
+        db.session.add(t)
+        return t
+    
+    # Sem vínculo (resolvido pelo protocolo), título não protestado, sem título e já processada
+    transacao(autorizacao.id, 'BULK1')
+    transacao(autorizacao.id, 'BULK2', vinculada=True)
+    transacao(autorizacao.id, 'SEMTITULO')
+    transacao(autorizacao.id, 'BULK3', status='Processado', vinculada=True)
+    avulsa = transacao(outra.id, 'BULK3', vinculada=True)
+    db.session.commit()
+    
+    updates = []
+    
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith(('UPDATE titulos', 'UPDATE transacoes_autorizacao_cancelamento')):
+            updates.append(statement)
+    
+    url = '/api/autorizacoes-cancelamento/transacoes/processar-lote'
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        response = client.post(url, json={'autorizacao_id': autorizacao.id}, headers=auth_headers())
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+    
+    assert response.status_code == 200
+    assert json.loads(response.data)['resultado'] == {
+        'Processado': 1, 'Erro': 1, 'Pendente': 1, 'titulo_nao_encontrado': 1, 'titulo_nao_protestado': 1
+    }
+    assert len(updates) == 4
+    db.session.expire_all()
+    assert {p: t.status for p, t in titulos.items()} == {
+        'BULK1': 'Cancelado', 'BULK2': 'Pendente', 'BULK3': 'Protestado'
+    }
+    assert {t.numero_protocolo: t.status for t in autorizacao.transacoes} == {
+        'BULK1': 'Processado', 'BULK2': 'Pendente', 'SEMTITULO': 'Erro', 'BULK3': 'Processado'
+    }
+    assert avulsa.status == 'Pendente'
+    
+    # Após o protesto, a transação que ficou pendente é processada
+    titulos['BULK2'].status = 'Protestado'
+    db.session.commit()
+    response = client.post(url, json={'autorizacao_id': autorizacao.id}, headers=auth_headers())
+    assert json.loads(response.data)['resultado']['Processado'] == 1
+    db.session.expire_all()
+    assert titulos['BULK2'].status == 'Cancelado'
+    
+    # Conjunto de IDs; transações que não estão pendentes são ignoradas
+    response = client.post(url, json={'transacao_ids': [avulsa.id, avulsa.id - 1]}, headers=auth_headers())
+    assert json.loads(response.data)['resultado']['Processado'] == 1
+    db.session.expire_all()
+    assert avulsa.status == 'Processado'
+    assert titulos['BULK3'].status == 'Cancelado'
+    
+    assert client.post(url, json={}, headers=auth_headers()).status_code == 400
+    assert client.post(url, json={'autorizacao_id': 999999}, headers=auth_headers()).status_code == 404
+
+
+def test_gerar_arquivo_exemplo(client, init_database, auth_headers):
     """Testa a geração de um arquivo de exemplo"""
     # Fazer a requisição para gerar arquivo de exemplo
     response = client.get('/api/autorizacoes-cancelamento/gerar-arquivo-exemplo', 
@@ -188,8 +551,23 @@ def test_gerar_arquivo_exemplo(client, auth_headers):
     assert 'Content-Disposition' in response.headers
     assert 'attachment' in response.headers['Content-Disposition']
     
-    # Verificar o conteúdo do arquivo
-    content = response.data.decode('latin-1')
-    assert content.startswith('0')
-    assert '1' in content
-    assert content.endswith('4')
\ No newline at end of file
+    # Verificar o conteúdo do arquivo: header, duas transações e trailer de 127 posições
+    linhas = response.data.decode('latin-1').split('\n')
+    assert [len(linha) for linha in linhas] == [127] * 4
+    assert [linha[0] for linha in linhas] == ['0', '1', '1', '9']
+    assert [linha[122:127] for linha in linhas] == ['00001', '00002', '00003', '00004']
+    
+    header, transacao, _, trailer = linhas
+    data_movimento = date.today().strftime('%d%m%Y')
+    assert header[1:4] == '001'
+    assert header[4:49].rstrip() == 'BANCO EXEMPLO S.A.'
+    assert header[49:57] == data_movimento
+    assert header[57:62] == '00002'
+    # O trailer repete a identificação e a quantidade de solicitações do header
+    assert trailer[1:122] == header[1:122]
+    
+    assert transacao[1:11].rstrip() == 'PROT12345'
+    assert transacao[11:19] == data_movimento
+    assert transacao[75:89] == '00000000010050'
+    assert transacao[89] == 'A'
+    assert transacao[102:114].rstrip() == '67890'
\ No newline at end of file
@@ -184,4 +184,365 @@ def test_carga_endpoints_agregados(client, init_database, auth_headers):
     print(f"\nTeste de carga para endpoints agregados:")
     print(f"Número de requisições: {num_requests}")
     print(f"Tempo total: {tempo_total:.2f}s")
-    print(f"Tempo médio por requisição: {tempo_medio:.2f}s")
\ No newline at end of file
+    print(f"Tempo médio por requisição: {tempo_medio:.2f}s")
+
+@pytest.mark.carga
+def test_carga_custo_autenticacao_basic(client, init_database):
+    """
+    Benchmark do custo de autenticação por requisição.
+    Compara o caminho sem cache (bcrypt a cada requisição) com o cache de
+    credenciais verificadas do middleware auth_required.
+    """
+    import base64
+    from app.auth.middleware import credential_cache
+    
+    credenciais = base64.b64encode(b'testuser:password123').decode('utf-8')
+    headers = {'Authorization': f'Basic {credenciais}'}
+    num_requests = 30
+    
+    # Antes: cache limpo a cada requisição, forçando bcrypt
+    start_time = time.perf_counter()
+    for _ in range(num_requests):
+        credential_cache.clear()
+        response = client.get('/api/auth/me', headers=headers)
+        assert response.status_code == 200
+    tempo_sem_cache = (time.perf_counter() - start_time) / num_requests
+    
+    # Depois: credenciais verificadas uma vez e reaproveitadas
+    credential_cache.clear()
+    client.get('/api/auth/me', headers=headers)
+    start_time = time.perf_counter()
+    for _ in range(num_requests):
+        response = client.get('/api/auth/me', headers=headers)
+        assert response.status_code == 200
+    tempo_com_cache = (time.perf_counter() - start_time) / num_requests
+    
+    assert credential_cache.hits >= num_requests
+    assert tempo_com_cache < tempo_sem_cache, (
+        f"Cache de credenciais não reduziu o custo ({tempo_com_cache:.4f}s vs {tempo_sem_cache:.4f}s)"
+    )
+    
+    print(f"\nBenchmark de autenticação Basic:")
+    print(f"Número de requisições: {num_requests}")
+    print(f"Custo médio sem cache (bcrypt): {tempo_sem_cache * 1000:.2f}ms")
+    print(f"Custo médio com cache: {tempo_com_cache * 1000:.2f}ms")
+    print(f"Ganho: {tempo_sem_cache / tempo_com_cache:.1f}x")
+
+@pytest.mark.carga
+def test_carga_ingestao_titulos_em_lote(app, init_database):
+    """
+    Benchmark da gravação de títulos na ingestão de remessas.
+    Compara o caminho ORM (um objeto Titulo por registro, com db.session.add)
+    com o TituloBulkWriter (COPY + INSERT ... SELECT no PostgreSQL).
+    Quantidade configurável por BENCHMARK_TITULOS (padrão: 100 mil).
+    """
+    import os
+    from decimal import Decimal
+    from app import db
+    from app.models import Remessa, Titulo, Credor, Devedor
+    from app.remessas.gravacao_lote import TituloBulkWriter
+    
+    quantidade = int(os.environ.get('BENCHMARK_TITULOS', 100000))
+    tamanho_lote = app.config.get('REMESSA_CHUNK_SIZE', 1000)
+    
+    def gerar_registros(prefixo, serie):
+        # Documentos distintos por série (o documento normalizado é único)
+        for i in range(quantidade):
+            yield (
+                {'numero': f'{prefixo}{i}', 'protocolo': f'{prefixo}{i:09d}', 'valor': Decimal('150.00'),
+                 'data_emissao': None, 'data_vencimento': datetime(2024, 2, 10).date(), 'especie': 'DMI',
+                 'aceite': False, 'nosso_numero': None, 'status': 'Pendente'},
+                {'nome': f'Credor {i % 10}', 'documento': f'{serie}{i % 10:013d}',
+                 'endereco': None, 'cidade': None, 'uf': 'SP', 'cep': None},
+                {'nome': f'Devedor {i % 1000}', 'documento': f'{serie}{i % 1000:010d}',
+                 'endereco': None, 'cidade': None, 'uf': 'SP', 'cep': None},
+            )
+    
+    def nova_remessa(nome):
+        remessa = Remessa(nome_arquivo=nome, status='Processando', uf='SP', tipo='Remessa', usuario_id=1)
+        db.session.add(remessa)
+        db.session.commit()
+        return remessa.id
+    
+    # Antes: um objeto ORM por título (partes resolvidas em memória para isolar o custo do ORM)
+    remessa_id = nova_remessa('benchmark_orm.xml')
+    partes = {}
+    start_time = time.perf_counter()
+    for i, (titulo, credor, devedor) in enumerate(gerar_registros('ORM', 8), 1):
+        for model, dados in ((Credor, credor), (Devedor, devedor)):
+            if dados['documento'] not in partes:
+                objeto = model(**dados)
+                db.session.add(objeto)
+                db.session.flush()
+                partes[dados['documento']] = objeto.id
+        db.session.add(Titulo(remessa_id=remessa_id, credor_id=partes[credor['documento']],
+                              devedor_id=partes[devedor['documento']], **titulo))
+        if i % tamanho_lote == 0:
+            db.session.commit()
+    db.session.commit()
+    tempo_orm = time.perf_counter() - start_time
+    
+    # Depois: gravação em lote, confirmada a cada REMESSA_CHUNK_SIZE títulos
+    remessa_id = nova_remessa('benchmark_lote.xml')
+    writer = TituloBulkWriter(remessa_id)
+    start_time = time.perf_counter()
+    lote = []
+    for registro in gerar_registros('BLK', 9):
+        lote.append(registro)
+        if len(lote) >= tamanho_lote:
+            writer.write(lote)
+            db.session.commit()
+            lote = []
+    writer.write(lote)
+    db.session.commit()
+    tempo_lote = time.perf_counter() - start_time
+    
+    assert Titulo.query.filter_by(remessa_id=remessa_id).count() == quantidade
+    assert db.session.query(db.func.count(db.distinct(Titulo.devedor_id))).filter(
+        Titulo.remessa_id == remessa_id).scalar() == 1000
+    assert tempo_lote < tempo_orm, (
+        f"Gravação em lote não foi mais rápida ({tempo_lote:.2f}s vs {tempo_orm:.2f}s)"
+    )
+    
+    print(f"\nBenchmark de ingestão de títulos ({'COPY' if writer.use_copy else 'executemany'}):")
+    print(f"Títulos: {quantidade} (lotes de {tamanho_lote})")
+    print(f"ORM (db.session.add): {tempo_orm:.2f}s ({quantidade / tempo_orm:.0f} títulos/s)")
+    print(f"Gravação em lote: {tempo_lote:.2f}s ({quantidade / tempo_lote:.0f} títulos/s)")
+    print(f"Ganho: {tempo_orm / tempo_lote:.1f}x")
+
+@pytest.mark.carga
+def test_carga_validacao_paralela(app):
+    """
+    Benchmark da validação de títulos na ingestão de remessas.
+    Compara a validação no próprio processo com o pool de processos
+    (VALIDACAO_WORKERS, ou o número de CPUs quando 0).
+    Quantidade configurável por BENCHMARK_VALIDACAO (padrão: 200 mil).
+    """
+    import os
+    from app.remessas.ingestao import RemessaIngestor
+    
+    quantidade = int(os.environ.get('BENCHMARK_VALIDACAO', 200000))
+    tamanho_lote = app.config.get('REMESSA_CHUNK_SIZE', 1000)
+    workers = app.config.get('VALIDACAO_WORKERS') or min(4, os.cpu_count() or 1)
+    
+    def cpf(base):
+        digitos = [int(d) for d in f'{base:09d}']
+        for pesos in (range(10, 1, -1), range(11, 1, -1)):
+            resto = sum(d * p for d, p in zip(digitos, pesos)) % 11
+            digitos.append(0 if resto < 2 else 11 - resto)
+        return ''.join(map(str, digitos))
+    
+    documentos = [cpf(100000000 + i) for i in range(1000)]
+    
+    def gerar_lotes():
+        lote = []
+        for i in range(quantidade):
+            lote.append((i + 1, {
+                'numero': f'VAL{i}', 'protocolo': f'VAL{i:09d}', 'valor': '1.500,00',
+                'data_emissao': '10/01/2024', 'data_vencimento': '2024-02-10', 'especie': 'DMI',
+                'aceite': 'N', 'devedor': {'nome': f'Devedor {i % 1000}',
+                                           'documento': documentos[i % 1000], 'uf': 'sp'},
+            }))
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+    
+    def medir(n_workers):
+        ingestor = RemessaIngestor(0, chunk_size=tamanho_lote, workers=n_workers)
+        start_time = time.perf_counter()
+        aceitos = sum(
+            1 for resultados in ingestor._validar(gerar_lotes())
+            for _, _, registro, _ in resultados if registro is not None
+        )
+        assert aceitos == quantidade
+        return time.perf_counter() - start_time
+    
+    tempo_sequencial = medir(0)
+    medir(workers)  # Aquecimento: inicialização dos processos do pool
+    tempo_paralelo = medir(workers)
+    
+    if (os.cpu_count() or 1) >= 2:
+        assert tempo_paralelo < tempo_sequencial, (
+            f"Validação paralela não foi mais rápida ({tempo_paralelo:.2f}s vs {tempo_sequencial:.2f}s)"
+        )
+    
+    print(f"\nBenchmark de validação de títulos ({os.cpu_count()} CPUs):")
+    print(f"Títulos: {quantidade} (lotes de {tamanho_lote})")
+    print(f"No próprio processo: {tempo_sequencial:.2f}s ({quantidade / tempo_sequencial:.0f} títulos/s)")
+    print(f"Pool com {workers} processos: {tempo_paralelo:.2f}s ({quantidade / tempo_paralelo:.0f} títulos/s)")
+    print(f"Ganho: {tempo_sequencial / tempo_paralelo:.1f}x")
+
+@pytest.mark.carga
+def test_carga_desistencias_em_lote(app, init_database, tmp_path):
+    """
+    Benchmark da ingestão de um arquivo de desistências.
+    Os títulos são localizados por protocolo com uma consulta por lote e as
+    desistências e erros são inseridos em bloco.
+    Quantidade configurável por BENCHMARK_DESISTENCIAS (padrão: 50 mil).
+    """
+    import os
+    from decimal import Decimal
+    from app import db
+    from app.models import Remessa, Desistencia
+    from app.remessas.gravacao_lote import TituloBulkWriter
+    from app.remessas.routes import processar_desistencia
+    
+    quantidade = int(os.environ.get('BENCHMARK_DESISTENCIAS', 50000))
+    tamanho_lote = app.config.get('REMESSA_CHUNK_SIZE', 1000)
+    
+    remessa = Remessa(nome_arquivo='benchmark_titulos.xml', status='Processado', uf='SP', tipo='Remessa',
+                      usuario_id=1)
+    desistencia = Remessa(nome_arquivo='benchmark_desistencias.xml', status='Pendente', uf='SP',
+                          tipo='Desistência', usuario_id=1)
+    db.session.add_all([remessa, desistencia])
+    db.session.commit()
+    
+    writer = TituloBulkWriter(remessa.id)
+    parte = {'nome': 'Devedor', 'documento': '52998224725', 'endereco': None, 'cidade': None, 'uf': 'SP',
+             'cep': None}
+    for inicio in range(0, quantidade, tamanho_lote):
+        writer.write([
+            ({'numero': f'DB{i}', 'protocolo': f'DB{i:09d}', 'valor': Decimal('10.00'), 'data_emissao': None,
+              'data_vencimento': None, 'especie': 'DMI', 'aceite': False, 'nosso_numero': None,
+              'status': 'Pendente'}, None, parte)
+            for i in range(inicio, min(inicio + tamanho_lote, quantidade))
+        ])
+        db.session.commit()
+    
+    # 1% dos registros aponta para protocolos inexistentes
+    arquivo = tmp_path / 'desistencias.xml'
+    with open(arquivo, 'w', encoding='utf-8') as saida:
+        saida.write('<desistencias>')
+        for i in range(quantidade):
+            protocolo = f'DB{i:09d}' if i % 100 else f'XX{i:09d}'
+            saida.write(f'<desistencia><protocolo>{protocolo}</protocolo><motivo>Pagamento</motivo></desistencia>')
+        saida.write('</desistencias>')
+    
+    start_time = time.perf_counter()
+    resumo = processar_desistencia(desistencia.id, str(arquivo))
+    tempo = time.perf_counter() - start_time
+    
+    assert resumo['desistencias'] == quantidade - quantidade // 100
+    assert resumo['erros'] == quantidade // 100
+    assert Desistencia.query.filter_by(remessa_id=desistencia.id).count() == resumo['desistencias']
+    
+    print("\nBenchmark de ingestão de desistências:")
+    print(f"Registros: {quantidade} (lotes de {tamanho_lote})")
+    print(f"Tempo: {tempo:.2f}s ({quantidade / tempo:.0f} registros/s)")
+
+@pytest.mark.carga
+def test_carga_leitura_autorizacoes(tmp_path):
+    """
+    Benchmark da leitura de arquivos de autorização de cancelamento.
+    Compara o fatiamento linha a linha (strip + strptime por registro) com o
+    LeitorLarguraFixa (mmap + decodificação por colunas com NumPy).
+    Quantidade configurável por BENCHMARK_AUTORIZACOES (padrão: 1 milhão de linhas).
+    """
+    import os
+    from app.utils.largura_fixa import LeitorLarguraFixa
+    from app.autorizacoes_cancelamento.leiaute import LEIAUTES
+    
+    quantidade = int(os.environ.get('BENCHMARK_AUTORIZACOES', 1000000))
+    arquivo = tmp_path / 'autorizacoes.txt'
+    header = f"0001{'BANCO TESTE'.ljust(45)}01022023{quantidade % 100000:05d}{' ' * 60}00001"
+    with open(arquivo, 'w', encoding='latin-1') as saida:
+        saida.write(header + '\n')
+        for i in range(quantidade):
+            saida.write(f"1{f'P{i}'.ljust(10)}{1 + i % 28:02d}{1 + i % 12:02d}2023{i:011d}"
+                        f"{f'DEVEDOR {i % 1000}'.ljust(45)}{i:014d}A{' ' * 12}{'67890'.ljust(12)}  "
+                        f"{i % 1000000:06d}{i % 100000:05d}\n")
+        saida.write(f"9{header[1:]}\n")
+    
+    # Antes: fatiamento e conversão linha a linha
+    start_time = time.perf_counter()
+    lidas = 0
+    with open(arquivo, encoding='latin-1') as entrada:
+        for line in entrada:
+            line = line.strip()
+            if line[0:1] != '1':
+                continue
+            campos = (line[1:11].strip(), line[19:30].strip(), line[30:75].strip(), line[89:90].strip(),
+                      line[90:102].strip(), line[102:114].strip(), line[116:122].strip(), line[122:127].strip())
+            data = datetime.strptime(line[11:19].strip(), '%d%m%Y').date()
+            valor = float(line[75:89].strip()) / 100
+            lidas += 1
+    tempo_linhas = time.perf_counter() - start_time
+    
+    # Depois: leitura em blocos, decodificada por colunas
+    start_time = time.perf_counter()
+    leitor = LeitorLarguraFixa(LEIAUTES)
+    lidas_colunas = 0
+    with open(arquivo, 'rb') as entrada:
+        for registros in leitor.ler(entrada):
+            if registros.leiaute is LEIAUTES['1']:
+                assert not registros.erros
+                lidas_colunas += len(registros.colunas['numero_protocolo'])
+    tempo_colunas = time.perf_counter() - start_time
+    
+    assert lidas == lidas_colunas == quantidade
+    assert tempo_colunas < tempo_linhas, (
+        f"Leitura por colunas não foi mais rápida ({tempo_colunas:.2f}s vs {tempo_linhas:.2f}s)"
+    )
+    
+    print("\nBenchmark de leitura de autorizações de cancelamento:")
+    print(f"Linhas: {quantidade}")
+    print(f"Linha a linha: {tempo_linhas:.2f}s ({quantidade / tempo_linhas:.0f} linhas/s)")
+    print(f"Por colunas: {tempo_colunas:.2f}s ({quantidade / tempo_colunas:.0f} linhas/s)")
+    print(f"Ganho: {tempo_linhas / tempo_colunas:.1f}x")
+
+
+@pytest.mark.carga
+def test_carga_escrita_arquivo_retorno(tmp_path):
+    """
+    Benchmark da geração de arquivos de retorno (largura fixa).
+    Compara a montagem linha a linha (f-string, ljust/zfill e encode por registro)
+    com o EscritorLarguraFixa (formatação por colunas e codificação por bloco).
+    Quantidade configurável por BENCHMARK_RETORNO (padrão: 500 mil títulos).
+    """
+    import os
+    from datetime import date
+    from app.utils.largura_fixa import EscritorLarguraFixa
+    from app.remessas.arquivo_retorno import LEIAUTES
+    
+    quantidade = int(os.environ.get('BENCHMARK_RETORNO', 500000))
+    lote = 5000
+    titulos = [{'protocolo': f'P{i}', 'numero': str(i), 'nosso_numero': f'N{i % 1000}', 'especie': 'DMI',
+                'data_emissao': date(2023, 1 + i % 12, 1 + i % 28), 'data_vencimento': date(2023, 2, 1),
+                'valor': 10.25 + i % 1000, 'documento_devedor': f'{i:011d}',
+                'nome_devedor': f'DEVEDOR AÇÃO {i % 1000}', 'status': 'Protestado',
+                'data_ocorrencia': date(2024, 3, 1)} for i in range(quantidade)]
+    
+    # Antes: um registro formatado e codificado por vez
+    start_time = time.perf_counter()
+    with open(tmp_path / 'linhas.txt', 'wb') as saida:
+        for i, t in enumerate(titulos):
+            linha = (f"1{t['protocolo'][:20].ljust(20)}{t['numero'][:20].ljust(20)}{t['nosso_numero'][:15].ljust(15)}"
+                     f"{t['especie'][:10].ljust(10)}{t['data_emissao'].strftime('%d%m%Y')}"
+                     f"{t['data_vencimento'].strftime('%d%m%Y')}{str(round(t['valor'] * 100)).zfill(14)}"
+                     f"{t['documento_devedor'][:14].ljust(14)}{t['nome_devedor'][:45].ljust(45)}"
+                     f"{t['status'][:20].ljust(20)}{t['data_ocorrencia'].strftime('%d%m%Y')}{' ' * 11}{i + 2:06d}\n")
+            saida.write(linha.encode('latin-1', errors='replace'))
+    tempo_linhas = time.perf_counter() - start_time
+    
+    # Depois: blocos formatados por colunas e codificados de uma vez
+    start_time = time.perf_counter()
+    escritor = EscritorLarguraFixa(LEIAUTES)
+    blocos = (('1', titulos[i:i + lote], {'sequencia_registro': range(i + 2, i + 2 + lote)})
+              for i in range(0, quantidade, lote))
+    with open(tmp_path / 'colunas.txt', 'wb') as saida:
+        for parte in escritor.escrever(blocos):
+            saida.write(parte)
+    tempo_colunas = time.perf_counter() - start_time
+    
+    assert (tmp_path / 'colunas.txt').read_bytes() + b'\n' == (tmp_path / 'linhas.txt').read_bytes()
+    assert tempo_colunas < tempo_linhas, (
+        f"Escrita por colunas não foi mais rápida ({tempo_colunas:.2f}s vs {tempo_linhas:.2f}s)"
+    )
+    
+    print("\nBenchmark de geração de arquivos de retorno:")
+    print(f"Títulos: {quantidade}")
+    print(f"Linha a linha: {tempo_linhas:.2f}s ({quantidade / tempo_linhas:.0f} linhas/s)")
+    print(f"Por colunas: {tempo_colunas:.2f}s ({quantidade / tempo_colunas:.0f} linhas/s)")
+    print(f"Ganho: {tempo_linhas / tempo_colunas:.1f}x")
@@ -174,6 +174,33 @@ def test_credor_devedor_models(app):
     assert devedor_dict['nome'] == 'Devedor Modelo Teste'
     assert devedor_dict['documento'] == '98765432109876'
 
+def test_resolver_partes_por_documento_normalizado(app):
+    """Testa a resolução em lote de devedores pelo CPF/CNPJ normalizado, sem duplicar cadastros"""
+    from app.utils.partes import normalizar_documento, resolver_partes
+    
+    assert normalizar_documento('123.456.789-01') == '12345678901'
+    assert normalizar_documento(' - ') is None
+    
+    devedor = Devedor(nome='Devedor Existente', documento='12.345.678/0001-90')
+    db.session.add(devedor)
+    db.session.commit()
+    assert devedor.documento_normalizado == '12345678000190'
+    
+    ids = resolver_partes(Devedor, [
+        {'nome': 'Devedor Existente', 'documento': '12345678000190'},
+        {'nome': 'Novo Devedor', 'documento': '111.222.333-44'},
+        {'nome': 'Novo Devedor', 'documento': '11122233344'},
+    ])
+    db.session.commit()
+    
+    assert ids['12345678000190'] == devedor.id
+    assert Devedor.query.filter_by(documento_normalizado='11122233344').count() == 1
+    
+    # Lote seguinte reaproveita o cadastro criado
+    assert resolver_partes(Devedor, [{'nome': 'Outro', 'documento': '111 222 333 44'}]) == {
+        '11122233344': ids['11122233344']
+    }
+
 def test_desistencia_model(app, init_database):
     """Testa o modelo de desistência"""
     # Criar uma nova desistência
@@ -176,4 +176,743 @@ def test_delete_remessa(client, init_database, auth_headers):
     
     # Verificar se a remessa foi realmente excluída
     remessa = Remessa.query.get(remessa_id)
-    assert remessa is None
\ No newline at end of file
+    assert remessa is None
+def _tarefa_contar_usuarios(espera):
+    """Tarefa de teste: usa a sessão do banco dentro do executor"""
+    import time
+    from app.models import User
+    from app.utils.async_tasks import update_task_progress, get_current_task_id
+    update_task_progress(get_current_task_id(), 50)
+    time.sleep(espera)
+    return User.query.count()
+
+def test_executor_tarefas_com_contexto_e_limite(app, init_database):
+    """Testa que as tarefas da fila persistente têm contexto de aplicação e respeitam o limite por tipo"""
+    import time
+    from app.utils.async_tasks import executor, enqueue_task, get_task_status
+    
+    app.config['TASK_ALLOWED_MODULES'] = ('app.', 'tests.')
+    app.config['TASK_POLL_INTERVAL'] = 0.1
+    executor.init_app(app)
+    executor.concurrency_limits = {'_tarefa_contar_usuarios': 1}
+    task_ids = [enqueue_task(_tarefa_contar_usuarios, 'Teste', 0.3) for _ in range(2)]
+    executor.start()
+    
+    time.sleep(0.15)
+    db.session.expire_all()
+    assert [get_task_status(t)['status'] for t in task_ids] == ['running', 'pending']
+    
+    for _ in range(50):
+        db.session.expire_all()
+        if all(get_task_status(t)['status'] == 'completed' for t in task_ids):
+            break
+        time.sleep(0.1)
+    
+    assert all(get_task_status(t)['result'] == 1 for t in task_ids)
+    executor.shutdown(wait=True)
+
+def test_listar_tarefas_por_status(client, init_database, auth_headers):
+    """Testa a listagem de tarefas persistidas filtrada por status"""
+    from app.utils import task_store
+    
+    task_store.insert_task('task_teste', 'Tarefa de teste', 'processar_remessa',
+                           'app.remessas.routes:processar_remessa', (1, '/tmp/x.xml'), {})
+    
+    response = client.get('/api/remessas/tasks?status=pending', headers=auth_headers(1))
+    data = json.loads(response.data)
+    
+    assert response.status_code == 200
+    assert [t['task_id'] for t in data['tasks']] == ['task_teste']
+    
+    response = client.get('/api/remessas/tasks?status=completed', headers=auth_headers(1))
+    assert json.loads(response.data)['count'] == 0
+
+def test_stream_tarefas_sse(client, init_database, auth_headers):
+    """Testa o stream de progresso das tarefas e a retomada pelo Last-Event-ID"""
+    from app.utils import task_store
+    
+    task_store.insert_task('task_stream', 'Tarefa de teste', 'processar_remessa',
+                           'app.remessas.routes:processar_remessa', (1, '/tmp/x.xml'), {})
+    assert task_store.claim_task('teste')['id'] == 'task_stream'
+    assert task_store.mark_finished('task_stream', 'teste', task_store.COMPLETED, resultado={'titulos': 3})
+    
+    response = client.get('/api/remessas/tasks/stream?ids=task_stream,inexistente', headers=auth_headers(1))
+    body = response.get_data(as_text=True)
+    
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: not_found' in body
+    assert 'id: 3,0\nevent: task' in body
+    assert '"status": "completed"' in body
+    assert 'event: end' in body
+    
+    # Retomando a partir do último evento não há eventos repetidos
+    headers = dict(auth_headers(1), **{'Last-Event-ID': '3'})
+    response = client.get('/api/remessas/tasks/stream?ids=task_stream', headers=headers)
+    body = response.get_data(as_text=True)
+    assert 'event: task' not in body
+    assert 'event: end' in body
+
+def test_stream_tarefas_token_de_stream(client, init_database):
+    """Testa o token de stream: aceito só na URL do stream, nunca o token de acesso, e revogado no logout"""
+    from app.utils import task_store
+    
+    task_store.insert_task('task_stream', 'Tarefa de teste', 'processar_remessa',
+                           'app.remessas.routes:processar_remessa', (1, '/tmp/x.xml'), {})
+    task_store.claim_task('teste')
+    task_store.mark_finished('task_stream', 'teste', task_store.COMPLETED)
+    
+    response = client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'password123'})
+    access_token = json.loads(response.data)['access_token']
+    headers = {'Authorization': f'Bearer {access_token}'}
+    
+    response = client.post('/api/remessas/tasks/stream/token', headers=headers)
+    assert response.status_code == 200
+    stream_token = json.loads(response.data)['stream_token']
+    
+    url = '/api/remessas/tasks/stream?ids=task_stream'
+    response = client.get(f'{url}&stream_token={stream_token}')
+    assert response.status_code == 200
+    assert 'event: end' in response.get_data(as_text=True)
+    
+    # O token de acesso não é aceito na URL, e o token de stream não vale como token de acesso
+    assert client.get(f'{url}&access_token={access_token}').status_code == 401
+    assert client.get(f'{url}&stream_token={access_token}').status_code == 401
+    assert client.get('/api/remessas/tasks', headers={'Authorization': f'Bearer {stream_token}'}).status_code == 401
+    assert client.get(f'/api/remessas/tasks?stream_token={stream_token}').status_code == 401
+    
+    # O logout revoga também os tokens de stream emitidos com o token de acesso
+    client.post('/api/auth/logout', headers=headers)
+    assert client.get(f'{url}&stream_token={stream_token}').status_code == 401
+
+def test_escalonamento_prioridade_e_justica_por_tenant(app, init_database):
+    """Testa prioridade, round-robin entre tenants (usuário + UF) e limite por tenant"""
+    import time
+    from app.utils import task_store
+    
+    def inserir(task_id, usuario_id, uf, prioridade=0):
+        task_store.insert_task(task_id, 'Teste', 'processar_remessa', 'app.remessas.routes:processar_remessa',
+                               (), {}, prioridade=prioridade, usuario_id=usuario_id, uf=uf)
+        time.sleep(0.01)
+    
+    for i in range(3):
+        inserir(f'sp{i}', 1, 'SP')
+    inserir('rj0', 1, 'RJ')
+    inserir('desistencia', 1, 'MG', prioridade=10)
+    
+    ordem = []
+    while True:
+        task = task_store.claim_task('teste', tenant_cap=2)
+        if not task:
+            break
+        ordem.append(task['id'])
+    
+    # Prioridade primeiro; depois alternância entre tenants; SP limitado a 2 simultâneas
+    assert ordem == ['desistencia', 'sp0', 'rj0', 'sp1']
+
+def test_escalonamento_janela_de_atendimento(app, init_database):
+    """Testa que atendimentos fora da janela não pesam no round-robin entre tenants"""
+    from datetime import datetime, timedelta
+    from app.utils import task_store
+    
+    agora = datetime.utcnow()
+    rows = [
+        # Histórico: SP atendido há 3h, RJ há 2h (ambos fora da janela de 1h)
+        dict(task_store.task_row('sp_antiga', 'Teste', 'processar_remessa', 'app.x:y', (), {}, usuario_id=1, uf='SP'),
+             status=task_store.COMPLETED, data_inicio=agora - timedelta(hours=3)),
+        dict(task_store.task_row('rj_antiga', 'Teste', 'processar_remessa', 'app.x:y', (), {}, usuario_id=1, uf='RJ'),
+             status=task_store.COMPLETED, data_inicio=agora - timedelta(hours=2)),
+        # Pendentes: a de RJ é a mais antiga
+        dict(task_store.task_row('rj', 'Teste', 'processar_remessa', 'app.x:y', (), {}, usuario_id=1, uf='RJ'),
+             data_inicio=None, data_criacao=agora - timedelta(minutes=10)),
+        dict(task_store.task_row('sp', 'Teste', 'processar_remessa', 'app.x:y', (), {}, usuario_id=1, uf='SP'),
+             data_inicio=None, data_criacao=agora - timedelta(minutes=5)),
+    ]
+    task_store.insert_tasks(rows)
+    
+    # Sem atendimento recente, o empate é resolvido pela tarefa pendente mais antiga
+    assert task_store.claim_task('teste', janela_atendimento=3600)['id'] == 'rj'
+    db.session.execute(db.text("UPDATE tasks SET status = 'pending', data_inicio = NULL WHERE id = 'rj'"))
+    db.session.commit()
+    # Com uma janela que alcança o histórico, SP (atendido há mais tempo) passa à frente
+    assert task_store.claim_task('teste', janela_atendimento=4 * 3600)['id'] == 'sp'
+
+def test_retentativa_e_dead_letter(client, init_database, auth_headers):
+    """Testa backoff para erros transitórios, falha definitiva e reenfileiramento em lote"""
+    from app.utils import task_store
+    
+    task_store.insert_task('retry', 'Teste', 'processar_remessa', 'app.remessas.routes:processar_remessa',
+                           (), {}, max_tentativas=2)
+    
+    # Primeira falha transitória: volta para a fila com nova tentativa agendada
+    assert task_store.claim_task('teste')['id'] == 'retry'
+    assert task_store.record_failure('retry', 'teste', 'conexão perdida', transitorio=True, base_delay=60) == 'pending'
+    assert task_store.claim_task('teste') is None  # aguardando o backoff
+    
+    # Após o backoff a tarefa é reprocessada; tentativas esgotadas vão para o dead-letter
+    db.session.execute(db.text("UPDATE tasks SET proxima_execucao = NULL WHERE id = 'retry'"))
+    db.session.commit()
+    assert task_store.claim_task('teste')['id'] == 'retry'
+    assert task_store.record_failure('retry', 'teste', 'conexão perdida', 'Traceback ...', transitorio=True) == 'failed'
+    response = client.get('/api/remessas/tasks/dead-letter', headers=auth_headers(1))
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['count'] == 1
+    assert data['tasks'][0]['error_detail'] == 'Traceback ...'
+    
+    # Reenfileiramento exige critério explícito
+    response = client.post('/api/remessas/tasks/dead-letter/requeue', json={}, headers=auth_headers(1))
+    assert response.status_code == 400
+    
+    response = client.post('/api/remessas/tasks/dead-letter/requeue',
+                           json={'task_type': 'processar_remessa'}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert json.loads(response.data)['requeued'] == ['retry']
+    assert task_store.claim_task('teste')['id'] == 'retry'
+
+def test_erro_de_conteudo_nao_e_retentado(app, init_database):
+    """Testa que ValueError (ex.: arquivo fora do leiaute) falha de vez, mesmo com retry_all_errors"""
+    from app.utils import task_store
+    from app.utils.async_tasks import _record_failure
+    
+    app.config['TASK_RETRY_POLICIES'] = dict(app.config['TASK_RETRY_POLICIES'],
+                                             processar_autorizacao={'max_attempts': 5, 'retry_all_errors': True})
+    for task_id in ('leiaute', 'outro'):
+        task_store.insert_task(task_id, 'Teste', 'processar_autorizacao',
+                               'app.autorizacoes_cancelamento.routes:processar_autorizacao', (), {}, max_tentativas=5)
+    
+    assert task_store.claim_task('teste')['id'] == 'leiaute'
+    _record_failure('leiaute', 'teste', 'processar_autorizacao', ValueError('Linha 2: valor do título inválido'))
+    assert task_store.claim_task('teste')['id'] == 'outro'
+    _record_failure('outro', 'teste', 'processar_autorizacao', RuntimeError('falha inesperada'))
+    
+    db.session.expire_all()
+    assert task_store.get_task('leiaute').status == task_store.FAILED
+    assert task_store.get_task('outro').status == task_store.PENDING
+
+def test_termino_ignorado_apos_devolucao_a_fila(app, init_database):
+    """Testa que a execução antiga não sobrescreve uma tarefa devolvida à fila e reservada por outro worker"""
+    from app.utils import task_store
+    
+    task_store.insert_task('stale', 'Teste', 'processar_remessa', 'app.remessas.routes:processar_remessa', (), {},
+                           max_tentativas=3)
+    assert task_store.claim_task('worker-a')['id'] == 'stale'
+    
+    # worker-a parou de enviar heartbeat: a tarefa volta à fila e worker-b a reserva
+    db.session.execute(db.text("UPDATE tasks SET heartbeat = '2000-01-01' WHERE id = 'stale'"))
+    db.session.commit()
+    assert task_store.requeue_stale(60) == 1
+    assert task_store.claim_task('worker-b')['worker'] == 'worker-b'
+    
+    assert not task_store.mark_finished('stale', 'worker-a', task_store.COMPLETED, resultado=1)
+    assert task_store.record_failure('stale', 'worker-a', 'erro antigo') is None
+    db.session.expire_all()
+    assert task_store.get_task('stale').status == task_store.RUNNING
+    
+    assert task_store.mark_finished('stale', 'worker-b', task_store.COMPLETED, resultado=2)
+    assert not task_store.mark_finished('stale', 'worker-b', task_store.FAILED)
+
+def test_agendador_periodico(app, init_database, client, auth_headers):
+    """Testa gatilhos cron, enfileiramento único por janela e exposição na API de tarefas"""
+    from datetime import datetime, timedelta
+    from app.models import Task
+    from app.utils.scheduler import Scheduler, Job, CronTrigger, IntervalTrigger, scheduler
+    
+    # TestingConfig desativa o agendador da aplicação: nenhuma thread é iniciada pelas requisições
+    assert app.config['SCHEDULER_ENABLED'] is False
+    response = client.get('/api/remessas/tasks/schedules', headers=auth_headers(1))
+    assert response.status_code == 200
+    assert not scheduler.started
+    
+    # Sábado ao meio-dia: próxima janela em dia útil às 09:00
+    assert CronTrigger('*/15 9-17 * * 1-5').next_after(datetime(2026, 10, 17, 12, 0)) == datetime(2026, 10, 19, 9, 0)
+    assert CronTrigger('0 5 * * *').next_after(datetime(2026, 10, 16, 5, 0, 30)) == datetime(2026, 10, 17, 5, 0)
+    with pytest.raises(ValueError):
+        CronTrigger('61 * * * *')
+    
+    agendador = Scheduler()
+    agendador.jobs = {'limpeza': Job('limpeza', 'app.utils.scheduled_jobs:limpar_tarefas', IntervalTrigger(60))}
+    agora = datetime.utcnow()
+    agendador.run_pending(agora)  # registra a primeira execução
+    agendador.run_pending(agora + timedelta(seconds=61))
+    agendador.run_pending(agora + timedelta(seconds=62))  # mesma janela: não enfileira novamente
+    
+    assert Task.query.filter_by(tipo='limpeza').count() == 1
+    
+    jobs = agendador.list_jobs()
+    assert jobs[0]['last_task']['task_type'] == 'limpeza'
+    assert jobs[0]['next_run_at'] is not None
+    
+    response = client.get('/api/remessas/tasks/schedules', headers=auth_headers(1))
+    assert response.status_code == 200
+
+def test_processar_remessa_xml_em_lotes(app, init_database, tmp_path):
+    """Testa a ingestão incremental de um XML de remessa, com títulos inválidos e reexecução"""
+    from app.models import Titulo, Erro
+    from app.remessas.routes import processar_remessa
+    
+    cpfs = ['529.982.247-25', '11144477735', '12345678909']
+    titulos = ''.join(
+        f'<titulo><numero>T{i}</numero><protocolo>XML{i:05d}</protocolo><valor>1.500,00</valor>'
+        f'<data_vencimento>10/02/2024</data_vencimento>'
+        f'<devedor><nome>Devedor {i % 3}</nome><documento>{cpfs[i % 3]}</documento></devedor></titulo>'
+        for i in range(7)
+    )
+    invalidos = (
+        '<titulo><numero>SEM-VALOR</numero><devedor><nome>X</nome><documento>1</documento></devedor></titulo>'
+        '<titulo><numero>DUP</numero><protocolo>XML00001</protocolo><valor>10</valor>'
+        f'<devedor><nome>X</nome><documento>{cpfs[0]}</documento></devedor></titulo>'
+    )
+    arquivo = tmp_path / 'remessa.xml'
+    arquivo.write_text(f'<remessa><titulos>{titulos}{invalidos}</titulos></remessa>', encoding='utf-8')
+    
+    remessa = Remessa(nome_arquivo='remessa.xml', status='Pendente', uf='SP', tipo='Remessa', usuario_id=1)
+    db.session.add(remessa)
+    db.session.commit()
+    
+    app.config['REMESSA_CHUNK_SIZE'] = 3
+    resumo = processar_remessa(remessa.id, str(arquivo))
+    
+    assert resumo['lidos'] == 9
+    assert resumo['titulos'] == 7
+    assert resumo['erros'] == 2
+    assert remessa.status == 'Processado'
+    assert remessa.quantidade_titulos == 7
+    assert Titulo.query.filter_by(remessa_id=remessa.id).first().valor == 1500
+    
+    # Nova tentativa após falha não duplica títulos nem erros de validação
+    remessa.status = 'Erro'
+    db.session.commit()
+    processar_remessa(remessa.id, str(arquivo))
+    assert Titulo.query.filter_by(remessa_id=remessa.id).count() == 7
+    assert Erro.query.filter_by(remessa_id=remessa.id, tipo='Validação').count() == 2
+
+
+def _registros_gravacao_lote():
+    """Registros com textos vazios e nulos, credor ausente e partes repetidas"""
+    from decimal import Decimal
+    credor = {'nome': 'Credor\tLote', 'documento': '11.222.333/0001-81', 'endereco': '', 'cidade': None,
+              'uf': 'SP', 'cep': None}
+    devedores = [{'nome': f'Devedor {i}', 'documento': doc, 'endereco': None, 'cidade': 'São Paulo', 'uf': 'SP',
+                  'cep': ''} for i, doc in enumerate(['529.982.247-25', '11144477735'])]
+    return [
+        ({'numero': f'L{i}', 'protocolo': f'LOTE{i:05d}', 'valor': Decimal('10.50') * (i + 1),
+          'data_emissao': None, 'data_vencimento': None, 'especie': 'DMI', 'aceite': bool(i % 2),
+          'nosso_numero': '' if i % 2 else None, 'status': 'Pendente'},
+         credor if i % 3 else None, devedores[i % 2])
+        for i in range(7)
+    ]
+
+def _verificar_gravacao_lote(ids, registros):
+    from app.models import Titulo, Devedor
+    
+    assert len(ids) == len(registros)
+    db.session.expire_all()
+    for titulo_id, (titulo, credor, _) in zip(ids, registros):
+        gravado = db.session.get(Titulo, titulo_id)
+        assert gravado.protocolo == titulo['protocolo']
+        assert gravado.nosso_numero == titulo['nosso_numero']  # '' e None preservados
+        assert (gravado.credor_id is None) == (credor is None)
+    assert Devedor.query.filter_by(documento='11144477735').one().cep == ''
+    assert Devedor.query.filter_by(documento='11144477735').one().endereco is None
+
+def test_gravacao_lote_copy_postgresql(app, init_database):
+    """Testa a gravação com COPY: IDs por posição e NULL distinto de texto vazio"""
+    from app.remessas.gravacao_lote import TituloBulkWriter
+    
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('COPY disponível apenas no PostgreSQL')
+    
+    writer = TituloBulkWriter(1)
+    registros = _registros_gravacao_lote()
+    ids = writer.write(registros)
+    assert writer.use_copy
+    _verificar_gravacao_lote(ids, registros)
+    
+    # Segundo lote na mesma transação reaproveita a tabela de staging
+    assert len(writer.write(registros[:2])) == 2
+    db.session.commit()
+
+def test_gravacao_lote_sem_copy_expert(app, init_database):
+    """Testa que drivers sem copy_expert gravam com executemany"""
+    from app.remessas.gravacao_lote import TituloBulkWriter
+    
+    cursor = db.session.connection().connection.cursor()
+    suporta_copy = hasattr(cursor, 'copy_expert')
+    cursor.close()
+    
+    writer = TituloBulkWriter(1, use_copy=True)
+    registros = _registros_gravacao_lote()
+    ids = writer.write(registros)
+    assert writer.use_copy == suporta_copy
+    _verificar_gravacao_lote(ids, registros)
+    db.session.commit()
+
+def test_validacao_paralela_de_titulos(app, init_database, tmp_path):
+    """Testa a validação em pool de processos: dígitos verificadores, formato e avisos"""
+    from app.models import Titulo, Erro
+    from app.remessas.ingestao import RemessaIngestor
+    from app.remessas.validacao import documento_valido
+    
+    assert documento_valido('529.982.247-25')
+    assert documento_valido('11.222.333/0001-81')
+    assert not documento_valido('529.982.247-24')
+    assert not documento_valido('111.111.111-11')
+    
+    devedor = '<devedor><nome>Devedor</nome><documento>52998224725</documento></devedor>'
+    titulos = ''.join(
+        f'<titulo><numero>V{i}</numero><valor>10</valor>{devedor}</titulo>' for i in range(5)
+    ) + (
+        '<titulo><numero>DV</numero><valor>10</valor>'
+        '<devedor><nome>X</nome><documento>52998224724</documento></devedor></titulo>'
+        '<titulo><numero>PROT</numero><protocolo>12 34</protocolo><valor>10</valor>' + devedor + '</titulo>'
+        '<titulo><numero>AVISO</numero><valor>10</valor><data_emissao>2024-03-01</data_emissao>'
+        '<data_vencimento>2024-02-01</data_vencimento>' + devedor + '</titulo>'
+    )
+    arquivo = tmp_path / 'remessa.xml'
+    arquivo.write_text(f'<remessa>{titulos}</remessa>', encoding='utf-8')
+    
+    remessa = Remessa(nome_arquivo='remessa.xml', status='Processando', uf='SP', tipo='Remessa', usuario_id=1)
+    db.session.add(remessa)
+    db.session.commit()
+    
+    resumo = RemessaIngestor(remessa.id, chunk_size=2, workers=2).run(str(arquivo))
+    
+    assert resumo == {'lidos': 8, 'titulos': 6, 'erros': 2, 'avisos': 1}
+    # Ordem do arquivo preservada apesar da validação paralela
+    numeros = [t.numero for t in Titulo.query.filter_by(remessa_id=remessa.id).order_by(Titulo.id)]
+    assert numeros == ['V0', 'V1', 'V2', 'V3', 'V4', 'AVISO']
+    
+    aviso = Erro.query.filter(Erro.remessa_id == remessa.id, Erro.titulo_id.isnot(None)).one()
+    assert aviso.titulo.numero == 'AVISO'
+    assert 'vencimento anterior' in aviso.mensagem
+    rejeitados = Erro.query.filter_by(remessa_id=remessa.id, titulo_id=None).all()
+    assert sorted(e.mensagem.split(':')[0] for e in rejeitados) == ['Título 6 (DV)', 'Título 7 (PROT)']
+
+
+def test_upload_em_partes_retomavel(client, init_database, auth_headers):
+    """Testa o upload em partes: sequência de offsets, checksum por parte, retomada e finalização"""
+    import hashlib
+    from app.models import UploadFragmentado
+    
+    headers = auth_headers(1)
+    conteudo = b'<remessa>' + b''.join(
+        f'<titulo><numero>P{i}</numero><valor>10</valor></titulo>'.encode() for i in range(200)
+    ) + b'</remessa>'
+    sha256 = hashlib.sha256(conteudo).hexdigest()
+    partes = [conteudo[i:i + 1000] for i in range(0, len(conteudo), 1000)]
+    
+    response = client.post('/api/remessas/uploads', headers=headers, json={
+        'nome_arquivo': 'estadual.xml', 'tamanho': len(conteudo), 'uf': 'SP', 'tipo': 'Remessa'
+    })
+    assert response.status_code == 201
+    upload_id = json.loads(response.data)['id']
+    url = f'/api/remessas/uploads/{upload_id}'
+    
+    def enviar(offset, parte, **extra):
+        return client.put(f'{url}?offset={offset}', data=parte, headers=dict(headers, **extra),
+                          content_type='application/octet-stream')
+    
+    assert enviar(0, partes[0]).status_code == 200
+    # Lacuna no arquivo e parte com checksum divergente são recusadas
+    assert enviar(2000, partes[2]).status_code == 409
+    resposta = enviar(1000, partes[1], **{'X-Chunk-SHA256': '0' * 64})
+    assert resposta.status_code == 400
+    assert json.loads(resposta.data)['bytes_recebidos'] == 1000
+    
+    # Retomada: consulta o que já foi recebido e reenvia a partir dali (parte repetida é aceita)
+    assert json.loads(client.get(url, headers=headers).data)['bytes_recebidos'] == 1000
+    assert enviar(0, partes[0]).status_code == 200
+    assert client.post(f'{url}/finalizar', headers=headers, json={'sha256': sha256}).status_code == 400
+    for indice, parte in enumerate(partes[1:], 1):
+        assert enviar(indice * 1000, parte,
+                      **{'X-Chunk-SHA256': hashlib.sha256(parte).hexdigest()}).status_code == 200
+    
+    assert client.post(f'{url}/finalizar', headers=headers, json={'sha256': 'f' * 64}).status_code == 400
+    response = client.post(f'{url}/finalizar', headers=headers, json={'sha256': sha256})
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['task_id']
+    assert data['remessa']['hash_arquivo'] == sha256
+    assert UploadFragmentado.query.get(upload_id).remessa_id == data['id']
+    assert enviar(0, partes[0]).status_code == 409
+
+
+def test_processar_desistencia_em_lote(app, init_database, tmp_path):
+    """Testa a ingestão de um XML de desistências: títulos localizados por protocolo e reexecução"""
+    from app.models import Desistencia, Erro
+    from app.remessas.routes import processar_remessa, processar_desistencia
+    
+    titulos = ''.join(
+        f'<titulo><numero>D{i}</numero><protocolo>DES{i:05d}</protocolo><valor>10</valor>'
+        f'<devedor><nome>Devedor</nome><documento>52998224725</documento></devedor></titulo>'
+        for i in range(6)
+    )
+    arquivo_remessa = tmp_path / 'remessa.xml'
+    arquivo_remessa.write_text(f'<remessa>{titulos}</remessa>', encoding='utf-8')
+    remessa = Remessa(nome_arquivo='remessa.xml', status='Pendente', uf='SP', tipo='Remessa', usuario_id=1)
+    db.session.add(remessa)
+    db.session.commit()
+    processar_remessa(remessa.id, str(arquivo_remessa))
+    
+    registros = ''.join(
+        f'<desistencia><protocolo>DES{i:05d}</protocolo><motivo>Pagamento {i}</motivo></desistencia>'
+        for i in range(5)
+    ) + (
+        '<desistencia><protocolo>DES00001</protocolo></desistencia>'
+        '<desistencia><protocolo>INEXISTENTE</protocolo></desistencia>'
+        '<desistencia><numero>SEM-PROTOCOLO</numero></desistencia>'
+    )
+    arquivo = tmp_path / 'desistencias.xml'
+    arquivo.write_text(f'<desistencias>{registros}</desistencias>', encoding='utf-8')
+    desistencia = Remessa(nome_arquivo='desistencias.xml', status='Pendente', uf='SP', tipo='Desistência',
+                          usuario_id=1)
+    db.session.add(desistencia)
+    db.session.commit()
+    
+    app.config['REMESSA_CHUNK_SIZE'] = 3
+    resumo = processar_desistencia(desistencia.id, str(arquivo))
+    
+    assert resumo == {'lidos': 8, 'desistencias': 5, 'erros': 3, 'remessa_id': desistencia.id}
+    assert desistencia.status == 'Processado'
+    assert desistencia.quantidade_titulos == 5
+    criadas = Desistencia.query.filter_by(remessa_id=desistencia.id).all()
+    assert sorted(d.motivo for d in criadas) == [f'Pagamento {i}' for i in range(5)]
+    assert all(d.status == 'Pendente' and d.usuario_id == 1 for d in criadas)
+    mensagens = [e.mensagem for e in Erro.query.filter_by(remessa_id=desistencia.id, tipo='Validação')]
+    assert any('já possui desistência' in m for m in mensagens)
+    assert any('título não encontrado' in m for m in mensagens)
+    assert any('protocolo não informado' in m for m in mensagens)
+    
+    # Reexecução após falha: o resultado parcial anterior é descartado
+    desistencia.status = 'Processando'
+    db.session.commit()
+    processar_desistencia(desistencia.id, str(arquivo))
+    assert Desistencia.query.filter_by(remessa_id=desistencia.id).count() == 5
+    assert Erro.query.filter_by(remessa_id=desistencia.id, tipo='Validação').count() == 3
+
+
+def test_upload_remessa_validate_only(client, init_database, auth_headers):
+    """Testa a validação prévia de uma remessa: resumo compacto, sem gravar, e ocorrências paginadas"""
+    from io import BytesIO
+    from app.models import Titulo
+    
+    headers = auth_headers(1)
+    titulos = ''.join(
+        f'<titulo><numero>V{i}</numero><protocolo>VAL{i:05d}</protocolo><valor>10</valor>'
+        f'<devedor><nome>Devedor</nome><documento>52998224725</documento></devedor></titulo>'
+        for i in range(20)
+    )
+    invalidos = ''.join(
+        f'<titulo><numero>INV{i}</numero><valor>abc</valor>'
+        f'<devedor><nome>Devedor</nome><documento>52998224725</documento></devedor></titulo>'
+        for i in range(3)
+    ) + '<titulo><numero>DUP</numero><protocolo>VAL00001</protocolo><valor>10</valor>' \
+        '<devedor><nome>Devedor</nome><documento>52998224725</documento></devedor></titulo>'
+    conteudo = f'<remessa>{titulos}{invalidos}</remessa>'.encode('utf-8')
+    remessas_antes, titulos_antes = Remessa.query.count(), Titulo.query.count()
+    
+    response = client.post('/api/remessas/upload', headers=headers, content_type='multipart/form-data',
+                           data={'file': (BytesIO(conteudo), 'remessa.xml'), 'uf': 'SP', 'tipo': 'Remessa',
+                                 'validate_only': 'true'})
+    assert response.status_code == 200
+    resumo = json.loads(response.data)
+    assert resumo['valido'] is False
+    assert (resumo['registros'], resumo['erros']) == (24, 4)
+    assert {tipo['mensagem']: tipo['quantidade'] for tipo in resumo['ocorrencias_por_tipo']} == {
+        'valor inválido': 3, 'protocolo repetido no arquivo': 1}
+    assert Remessa.query.count() == remessas_antes
+    assert Titulo.query.count() == titulos_antes
+    
+    url = f"/api/remessas/validacoes/{resumo['validacao_id']}"
+    pagina = json.loads(client.get(f'{url}?per_page=3', headers=headers).data)
+    assert (pagina['total'], pagina['pages'], pagina['next_page']) == (4, 2, 2)
+    assert [item['referencia'] for item in pagina['items']] == ['INV0', 'INV1', 'INV2']
+    pagina = json.loads(client.get(f'{url}?per_page=3&page=2', headers=headers).data)
+    assert pagina['items'][0]['posicao'] == 24
+
+
+def test_upload_desistencia_pelo_endpoint_de_remessas(client, init_database, auth_headers):
+    """Testa que um upload do tipo Desistência em /upload enfileira a ingestão de desistências"""
+    from io import BytesIO
+    from app.models import Task
+    
+    conteudo = b'<desistencias><desistencia><protocolo>DES00001</protocolo></desistencia></desistencias>'
+    response = client.post('/api/remessas/upload', headers=auth_headers(1), content_type='multipart/form-data',
+                           data={'file': (BytesIO(conteudo), 'desistencias.xml'), 'uf': 'SP',
+                                 'tipo': 'Desistência'})
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['remessa']['tipo'] == 'Desistência'
+    
+    task = db.session.get(Task, db.session.get(Remessa, data['id']).task_id)
+    assert task.funcao.endswith(':processar_desistencia')
+    assert task.descricao == f"Processamento da desistência {data['id']}"
+
+
+def test_upload_remessas_em_lote(client, init_database, auth_headers):
+    """Testa o upload de vários arquivos em uma requisição, processados como um grupo de tarefas"""
+    from io import BytesIO
+    from app.models import Task
+    
+    headers = auth_headers(1)
+    
+    def xml(prefixo):
+        return ('<remessa>' + ''.join(
+            f'<titulo><numero>{prefixo}{i}</numero><valor>10</valor><devedor><nome>Devedor</nome>'
+            f'<documento>52998224725</documento></devedor></titulo>' for i in range(3)
+        ) + '</remessa>').encode('utf-8')
+    
+    def enviar(*arquivos):
+        return client.post('/api/remessas/upload/lote', headers=headers, content_type='multipart/form-data',
+                           data={'files': [(BytesIO(conteudo), nome) for nome, conteudo in arquivos],
+                                 'uf': 'SP', 'tipo': 'Remessa'})
+    
+    # Um arquivo inválido recusa o lote inteiro
+    response = enviar(('a.xml', xml('A')), ('b.pdf', b'pdf'))
+    assert response.status_code == 415
+    assert json.loads(response.data)['arquivos'] == ['b.pdf']
+    assert Remessa.query.filter_by(nome_arquivo='a.xml').count() == 0
+    
+    # Arquivo repetido no próprio lote é gravado uma única vez
+    response = enviar(('a.xml', xml('A')), ('b.xml', xml('B')), ('c.xml', xml('C')), ('a2.xml', xml('A')))
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert [r['nome_arquivo'] for r in data['remessas']] == ['a.xml', 'b.xml', 'c.xml']
+    assert data['duplicados'] == [{'nome_arquivo': 'a2.xml', 'id': data['remessas'][0]['id'],
+                                   'task_id': data['remessas'][0]['task_id']}]
+    
+    tasks = Task.query.filter_by(grupo=data['group_id']).all()
+    assert {task.id for task in tasks} == {r['task_id'] for r in data['remessas']}
+    
+    response = client.get(f"/api/remessas/tasks/groups/{data['group_id']}", headers=headers)
+    assert response.status_code == 200
+    grupo = json.loads(response.data)['group']
+    assert grupo['total'] == 3
+    assert len(grupo['tasks']) == 3
+    assert 0 <= grupo['progress'] <= 100
+    
+    # Reenvio do lote não cria novas remessas
+    response = enviar(('b.xml', xml('B')), ('c.xml', xml('C')))
+    assert response.status_code == 200
+    assert json.loads(response.data)['group_id'] is None
+    assert client.get('/api/remessas/tasks/groups/group_inexistente', headers=headers).status_code == 404
+
+
+def test_reenvio_escopo_usuario_uf_e_status_falha(app, init_database):
+    """Testa que o reenvio é reconhecido apenas para o mesmo usuário e UF, ignorando registros com falha"""
+    from app.models import User, Desistencia
+    from app.utils.uploads import buscar_reenvio
+    
+    outro = User(username='outro', email='outro@example.com', password='password123', nome_completo='Outro')
+    db.session.add(outro)
+    db.session.flush()
+    remessa = Remessa(nome_arquivo='r.xml', status='Processado', uf='SP', tipo='Remessa', usuario_id=1,
+                      hash_arquivo='h1')
+    rejeitada = Desistencia(motivo='Teste', status='Rejeitada', usuario_id=1, hash_arquivo='h2')
+    db.session.add_all([remessa, rejeitada])
+    db.session.commit()
+    
+    assert buscar_reenvio(Remessa, 'h1', 1, tipo='Remessa', uf='SP') is remessa
+    assert buscar_reenvio(Remessa, 'h1', 1, tipo='Remessa', uf='RJ') is None
+    assert buscar_reenvio(Remessa, 'h1', outro.id, tipo='Remessa', uf='SP') is None
+    
+    # Desistências não usam o status 'Erro': a rejeitada permite o reenvio
+    assert buscar_reenvio(Desistencia, 'h2', 1, status_falha='Rejeitada') is None
+    rejeitada.status = 'Pendente'
+    db.session.commit()
+    assert buscar_reenvio(Desistencia, 'h2', 1, status_falha='Rejeitada') is rejeitada
+
+def test_processar_remessa_compactada(app, init_database, tmp_path):
+    """Testa a ingestão de remessas enviadas como .xml.gz e .zip com vários XMLs"""
+    import gzip
+    import zipfile
+    from app.models import Titulo
+    from app.remessas.routes import processar_remessa, allowed_file
+    
+    assert allowed_file('remessa.xml.gz') and allowed_file('remessas.zip')
+    assert not allowed_file('remessa.txt.gz')
+    
+    def xml(prefixo, quantidade):
+        return ('<remessa>' + ''.join(
+            f'<titulo><numero>{prefixo}{i}</numero><valor>10</valor><devedor><nome>Devedor</nome>'
+            f'<documento>52998224725</documento></devedor></titulo>' for i in range(quantidade)
+        ) + '</remessa>').encode('utf-8')
+    
+    arquivo_gz = tmp_path / 'remessa.xml.gz'
+    arquivo_gz.write_bytes(gzip.compress(xml('GZ', 5)))
+    arquivo_zip = tmp_path / 'remessas.zip'
+    with zipfile.ZipFile(arquivo_zip, 'w', zipfile.ZIP_DEFLATED) as compactado:
+        compactado.writestr('cartorio1.xml', xml('ZA', 3))
+        compactado.writestr('leiame.pdf', b'ignorado')
+        compactado.writestr('cartorio2.xml', xml('ZB', 4))
+    
+    remessas_criadas = []
+    for arquivo in (arquivo_gz, arquivo_zip):
+        remessa = Remessa(nome_arquivo=arquivo.name, status='Pendente', uf='SP', tipo='Remessa', usuario_id=1)
+        db.session.add(remessa)
+        db.session.commit()
+        remessas_criadas.append(remessa)
+        processar_remessa(remessa.id, str(arquivo))
+    
+    assert [r.quantidade_titulos for r in remessas_criadas] == [5, 7]
+    numeros = {t.numero for t in Titulo.query.filter_by(remessa_id=remessas_criadas[1].id)}
+    assert numeros == {'ZA0', 'ZA1', 'ZA2', 'ZB0', 'ZB1', 'ZB2', 'ZB3'}
+    
+    # Arquivo compactado corrompido termina em erro de processamento
+    corrompido = tmp_path / 'corrompido.xml.gz'
+    corrompido.write_bytes(gzip.compress(xml('C', 50))[:60])
+    remessa = Remessa(nome_arquivo='corrompido.xml.gz', status='Pendente', uf='SP', tipo='Remessa', usuario_id=1)
+    db.session.add(remessa)
+    db.session.commit()
+    with pytest.raises(ValueError):
+        processar_remessa(remessa.id, str(corrompido))
+    assert remessa.status == 'Erro'
+
+def test_arquivo_retorno_em_fluxo(app, client, init_database, auth_headers):
+    """Testa a geração em fluxo dos arquivos de confirmação e de retorno (largura fixa, latin-1)"""
+    from datetime import date
+    from app.models import Titulo
+    from app.remessas.arquivo_retorno import LEIAUTES, TAMANHO_REGISTRO
+    from app.utils.largura_fixa import LeitorLarguraFixa
+    
+    headers = auth_headers(1)
+    for i, status in enumerate(['Protestado', 'Pago', 'Pendente', 'Protestado', 'Cancelado']):
+        db.session.add(Titulo(numero=f'RET{i}', protocolo=f'RETORNO{i}', valor=10.25 * (i + 1), status=status,
+                              remessa_id=1, credor_id=1, devedor_id=1, nosso_numero='NOSSO',
+                              data_protesto=date(2024, 3, i + 1) if status == 'Protestado' else None))
+    db.session.commit()
+    app.config['RETORNO_CHUNK_SIZE'] = 2
+    
+    def baixar(tipo):
+        response = client.get(f'/api/remessas/1/arquivo/{tipo}', headers=headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'application/octet-stream'
+        assert 'attachment' in response.headers['Content-Disposition']
+        registros = {}
+        for bloco in LeitorLarguraFixa(LEIAUTES).ler(io.BytesIO(response.data)):
+            assert not bloco.erros
+            assert set(bloco.comprimentos.tolist()) == {TAMANHO_REGISTRO}
+            registros.setdefault(bloco.tipo, []).extend(campos for _, campos in bloco)
+        return registros
+    
+    # Confirmação: todos os títulos da remessa (o de init_database e os 5 acima)
+    confirmacao = baixar('confirmacao')
+    assert confirmacao['0'][0]['tipo_arquivo'] == 'CONFIRMAÇÃO'
+    assert confirmacao['0'][0]['quantidade_registros'] == 6
+    assert [t['sequencia_registro'] for t in confirmacao['1']] == list(range(2, 8))
+    assert confirmacao['9'][0]['sequencia_registro'] == 8
+    
+    # Retorno: só os títulos com situação final, com a data da ocorrência
+    retorno = baixar('retorno')
+    transacoes = {t['protocolo']: t for t in retorno['1']}
+    assert list(transacoes) == ['RETORNO0', 'RETORNO1', 'RETORNO3', 'RETORNO4']
+    assert transacoes['RETORNO3']['valor'] == 41.0
+    assert transacoes['RETORNO3']['nome_devedor'] == 'Devedor Teste'
+    assert transacoes['RETORNO3']['data_ocorrencia'] == date(2024, 3, 4)
+    assert transacoes['RETORNO1']['data_ocorrencia'] is not None
+    assert retorno['9'][0] == {'quantidade_registros': 4, 'soma_valores': 123.0, 'sequencia_registro': 6}
+    
+    assert client.get('/api/remessas/1/arquivo/outro', headers=headers).status_code == 400
+    assert client.get('/api/remessas/999/arquivo/retorno', headers=headers).status_code == 404
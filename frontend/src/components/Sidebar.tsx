@@ -60,8 +60,8 @@ export function Sidebar() {
     setMinimized(!minimized);
   };
   
-  const handleLogout = () => {
-    logout();
+  const handleLogout = async () => {
+    await logout();
     navigate("/auth/login");
   };
 
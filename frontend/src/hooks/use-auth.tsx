@@ -18,7 +18,7 @@ interface AuthContextType {
   isAuthenticated: boolean;
   isLoading: boolean;
   login: (email: string, password: string) => Promise<User | null>; // Retorna o usuário ou null
-  logout: () => void;
+  logout: () => Promise<void>;
   checkSession: () => Promise<boolean>;
 }
 
@@ -76,6 +76,9 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       if (response.status === 200 && response.data && response.data.user) {
         const userData: User = response.data.user;
         localStorage.setItem("userCredentials", `${email}:${password}`); // Armazena as credenciais para o interceptor
+        if (response.data.access_token) {
+          localStorage.setItem("accessToken", response.data.access_token); // Token assinado, preferido pelo interceptor
+        }
         localStorage.setItem("userData", JSON.stringify(userData));
         setUser(userData);
         setIsLoading(false);
@@ -98,7 +101,20 @@ export function AuthProvider({ children }: { children: ReactNode }) {
   };
 
   // Função de logout
-  const logout = () => {
+  const logout = async () => {
+    // Revoga o token de acesso no servidor antes de esquecê-lo; sem isso ele continuaria válido até expirar
+    const accessToken = localStorage.getItem("accessToken");
+    if (accessToken) {
+      try {
+        await axiosApiInstance.post("/api/auth/logout", null, {
+          headers: { Authorization: `Bearer ${accessToken}` }
+        });
+      } catch (error) {
+        // Token já expirado/revogado ou servidor indisponível: o estado local é limpo mesmo assim
+        console.error("Erro ao revogar o token de acesso no logout:", error);
+      }
+    }
+    localStorage.removeItem("accessToken");
     localStorage.removeItem("userCredentials");
     localStorage.removeItem("userData");
     setUser(null);
@@ -27,10 +27,14 @@ export const api = axios.create({
   withCredentials: false
 });
 
-// Interceptor para adicionar o header de Basic Auth em todas as requisições
+// Interceptor para adicionar o header de autenticação em todas as requisições
+// Usa o token de acesso emitido no login; Basic Auth fica como alternativa
 api.interceptors.request.use((config) => {
+  const accessToken = localStorage.getItem("accessToken");
   const userCredentials = localStorage.getItem("userCredentials"); // Formato "username:password"
-  if (userCredentials) {
+  if (accessToken && !config.headers.Authorization) {
+    config.headers.Authorization = `Bearer ${accessToken}`;
+  } else if (userCredentials && !config.headers.Authorization) {
     try {
       const base64Credentials = btoa(userCredentials); // btoa codifica para Base64
       config.headers.Authorization = `Basic ${base64Credentials}`;
@@ -54,6 +58,7 @@ api.interceptors.response.use(
       // Se for erro de não autorizado (401), redirecionar para o login
       // e limpar as credenciais armazenadas, pois podem estar inválidas ou expiradas
       if (error.response.status === 401) {
+        localStorage.removeItem('accessToken');
         localStorage.removeItem('userCredentials'); // Limpar credenciais Basic Auth
         // Adicionar um pequeno delay antes de redirecionar para garantir que o removeItem conclua
         // e para evitar loops de redirecionamento em alguns casos.
@@ -114,6 +119,57 @@ export const remessaService = {
       console.error(`Erro ao obter remessa ${id}:`, error);
       throw error;
     }
+  },
+
+  // Acompanhar o progresso de tarefas via Server-Sent Events (substitui o polling)
+  // Retorna uma função para encerrar a conexão
+  acompanharTarefas: (taskIds: string[], onUpdate: (task: any) => void, onEnd?: () => void) => {
+    let source: EventSource | null = null;
+    let ultimoEventoId = '';
+    let encerrado = false;
+
+    const conectar = async () => {
+      // EventSource não permite definir headers: a URL leva um token de curta duração,
+      // válido só para o stream (o token de acesso nunca vai na URL)
+      const params = new URLSearchParams({ ids: taskIds.join(',') });
+      try {
+        const response = await api.post('/api/remessas/tasks/stream/token');
+        params.set('stream_token', response.data.stream_token);
+      } catch (error) {
+        console.error("Erro ao obter token para o stream de tarefas:", error);
+        return;
+      }
+      if (ultimoEventoId) {
+        params.set('last_event_id', ultimoEventoId);
+      }
+      if (encerrado) {
+        return;
+      }
+
+      // O navegador reconecta sozinho (enviando o Last-Event-ID) enquanto o token vale
+      source = new EventSource(`${API_URL}/api/remessas/tasks/stream?${params.toString()}`);
+      source.addEventListener('task', (event) => {
+        ultimoEventoId = (event as MessageEvent).lastEventId || ultimoEventoId;
+        onUpdate(JSON.parse((event as MessageEvent).data));
+      });
+      source.addEventListener('end', () => {
+        encerrado = true;
+        source?.close();
+        onEnd?.();
+      });
+      source.addEventListener('error', () => {
+        // Token expirado na reconexão: o navegador desiste; nova conexão com outro token
+        if (source?.readyState === EventSource.CLOSED && !encerrado) {
+          setTimeout(conectar, 3000);
+        }
+      });
+    };
+
+    conectar();
+    return () => {
+      encerrado = true;
+      source?.close();
+    };
   }
 };
 